@@ -0,0 +1,88 @@
+"""
+Package: benchmarks
+Filename: opportunity_parsing.py
+Author(s): Grant W
+
+Description: Per-opportunity parse cost of Opportunity.cells as a plain
+union (tried member by member) vs. the `kind` discriminated union.
+
+Run from the repository root:
+    python -m benchmarks.opportunity_parsing [--cells 300] [--number 200]
+"""
+# Python Imports
+import argparse
+import copy
+import json
+import os
+import timeit
+from typing import List, Union
+
+# Third Party Imports
+import pydantic
+
+# Local Imports
+from dynata_rex import models
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                        'tests', 'data')
+
+
+class PlainUnionOpportunity(models.Opportunity):
+    """Opportunity as it was before `kind` became a discriminator"""
+    cells: List[Union[models.RangeCell,
+                      models.ListCell,
+                      models.ValueCell,
+                      models.CollectionCell]]
+
+
+def load_fixtures() -> List[dict]:
+    with open(os.path.join(DATA_DIR, 'test_receive_notifications.json')) as f:
+        return json.load(f)
+
+
+def widen(opportunity: dict, cell_count: int) -> dict:
+    """Copy an opportunity, repeating its cells up to cell_count cells"""
+    out = copy.deepcopy(opportunity)
+    cells = opportunity['cells']
+    out['cells'] = []
+    for i in range(cell_count):
+        cell = dict(cells[i % len(cells)], tag=f"cell-{i}")
+        out['cells'].append(cell)
+    return out
+
+
+def per_opportunity_us(model, payload: bytes, count: int,
+                       number: int) -> float:
+    adapter = pydantic.TypeAdapter(List[model])
+    seconds = min(timeit.repeat(lambda: adapter.validate_json(payload),
+                                number=number, repeat=5))
+    return seconds / number / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cells', type=int, default=300,
+                        help='cells per opportunity in the wide batch')
+    parser.add_argument('--number', type=int, default=200,
+                        help='batches parsed per timing run')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    batches = {
+        'fixtures': fixtures,
+        f'{args.cells} cells': [widen(o, args.cells) for o in fixtures],
+    }
+    print(f"{'batch':<12}{'plain union':>16}{'discriminated':>16}"
+          f"{'speedup':>10}")
+    for name, batch in batches.items():
+        payload = json.dumps(batch).encode('utf-8')
+        before = per_opportunity_us(PlainUnionOpportunity, payload,
+                                    len(batch), args.number)
+        after = per_opportunity_us(models.Opportunity, payload,
+                                   len(batch), args.number)
+        print(f"{name:<12}{before:>13.1f} us{after:>13.1f} us"
+              f"{before / after:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,20 +12,48 @@ Description: Expose the main classes of the package.
 # Local Imports
 from .opportunity_registry import OpportunityRegistry
 from .respondent_gateway import RespondentGateway
+from .aio import AsyncOpportunityRegistry, AsyncRespondentGateway
 from .exceptions import (
     RexClientException,
     RexServiceException,
     InvalidShardException,
     HttpTimeoutException,
-    InvalidCredentialsException
+    InvalidCredentialsException,
+    CircuitOpenException
+)
+from .circuit_breaker import CircuitBreaker, CircuitStateEnum
+from .adaptive_limit import AdaptiveLimit
+from .ack_buffer import AckBuffer
+from .compaction import Compactor
+from .runner import ShardRunner
+from .store import OpportunityStore
+from .leases import (
+    ShardCoordinator,
+    LeasedConsumer,
+    SqliteLeaseBackend,
+    FileLeaseBackend
 )
 
 __all__ = [
     'RespondentGateway',
     'OpportunityRegistry',
+    'AsyncRespondentGateway',
+    'AsyncOpportunityRegistry',
     'RexClientException',
     'RexServiceException',
     'InvalidShardException',
     'HttpTimeoutException',
-    'InvalidCredentialsException'
+    'InvalidCredentialsException',
+    'CircuitOpenException',
+    'CircuitBreaker',
+    'CircuitStateEnum',
+    'AdaptiveLimit',
+    'AckBuffer',
+    'Compactor',
+    'ShardRunner',
+    'ShardCoordinator',
+    'LeasedConsumer',
+    'SqliteLeaseBackend',
+    'FileLeaseBackend',
+    'OpportunityStore'
 ]
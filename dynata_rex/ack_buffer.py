@@ -0,0 +1,129 @@
+"""
+Package: dynata_rex
+Filename: ack_buffer.py
+Author(s): Grant W
+
+Description: Buffer batching acknowledgements into fewer requests
+"""
+# Python Imports
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Union
+
+# Third Party Imports
+
+# Local Imports
+from .logs import logger
+
+
+class AckBuffer:
+    """
+    Collects ids to acknowledge across batches and sends them with one
+    `ack` call per flush instead of one request per id.
+
+    The buffer is flushed once it holds `max_size` ids, `max_delay` seconds
+    after the first id was added to an empty buffer, and on close().
+
+    @ack: callable(ids) acknowledging a list of ids, ie
+        registry.ack_notifications
+    @max_size: ids that trigger a flush, and the most sent per request
+    @max_delay: seconds an id may wait before being flushed, None to only
+        flush on size and close()
+
+    >>> with AckBuffer(registry.ack_notifications) as acks:
+    ...     acks.add(opportunity.id)
+    """
+
+    def __init__(self,
+                 ack: Callable[[List[Any]], Any],
+                 max_size: int = 100,
+                 max_delay: Optional[float] = 1.0):
+        self.ack = ack
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.stats = {'added': 0, 'flushes': 0, 'acked': 0, 'errors': 0}
+        # dict keeps insertion order and drops repeated ids
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, ids: Union[Any, Iterable[Any]]) -> None:
+        """Queue an id, or a list of ids, to be acknowledged"""
+        if not isinstance(ids, (list, tuple, set)):
+            ids = [ids]
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('AckBuffer is closed')
+            for item_id in ids:
+                self._pending[item_id] = None
+            self.stats['added'] += len(ids)
+            full = len(self._pending) >= self.max_size
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    __call__ = add
+
+    def _schedule(self) -> None:
+        """Start the max_delay timer if ids are waiting, holding _lock"""
+        if self._pending and self._timer is None and \
+                self.max_delay is not None:
+            self._timer = threading.Timer(self.max_delay,
+                                          self._flush_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> int:
+        """Send every pending id, returns the number acknowledged.
+
+        Ids from a failed request are put back to be retried by the next
+        flush and the error is raised.
+        """
+        acked = 0
+        with self._flush_lock:
+            with self._lock:
+                pending = list(self._pending)
+                self._pending.clear()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            for start in range(0, len(pending), self.max_size):
+                chunk = pending[start:start + self.max_size]
+                try:
+                    self.ack(chunk)
+                except Exception:
+                    self.stats['errors'] += 1
+                    with self._lock:
+                        retry = dict.fromkeys(pending[start:])
+                        retry.update(self._pending)
+                        self._pending = retry
+                        if not self._closed:
+                            self._schedule()
+                    raise
+                self.stats['flushes'] += 1
+                acked += len(chunk)
+                self.stats['acked'] += len(chunk)
+        return acked
+
+    def _flush_on_timer(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Error flushing acknowledgements')
+
+    def close(self) -> None:
+        """Flush what is pending and stop accepting ids"""
+        with self._lock:
+            self._closed = True
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
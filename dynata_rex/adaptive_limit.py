@@ -0,0 +1,99 @@
+"""
+Package: dynata_rex
+Filename: adaptive_limit.py
+Author(s): Grant W
+
+Description: AIMD controller for the batch size of registry polls
+"""
+# Python Imports
+import math
+import threading
+from typing import Callable, Optional
+
+# Third Party Imports
+
+# Local Imports
+
+
+class AdaptiveLimit:
+    """
+    Grows or shrinks the `limit` sent with each poll.
+
+    Additive increase, multiplicative decrease: every full batch that came
+    back quickly raises the limit by `step`, while a slow poll or a batch
+    the handler took too long over cuts it by `decrease`. Partially filled
+    and empty batches leave it as is, the backlog is drained either way.
+
+    @initial: limit to start from
+    @minimum: smallest limit
+    @maximum: largest limit
+    @step: added to the limit after a full batch
+    @decrease: factor the limit is multiplied by after a slow poll or batch
+    @target_latency: seconds a poll may take before the limit is cut, None
+        to ignore latency
+    @target_handle_time: seconds the handler may spend on a batch before
+        the limit is cut, None to ignore handling time
+    @on_update: stats hook, called with a dict of the limit, the previous
+        limit, the reason and the measurement after every change
+    """
+
+    def __init__(self,
+                 initial: int = 10,
+                 minimum: int = 1,
+                 maximum: int = 500,
+                 step: int = 10,
+                 decrease: float = 0.5,
+                 target_latency: Optional[float] = 5.0,
+                 target_handle_time: Optional[float] = 5.0,
+                 on_update: Optional[Callable[[dict], None]] = None):
+        if not minimum <= initial <= maximum:
+            raise ValueError('initial must be between minimum and maximum')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.target_handle_time = target_handle_time
+        self.on_update = on_update
+        self._limit = initial
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        """Limit to use for the next poll"""
+        return self._limit
+
+    def _set(self, limit: int, reason: str, **measurement) -> int:
+        limit = max(self.minimum, min(self.maximum, limit))
+        with self._lock:
+            previous, self._limit = self._limit, limit
+        if limit != previous and self.on_update is not None:
+            self.on_update(dict(limit=limit,
+                                previous=previous,
+                                reason=reason,
+                                **measurement))
+        return limit
+
+    def _cut(self, limit: int) -> int:
+        return math.floor(limit * self.decrease)
+
+    def record_poll(self, limit: int, received: int, latency: float) -> int:
+        """Record a poll made with `limit` that returned `received` items
+        after `latency` seconds, returns the new limit"""
+        if self.target_latency is not None and \
+                latency > self.target_latency:
+            return self._set(self._cut(limit), 'latency',
+                             received=received, latency=latency)
+        if received >= limit:
+            return self._set(max(self._limit, limit + self.step), 'full',
+                             received=received, latency=latency)
+        return self._limit
+
+    def record_handled(self, size: int, handle_time: float) -> int:
+        """Record the handler taking `handle_time` seconds over a batch of
+        `size` items, returns the new limit"""
+        if self.target_handle_time is not None and \
+                handle_time > self.target_handle_time:
+            return self._set(min(self._limit, self._cut(size)), 'handler',
+                             received=size, handle_time=handle_time)
+        return self._limit
@@ -0,0 +1,24 @@
+"""
+Package: dynata_rex.aio
+Filename: __init__.py
+Author(s): Grant W
+
+Description: asyncio clients for REX. Requires the optional `aiohttp`
+dependency (`pip install dynata_rex[async]`).
+"""
+# Python Imports
+
+# Third Party Imports
+
+# Local Imports
+from .signer import AsyncRexRequest
+from .opportunity_registry import AsyncOpportunityRegistry
+from .respondent_gateway import AsyncRespondentGateway
+from .helpers import make_async_session
+
+__all__ = [
+    'AsyncRexRequest',
+    'AsyncOpportunityRegistry',
+    'AsyncRespondentGateway',
+    'make_async_session'
+]
@@ -0,0 +1,66 @@
+"""
+Package: dynata_rex.aio
+Filename: helpers.py
+Author(s): Grant W
+
+Description: General helpers for the asyncio clients
+"""
+# Python Imports
+import asyncio
+import random
+from typing import AsyncIterable, AsyncIterator
+
+# Third Party Imports
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+# Local Imports
+from ..exceptions import RexClientException
+from ..helpers import DEFAULT_TIMEOUT, USER_AGENT
+
+DEFAULT_POOL_LIMIT = 100
+DEFAULT_POOL_LIMIT_PER_HOST = 0
+DEFAULT_KEEPALIVE_TIMEOUT = 15
+
+
+async def wait(try_number: int, interval: float = None) -> None:
+    """Non-blocking equivalent of TimeoutHTTPAdapter._wait"""
+    if interval is None:
+        interval = (2 ** try_number) + (random.randint(0, 1000) / 1000)
+    await asyncio.sleep(interval)
+
+
+def make_async_session(request_timeout=DEFAULT_TIMEOUT,
+                       pool_limit: int = DEFAULT_POOL_LIMIT,
+                       pool_limit_per_host: int = DEFAULT_POOL_LIMIT_PER_HOST,
+                       keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT):
+    """Make an aiohttp session backed by a pooled keep-alive connector.
+
+    Must be called from within a running event loop.
+    """
+    if aiohttp is None:
+        raise RexClientException(
+            "aiohttp is required for the asyncio clients, install it with "
+            "`pip install dynata_rex[async]`")
+    connector = aiohttp.TCPConnector(limit=pool_limit,
+                                     limit_per_host=pool_limit_per_host,
+                                     keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=request_timeout),
+        headers={"User-Agent": USER_AGENT}
+    )
+
+
+async def aiter_lines(chunks: AsyncIterable[bytes],
+                      encoding: str = 'utf-8') -> AsyncIterator[str]:
+    """asyncio equivalent of helpers.iter_lines"""
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode(encoding)
+    yield pending.decode(encoding)
@@ -0,0 +1,178 @@
+"""
+Package: dynata_rex.aio
+Filename: opportunity_registry.py
+Author(s): Grant W
+
+Description: asyncio API interaction for the Opportunity Registry
+"""
+# Python Imports
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, List, Union
+
+# Third Party Imports
+
+# Local Imports
+import dynata_rex.models as models
+from ..opportunity_registry import BaseOpportunityRegistry
+from ..helpers import DEFAULT_CHUNK_SIZE
+from .signer import AsyncRexRequest
+from .helpers import aiter_lines
+
+
+class AsyncOpportunityRegistry(BaseOpportunityRegistry):
+    """
+    asyncio client for the Opportunity Registry.
+
+    Shares endpoints and models with OpportunityRegistry; every method that
+    calls the registry returns an awaitable. The threaded helpers (consume,
+    AckBuffer, collection caches) are only on OpportunityRegistry.
+
+    >>> async with AsyncOpportunityRegistry(key, secret) as registry:
+    ...     opportunities = await registry.receive_notifications()
+    """
+    _requester_class = AsyncRexRequest
+
+    async def list_opportunities(self,
+                                 limit: int = 10
+                                 ) -> List[models.Opportunity]:
+        """
+        [Deprecated - please use receive_notifications()]
+        Get opportunities from Opportunity Registry"""
+        opportunities = await self._list_opportunities(limit=limit)
+        out, invalid = self._parse_opportunities(opportunities)
+        for opportunity_id in invalid:
+            # Ack opportunity so we don't see it again
+            await self.ack_opportunity(opportunity_id)
+
+        return out
+
+    async def receive_notifications(self,
+                                    limit: int = 10,
+                                    lazy: bool = False
+                                    ) -> List[models.Opportunity]:
+        """Get opportunity notifications from Opportunity Registry
+
+        @lazy: return LazyOpportunity objects, deferring validation of
+            filters, cells and quotas until they are accessed
+        """
+        raw = await self._receive_notifications_raw(limit=limit)
+        out, invalid = self._parse_opportunities_json(raw, lazy=lazy)
+        if invalid:
+            # Ack notifications so we don't see them again
+            await self.ack_notifications(invalid)
+        return out
+
+    async def get_opportunity(self,
+                              opportunity_id: int) -> models.Opportunity:
+        """Get specific opportunity from SMOR
+        """
+        opportunity = await self._get_opportunity(opportunity_id)
+        return models.Opportunity(**opportunity)
+
+    async def download_collection(self, collection_id: str) -> list:
+        """Download targeting from a collection cell"""
+        return [line async for line in self.iter_collection(collection_id)]
+
+    def iter_collection_chunks(self,
+                               collection_id: str,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE
+                               ) -> AsyncIterator[bytes]:
+        """Stream the raw bytes of a collection as they are received"""
+        endpoint = f"{self.base_url}/download-collection"
+        data = {"id": str(collection_id)}
+        return self.make_request.stream(endpoint, data, chunk_size=chunk_size)
+
+    def iter_collection(self,
+                        collection_id: str,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE
+                        ) -> AsyncIterator[str]:
+        """Stream the lines of a collection without holding the whole
+        download in memory"""
+        return aiter_lines(self.iter_collection_chunks(collection_id,
+                                                       chunk_size))
+
+    async def download_collection_to_file(self,
+                                          collection_id: str,
+                                          destination: Union[str, BinaryIO],
+                                          chunk_size: int = DEFAULT_CHUNK_SIZE
+                                          ) -> int:
+        """Spool a collection to a path or binary file object, returns the
+        number of bytes written"""
+        return await self._aspool(
+            self.iter_collection_chunks(collection_id, chunk_size),
+            destination)
+
+    @staticmethod
+    async def _aspool(chunks: AsyncIterator[bytes],
+                      destination: Union[str, BinaryIO]) -> int:
+        """asyncio equivalent of OpportunityRegistry._spool"""
+        if not isinstance(destination, (str, os.PathLike)):
+            written = 0
+            async for chunk in chunks:
+                written += destination.write(chunk)
+            return written
+
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                written = await AsyncOpportunityRegistry._aspool(chunks, f)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return written
+
+    async def receive_invites(self, limit: int = 10) -> List[models.Invite]:
+        """Receive invites from opportunity registry"""
+        raw = await self._receive_invites_raw(limit=limit)
+        out, invalid = self._parse_invites_json(raw)
+        if invalid:
+            # Ack invites so we don't see them again
+            await self.ack_invites(invalid)
+        return out
+
+    async def download_invite_collection(self, invite_id: str) -> list:
+        """Download invite collection from opportunity registry"""
+        return [line async for line in self.iter_invite_collection(invite_id)]
+
+    def iter_invite_collection_chunks(self,
+                                      invite_id: str,
+                                      chunk_size: int = DEFAULT_CHUNK_SIZE
+                                      ) -> AsyncIterator[bytes]:
+        """Stream the raw bytes of an invite collection as they are
+        received"""
+        endpoint = f"{self.base_url}/download-invite-collection"
+        data = {"id": invite_id}
+        return self.make_request.stream(endpoint, data, chunk_size=chunk_size)
+
+    def iter_invite_collection(self,
+                               invite_id: str,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE
+                               ) -> AsyncIterator[str]:
+        """Stream the lines of an invite collection without holding the
+        whole download in memory"""
+        return aiter_lines(self.iter_invite_collection_chunks(invite_id,
+                                                              chunk_size))
+
+    async def download_invite_collection_to_file(
+            self,
+            invite_id: str,
+            destination: Union[str, BinaryIO],
+            chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Spool an invite collection to a path or binary file object,
+        returns the number of bytes written"""
+        return await self._aspool(
+            self.iter_invite_collection_chunks(invite_id, chunk_size),
+            destination)
+
+    async def close(self) -> None:
+        """Close the underlying http session"""
+        await self.make_request.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
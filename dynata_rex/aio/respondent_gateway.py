@@ -0,0 +1,60 @@
+"""
+Package: dynata_rex.aio
+Filename: respondent_gateway.py
+Author(s): Grant W
+
+Description: asyncio Respondent Gateway interactions
+"""
+# Python Imports
+
+# Third Party Imports
+
+# Local Imports
+from ..respondent_gateway import RespondentGateway
+from .signer import AsyncRexRequest
+
+
+class AsyncRespondentGateway(RespondentGateway):
+    """
+    asyncio client for the Respondent Gateway.
+
+    URL signing and verification stay synchronous (no network involved);
+    every method that calls the gateway API returns an awaitable.
+    """
+    _requester_class = AsyncRexRequest
+
+    async def create_context(self, context_id: str, context_data: dict) -> int:
+        """
+        Create a context with the given context_id and context_data
+
+        @context_id: unique identifier for the context
+        @context_data: dictionary of context data
+        """
+        endpoint = f"{self.base_url}/create-context"
+        data = {
+            "id": context_id,
+            "items": context_data
+        }
+        response = await self.make_request.post(endpoint, data)
+        return response['id']
+
+    async def expire_context(self, context_id: str) -> None:
+        """
+        Expire a context with the given context_id and account_id
+
+        @context_id: identifier for the context
+        """
+        endpoint = f"{self.base_url}/expire-context"
+        data = {"id": context_id}
+        res = await self.make_request.post(endpoint, data)
+        return res if res else None
+
+    async def close(self) -> None:
+        """Close the underlying http session"""
+        await self.make_request.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,203 @@
+"""
+Package: dynata_rex.aio
+Filename: signer.py
+Author(s): Grant W
+
+Description: asyncio counterpart of RexRequest
+"""
+# Python Imports
+import asyncio
+from typing import AsyncIterator, Union
+
+# Third Party Imports
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+# Local Imports
+from ..signer import RexRequest, Signer
+from ..exceptions import HttpTimeoutException, RexServiceException
+from ..retry import RetryPolicy, parse_retry_after
+from ..circuit_breaker import CircuitBreaker
+from ..codec import get_default_codec
+from ..helpers import DEFAULT_CHUNK_SIZE
+from .helpers import make_async_session, wait, DEFAULT_TIMEOUT
+
+
+class AsyncRexRequest(RexRequest):
+    """Non-blocking wrapper for http calls to include our signature.
+
+    The aiohttp session is created lazily on first use so the requester can
+    be built outside of the event loop it will run on. Call `close()` (or use
+    it as an async context manager) to release pooled connections.
+    """
+
+    _HTTP_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+    def __init__(self,
+                 access_key,
+                 secret_key,
+                 default_ttl: int = 10,
+                 request_timeout: int = DEFAULT_TIMEOUT,
+                 session=None,
+                 retry_policy: RetryPolicy = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 codec=None):
+        self.default_ttl = default_ttl
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.signer = Signer(access_key, secret_key)
+        self.request_timeout = request_timeout
+        self.retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy()
+        self.session = session
+        self.circuit_breaker = circuit_breaker
+        self.codec = codec if codec is not None else get_default_codec()
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = make_async_session(self.request_timeout)
+        return self.session
+
+    async def _send(self, method: str, url: str, data, headers: dict,
+                    timeout=None):
+        """Perform a single http call, returns
+        (status_code, content, response_headers)"""
+        session = self._get_session()
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        async with session.request(method, url, data=data,
+                                   headers=headers, **kwargs) as res:
+            return res.status, await res.read(), res.headers
+
+    async def _send_with_retries(self, method, url, data, additional_headers):
+        policy = self.retry_policy
+        state = policy.start()
+        while True:
+            timeout = state.attempt_timeout(self.request_timeout)
+            # Fresh expiration + signature for every attempt
+            headers = self._create_auth_headers(
+                additional_headers,
+                body=data,
+                ttl=self._ttl_for_deadline(state.remaining()))
+            try:
+                status_code, content, res_headers = await self._send(
+                    method, url, data, headers, timeout=timeout)
+            except asyncio.TimeoutError as e:
+                delay = state.next_delay(policy.timeout_class)
+                if delay is None:
+                    raise HttpTimeoutException(e)
+            except aiohttp.ClientConnectionError as e:
+                delay = state.next_delay(policy.connection_class)
+                if delay is None:
+                    raise RexServiceException from e
+            else:
+                retry_class = policy.classify_status(status_code)
+                if retry_class is None:
+                    return status_code, content
+                retry_after = parse_retry_after(res_headers.get('Retry-After'))
+                delay = state.next_delay(retry_class, retry_after)
+                if delay is None:
+                    return status_code, content
+            await wait(state.attempt, delay)
+
+    async def dispatch(self,
+                       url,
+                       data='',
+                       method='GET',
+                       raw: bool = False) -> Union[dict, str, bytes]:
+
+        additional_headers = {}
+        if data:
+            additional_headers = {'Content-type': 'application/json'}
+            # Serialized once; the same buffer is signed and sent
+            data = self.codec.dumps(data)
+
+        if method.upper() not in self._HTTP_METHODS:
+            raise AttributeError('Invalid http method provided.')
+
+        call = self._before_call(url)
+        try:
+            status_code, content = await self._send_with_retries(
+                method.upper(), url, data, additional_headers)
+        except Exception:
+            self._after_call(url, call, failed=True)
+            raise
+        self._after_call(url, call,
+                         failed=CircuitBreaker.is_failure_status(status_code))
+        if raw:
+            self._raise_for_status(status_code, content, data)
+            return content
+        return self._parse_response(status_code, content, data)
+
+    async def stream(self,
+                     url,
+                     data='',
+                     method='POST',
+                     chunk_size: int = DEFAULT_CHUNK_SIZE
+                     ) -> AsyncIterator[bytes]:
+        """Dispatch a request and yield the response body in chunks as it
+        arrives instead of buffering it, for large downloads.
+
+        Unlike dispatch, a failed stream is not retried. request_timeout
+        bounds connecting and each read rather than the whole download, so
+        large bodies are not cut off.
+        """
+        additional_headers = {}
+        if data:
+            additional_headers = {'Content-type': 'application/json'}
+            # Serialized once; the same buffer is signed and sent
+            data = self.codec.dumps(data)
+
+        if method.upper() not in self._HTTP_METHODS:
+            raise AttributeError('Invalid http method provided.')
+
+        headers = self._create_auth_headers(additional_headers, body=data)
+        session = self._get_session()
+        call = self._before_call(url)
+        recorded = False
+        try:
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self.request_timeout,
+                sock_read=self.request_timeout)
+            async with session.request(method.upper(), url, data=data,
+                                       headers=headers,
+                                       timeout=timeout) as res:
+                failed = CircuitBreaker.is_failure_status(res.status)
+                self._after_call(url, call, failed=failed)
+                recorded = True
+                if res.status > 299:
+                    self._raise_for_status(res.status, await res.read(), data)
+                async for chunk in res.content.iter_chunked(chunk_size):
+                    yield chunk
+        except asyncio.TimeoutError as e:
+            if not recorded:
+                self._after_call(url, call, failed=True)
+            raise HttpTimeoutException(e)
+        except aiohttp.ClientError as e:
+            if not recorded:
+                self._after_call(url, call, failed=True)
+            raise RexServiceException from e
+
+    async def get(self, url: str):
+        return await self.dispatch(url)
+
+    async def post(self, url, data):
+        return await self.dispatch(url, data=data, method='POST')
+
+    async def post_raw(self, url, data) -> bytes:
+        """POST and return the undecoded response body"""
+        return await self.dispatch(url, data=data, method='POST', raw=True)
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,346 @@
+"""
+Package: dynata_rex
+Filename: bulk.py
+Author(s): Grant W
+
+Description: Vectorized qualification of a whole panel against opportunities
+"""
+# Python Imports
+from collections import Counter
+from typing import (Container, Dict, FrozenSet, Iterable, Iterator, List,
+                    Mapping, Optional, Sequence, Tuple)
+
+# Third Party Imports
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# Local Imports
+from .exceptions import RexClientException
+from .models import (Cell, CollectionCell, ListCell, Opportunity, RangeCell,
+                     StatusEnum, ValueCell)
+
+DEFAULT_PANEL_CHUNK_SIZE = 100_000
+
+# attribute_id -> column with one answer per panelist. Numeric columns use
+# NaN for a missing answer, string/object columns '' or None: the columnar
+# counterpart of a profile without the attribute in targeting.
+Panel = Mapping[int, Sequence]
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RexClientException('Bulk qualification needs numpy, install '
+                                 'it with `pip install dynata_rex[numpy]`')
+
+
+def _numbers(values) -> list:
+    out = []
+    for value in values:
+        try:
+            out.append(float(value))
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def _value_array(values) -> 'np.ndarray':
+    """Cell values as sorted strings"""
+    return np.array(sorted(str(v) for v in values))
+
+
+def _columns(panel: Panel) -> Dict[int, 'np.ndarray']:
+    """Panel columns as arrays, converted once for every chunk to slice"""
+    return {attribute_id: np.asarray(column)
+            for attribute_id, column in panel.items()}
+
+
+class _Chunk:
+    """A slice of the panel, with per column conversions and cell masks
+    cached so opportunities sharing a cell only compute it once
+
+    @columns: attribute_id -> numpy array of the whole panel, see
+        _columns(); the chunk holds views of them
+    @uses: cell mask key -> number of opportunities to evaluate using it,
+        so release() can drop masks no longer needed; masks are kept for
+        the chunk's lifetime without it
+    """
+
+    def __init__(self, columns: Dict[int, 'np.ndarray'], start: int,
+                 stop: int, uses: Optional[Mapping[tuple, int]] = None):
+        self.size = stop - start
+        self.columns = {attribute_id: column[start:stop]
+                        for attribute_id, column in columns.items()}
+        self._uses = dict(uses) if uses is not None else None
+        self._numeric = {}
+        self._strings = {}
+        self._present = {}
+        self._masks = {}
+
+    def _is_numeric(self, attribute_id: int) -> bool:
+        return self.columns[attribute_id].dtype.kind in 'biuf'
+
+    def numeric(self, attribute_id: int) -> 'np.ndarray':
+        """Column as floats, NaN where missing or not a number"""
+        out = self._numeric.get(attribute_id)
+        if out is None:
+            column = self.columns.get(attribute_id)
+            if column is None:
+                out = np.full(self.size, np.nan)
+            elif self._is_numeric(attribute_id):
+                out = column.astype(float)
+            else:
+                try:
+                    out = column.astype(float)
+                except (TypeError, ValueError):
+                    out = np.array([(_numbers([v]) or [np.nan])[0]
+                                    for v in column])
+            self._numeric[attribute_id] = out
+        return out
+
+    def strings(self, attribute_id: int) -> 'np.ndarray':
+        """Column as str() of each answer, as targeting compares them"""
+        out = self._strings.get(attribute_id)
+        if out is None:
+            out = self._strings[attribute_id] = \
+                self.columns[attribute_id].astype(str)
+        return out
+
+    def present(self, attribute_id: int) -> 'np.ndarray':
+        """Panelists that answered the attribute"""
+        out = self._present.get(attribute_id)
+        if out is None:
+            column = self.columns.get(attribute_id)
+            if column is None:
+                out = np.zeros(self.size, dtype=bool)
+            elif self._is_numeric(attribute_id):
+                out = ~np.isnan(column.astype(float))
+            else:
+                out = (column != '') & (column != None)  # noqa: E711
+            self._present[attribute_id] = out
+        return out
+
+    def mask(self, spec: tuple) -> 'np.ndarray':
+        """Panelists matching a compiled cell"""
+        key, kind, attribute_id, params, negate = spec
+        out = self._masks.get(key)
+        if out is not None:
+            return out
+        if attribute_id not in self.columns:
+            out = np.zeros(self.size, dtype=bool)
+        elif kind == 'range':
+            low, high = params
+            column = self.numeric(attribute_id)
+            with np.errstate(invalid='ignore'):
+                out = np.ones(self.size, dtype=bool)
+                if low is not None:
+                    out &= column >= low
+                if high is not None:
+                    out &= column <= high
+        else:
+            out = np.isin(self.strings(attribute_id), params)
+        if negate:
+            out = ~out
+        out &= self.present(attribute_id)
+        self._masks[key] = out
+        return out
+
+    def release(self, keys: Iterable[tuple]) -> None:
+        """Drop the masks that no opportunity left to evaluate uses, once
+        an opportunity using keys was evaluated"""
+        if self._uses is None:
+            return
+        for key in keys:
+            self._uses[key] -= 1
+            if not self._uses[key]:
+                self._masks.pop(key, None)
+
+
+class BulkTargeting:
+    """
+    An opportunity's targeting compiled for column-wise evaluation over a
+    panel, with the same rules as targeting.CompiledTargeting: filter
+    groups ANDed, filters in a group ORed, a filter's cells ANDed, and an
+    OPEN quota to fit in every quota group.
+
+    Answers are compared the same way too: as strings for value, list and
+    collection cells, so codes belong in string or integer columns (a float
+    column's 3.0 is '3.0', not '3'), and as numbers for range cells. NaN,
+    '' and None mark a missing answer, which matches no cell.
+
+    Columnar panels hold one answer per panelist, so multi-select answers
+    are not supported here.
+
+    @opportunity: Opportunity (or LazyOpportunity) to compile
+    @collections: collection id -> container of values, for collection
+        cells
+    @_arrays: collection id -> numpy values, shared between opportunities
+    """
+
+    def __init__(self,
+                 opportunity: Opportunity,
+                 collections: Optional[Mapping[str, Container]] = None,
+                 _arrays: Optional[Dict[str, tuple]] = None):
+        _require_numpy()
+        arrays = _arrays if _arrays is not None else {}
+        self.opportunity_id = opportunity.id
+        self.cells: Dict[str, tuple] = {
+            cell.tag: self._compile(cell, collections, arrays)
+            for cell in opportunity.cells
+        }
+        self.filters: Tuple[Tuple[Tuple[str, ...], ...], ...] = tuple(
+            tuple(self._tags(f.cells) for f in group)
+            for group in opportunity.filters
+        )
+        quotas = [[(quota, self._tags(quota.cells)) for quota in group]
+                  for group in opportunity.quotas]
+        self.quotas: Tuple[Tuple[Tuple[str, ...], ...], ...] = tuple(
+            tuple(tags for quota, tags in group
+                  if quota.status is StatusEnum.OPEN)
+            for group in quotas
+        )
+        # Mask keys of the cells evaluate() may use
+        self.keys: FrozenSet[tuple] = frozenset(
+            self.cells[tag][0]
+            for group in self.filters + self.quotas
+            for tags in group
+            for tag in tags
+        )
+
+    def _tags(self, tags: List[str]) -> Tuple[str, ...]:
+        for tag in tags:
+            if tag not in self.cells:
+                raise ValueError(f"Opportunity {self.opportunity_id} "
+                                 f"references unknown cell {tag}")
+        return tuple(tags)
+
+    @staticmethod
+    def _compile(cell: Cell,
+                 collections: Optional[Mapping[str, Container]],
+                 arrays: Dict[str, tuple]) -> tuple:
+        """(cache key, kind, attribute_id, params, negate) for a cell"""
+        negate = cell.negate
+        if isinstance(cell, RangeCell):
+            params = (cell.range_.from_, cell.range_.to)
+            return (('range', cell.attribute_id, params, negate),
+                    'range', cell.attribute_id, params, negate)
+        if isinstance(cell, CollectionCell):
+            if collections is None or cell.collection_ not in collections:
+                raise ValueError(f"Collection {cell.collection_} of cell "
+                                 f"{cell.tag} was not provided")
+            params = arrays.get(cell.collection_)
+            if params is None:
+                params = arrays[cell.collection_] = _value_array(
+                    collections[cell.collection_])
+            key = ('collection', cell.attribute_id, cell.collection_,
+                   negate)
+            return key, 'in', cell.attribute_id, params, negate
+        if isinstance(cell, ListCell):
+            values = frozenset(cell.list_)
+        elif isinstance(cell, ValueCell):
+            values = frozenset([cell.value])
+        else:
+            raise ValueError(f"Unsupported cell kind {cell.kind}")
+        return (('in', cell.attribute_id, values, negate),
+                'in', cell.attribute_id, _value_array(values), negate)
+
+    def _all(self, chunk: _Chunk, tags: Tuple[str, ...]) -> 'np.ndarray':
+        out = np.ones(chunk.size, dtype=bool)
+        for tag in tags:
+            out &= chunk.mask(self.cells[tag])
+        return out
+
+    def _any(self,
+             chunk: _Chunk,
+             group: Tuple[Tuple[str, ...], ...]) -> 'np.ndarray':
+        out = np.zeros(chunk.size, dtype=bool)
+        for tags in group:
+            out |= self._all(chunk, tags)
+        return out
+
+    def evaluate(self, chunk: _Chunk) -> 'np.ndarray':
+        """Boolean mask of the chunk's panelists that qualify"""
+        out = np.ones(chunk.size, dtype=bool)
+        for group in self.filters + self.quotas:
+            out &= self._any(chunk, group)
+            if not out.any():
+                break
+        return out
+
+
+def _panel_size(columns: Dict[int, 'np.ndarray']) -> int:
+    sizes = {len(column) for column in columns.values()}
+    if len(sizes) > 1:
+        raise ValueError('Panel columns must all have the same length')
+    return sizes.pop() if sizes else 0
+
+
+def compile_bulk(opportunities: Sequence[Opportunity],
+                 collections: Optional[Mapping[str, Container]] = None
+                 ) -> List[BulkTargeting]:
+    """Compile opportunities for bulk qualification, converting every
+    collection to an array only once"""
+    arrays = {}
+    return [BulkTargeting(opportunity, collections, arrays)
+            for opportunity in opportunities]
+
+
+def iter_qualification(panel: Panel,
+                       opportunities: Sequence[Opportunity],
+                       collections: Optional[Mapping[str, Container]] = None,
+                       chunk_size: int = DEFAULT_PANEL_CHUNK_SIZE
+                       ) -> Iterator[Tuple[int, 'np.ndarray']]:
+    """
+    Evaluate a columnar panel against opportunities chunk by chunk.
+
+    Yields (first panelist row, matrix) pairs, matrix being a boolean
+    array of chunk rows by opportunities, so the working memory stays
+    bounded by chunk_size no matter the size of the panel. Columns that
+    are not numpy arrays yet are converted once, up front, and a cell's
+    mask is dropped once every opportunity using it was evaluated.
+
+    @panel: attribute_id -> column of answers, one row per panelist
+    @opportunities: opportunities (or already compiled BulkTargeting)
+    @collections: collection id -> container of values, for collection
+        cells
+    @chunk_size: panelists evaluated at a time
+    """
+    _require_numpy()
+    columns = _columns(panel)
+    size = _panel_size(columns)
+    compiled = [o for o in opportunities if isinstance(o, BulkTargeting)]
+    if len(compiled) != len(opportunities):
+        compiled = compile_bulk(opportunities, collections)
+    uses = Counter(key for targeting in compiled for key in targeting.keys)
+    for start in range(0, size, chunk_size):
+        chunk = _Chunk(columns, start, min(start + chunk_size, size), uses)
+        matrix = np.empty((chunk.size, len(compiled)), dtype=bool)
+        for column, targeting in enumerate(compiled):
+            matrix[:, column] = targeting.evaluate(chunk)
+            chunk.release(targeting.keys)
+        yield start, matrix
+
+
+def qualification_matrix(panel: Panel,
+                         opportunities: Sequence[Opportunity],
+                         collections: Optional[Mapping[str, Container]] = None,
+                         chunk_size: int = DEFAULT_PANEL_CHUNK_SIZE,
+                         out: Optional['np.ndarray'] = None) -> 'np.ndarray':
+    """
+    Boolean eligibility matrix of panelists by opportunities.
+
+    @out: array to fill, ie a numpy.memmap when the matrix is too large
+        for memory; must be panel rows by opportunities
+    """
+    _require_numpy()
+    columns = _columns(panel)
+    shape = (_panel_size(columns), len(opportunities))
+    if out is None:
+        out = np.empty(shape, dtype=bool)
+    elif out.shape != shape:
+        raise ValueError(f"out must have shape {shape}")
+    for start, matrix in iter_qualification(columns, opportunities,
+                                            collections, chunk_size):
+        out[start:start + len(matrix)] = matrix
+    return out
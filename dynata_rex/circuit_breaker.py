@@ -0,0 +1,214 @@
+"""
+Package: dynata_rex
+Filename: circuit_breaker.py
+Author(s): Grant W
+
+Description: Per-endpoint circuit breaker for RexRequest
+"""
+# Python Imports
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# Third Party Imports
+
+# Local Imports
+from .exceptions import CircuitOpenException
+from .logs import logger
+
+
+class CircuitStateEnum(Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class _Circuit:
+    """Rolling window and state for a single endpoint"""
+
+    def __init__(self, window_size: int):
+        self.state = CircuitStateEnum.CLOSED
+        self.calls = deque(maxlen=window_size)
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        # Bumped on every state change, so outcomes of calls reserved in an
+        # earlier state are told apart
+        self.generation = 0
+
+    def set_state(self, state: CircuitStateEnum) -> None:
+        self.state = state
+        self.generation += 1
+
+    def failure_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for failed, _ in self.calls if failed) / len(self.calls)
+
+    def slow_call_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, slow in self.calls if slow) / len(self.calls)
+
+
+class CircuitBreaker:
+    """
+    Tracks failure rate and latency per endpoint path and fails fast with
+    CircuitOpenException while an endpoint's circuit is open.
+
+    @failure_rate_threshold: share of failed calls in the window that opens
+        the circuit
+    @slow_call_rate_threshold: share of calls slower than slow_call_duration
+        in the window that opens the circuit
+    @slow_call_duration: seconds after which a call counts as slow
+    @window_size: number of most recent calls per endpoint considered
+    @minimum_calls: calls needed in the window before the rates are checked
+    @open_duration: seconds to stay open before letting probes through
+    @half_open_probes: probe calls allowed (and needed to succeed) while
+        half-open before the circuit closes again
+
+    Callers can shed load before building a request with
+    `breaker.allows(url)` or inspect `breaker.state(url)`.
+    """
+
+    def __init__(self,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_rate_threshold: float = 1.0,
+                 slow_call_duration: float = 30.0,
+                 window_size: int = 20,
+                 minimum_calls: int = 10,
+                 open_duration: float = 30.0,
+                 half_open_probes: int = 1):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.window_size = window_size
+        self.minimum_calls = minimum_calls
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        """Normalize a url (or path) to the endpoint path it is tracked by"""
+        return urlparse(url).path or url
+
+    def _circuit(self, endpoint: str) -> _Circuit:
+        circuit = self._circuits.get(endpoint)
+        if circuit is None:
+            circuit = self._circuits[endpoint] = _Circuit(self.window_size)
+        return circuit
+
+    def _refresh(self, circuit: _Circuit) -> None:
+        """Move an open circuit to half-open once open_duration passed"""
+        if circuit.state is CircuitStateEnum.OPEN and \
+                time.monotonic() - circuit.opened_at >= self.open_duration:
+            circuit.set_state(CircuitStateEnum.HALF_OPEN)
+            circuit.probes_in_flight = 0
+            circuit.probe_successes = 0
+
+    def _open(self, endpoint: str, circuit: _Circuit) -> None:
+        logger.warning(f"Circuit for {endpoint} opened")
+        circuit.set_state(CircuitStateEnum.OPEN)
+        circuit.opened_at = time.monotonic()
+        circuit.calls.clear()
+
+    def state(self, url: str) -> CircuitStateEnum:
+        """Current state of the circuit for a url or endpoint path"""
+        with self._lock:
+            circuit = self._circuit(self.endpoint(url))
+            self._refresh(circuit)
+            return circuit.state
+
+    def allows(self, url: str) -> bool:
+        """Whether a call to url would currently be let through"""
+        with self._lock:
+            circuit = self._circuit(self.endpoint(url))
+            self._refresh(circuit)
+            if circuit.state is CircuitStateEnum.OPEN:
+                return False
+            if circuit.state is CircuitStateEnum.HALF_OPEN:
+                return circuit.probes_in_flight < self.half_open_probes
+            return True
+
+    def before_call(self, url: str) -> int:
+        """Reserve a call to url, raising CircuitOpenException if the
+        circuit does not allow it. Must be followed by `record()`, given
+        the generation returned."""
+        endpoint = self.endpoint(url)
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            self._refresh(circuit)
+            if circuit.state is CircuitStateEnum.OPEN:
+                raise CircuitOpenException(
+                    f"Circuit for {endpoint} is open")
+            if circuit.state is CircuitStateEnum.HALF_OPEN:
+                if circuit.probes_in_flight >= self.half_open_probes:
+                    raise CircuitOpenException(
+                        f"Circuit for {endpoint} is half-open, "
+                        "waiting on probe")
+                circuit.probes_in_flight += 1
+            return circuit.generation
+
+    def record(self,
+               url: str,
+               success: bool,
+               duration: float,
+               generation: Optional[int] = None) -> None:
+        """Record the outcome of a call reserved with `before_call()`
+
+        @generation: what before_call() returned. Outcomes of calls
+            reserved before the circuit last changed state are ignored, ie
+            a call started while closed and finishing once half-open is no
+            probe
+        """
+        endpoint = self.endpoint(url)
+        slow = duration >= self.slow_call_duration
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            if generation is not None and generation != circuit.generation:
+                return
+            if circuit.state is CircuitStateEnum.HALF_OPEN:
+                circuit.probes_in_flight = max(
+                    circuit.probes_in_flight - 1, 0)
+                if not success or slow:
+                    self._open(endpoint, circuit)
+                    return
+                circuit.probe_successes += 1
+                if circuit.probe_successes >= self.half_open_probes:
+                    logger.info(f"Circuit for {endpoint} closed")
+                    circuit.set_state(CircuitStateEnum.CLOSED)
+                    circuit.calls.clear()
+                return
+            if circuit.state is CircuitStateEnum.OPEN:
+                # Call was let through before the circuit opened
+                return
+            circuit.calls.append((not success, slow))
+            if len(circuit.calls) < self.minimum_calls:
+                return
+            if circuit.failure_rate() >= self.failure_rate_threshold or \
+                    circuit.slow_call_rate() >= self.slow_call_rate_threshold:
+                self._open(endpoint, circuit)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """State and rolling rates for every endpoint seen so far"""
+        with self._lock:
+            out = {}
+            for endpoint, circuit in self._circuits.items():
+                self._refresh(circuit)
+                out[endpoint] = {
+                    'state': circuit.state,
+                    'calls': len(circuit.calls),
+                    'failure_rate': circuit.failure_rate(),
+                    'slow_call_rate': circuit.slow_call_rate()
+                }
+            return out
+
+    @staticmethod
+    def is_failure_status(status_code: int) -> bool:
+        """Statuses that count against the service rather than the caller"""
+        return status_code >= 500 or status_code == 429
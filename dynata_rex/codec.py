@@ -0,0 +1,64 @@
+"""
+Package: dynata_rex
+Filename: codec.py
+Author(s): Grant W
+
+Description: JSON codecs used to encode request bodies and decode responses
+"""
+# Python Imports
+import json
+from typing import Any
+
+# Third Party Imports
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Local Imports
+
+
+class JsonCodec:
+    """Standard library json, always available"""
+    name = 'json'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """orjson backed codec, `pip install dynata_rex[orjson]`
+
+    Encodes whatever JsonCodec does: non-string dict keys are converted to
+    strings, and objects orjson rejects, ie integers over 64 bits, are
+    encoded with the standard library instead.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+        self._fallback = JsonCodec()
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return self._fallback.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+def get_default_codec():
+    """The fastest codec available: orjson if installed, else json.
+
+    Codecs raise ValueError (json.JSONDecodeError or a subclass) on invalid
+    input.
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
@@ -0,0 +1,184 @@
+"""
+Package: dynata_rex
+Filename: collection_index.py
+Author(s): Grant W
+
+Description: Compiled collections for fast targeting membership checks
+"""
+# Python Imports
+import hashlib
+import math
+import threading
+from bisect import bisect_left
+from typing import (Callable, Container, Dict, Iterable, Iterator,
+                    Mapping)
+
+# Third Party Imports
+
+# Local Imports
+from .disk_cache import MappedCollection
+
+# Ways of storing a collection's values for exact lookups
+EXACT_SET = 'set'
+EXACT_SORTED = 'sorted'
+
+
+class BloomFilter:
+    """
+    Probabilistic set: `value in bloom` is False for every value never
+    added, and True for added ones plus about `error_rate` of the rest.
+
+    @capacity: values expected to be added
+    @error_rate: false positive rate once `capacity` values are added
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str) -> Iterator[int]:
+        # Double hashing: k positions out of one 128 bit digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class CompiledCollection:
+    """
+    A collection's values compiled for membership checks, to use in place
+    of the list returned by download_collection() wherever targeting takes
+    collections.
+
+    Values are compared as strings, like targeting cells do.
+
+    @collection_id: id of the collection
+    @values: the collection's values, ie registry.iter_collection(id)
+    @exact: 'set' for O(1) lookups, or 'sorted' for O(log n) lookups over
+        a sorted list, about half the memory of a set
+    @bloom: check a Bloom filter first so most values outside the
+        collection are rejected without an exact lookup
+    @error_rate: false positive rate of the Bloom filter
+    """
+
+    def __init__(self,
+                 collection_id: str,
+                 values: Iterable,
+                 exact: str = EXACT_SET,
+                 bloom: bool = False,
+                 error_rate: float = 0.01):
+        if exact not in (EXACT_SET, EXACT_SORTED):
+            raise ValueError(f"exact must be '{EXACT_SET}' or "
+                             f"'{EXACT_SORTED}'")
+        self.collection_id = collection_id
+        self.exact = exact
+        unique = {str(value) for value in values}
+        if exact == EXACT_SORTED:
+            self._values = sorted(unique)
+            del unique
+        else:
+            self._values = frozenset(unique)
+        self._bloom = None
+        if bloom:
+            self._bloom = BloomFilter(len(self._values), error_rate)
+            for value in self._values:
+                self._bloom.add(value)
+
+    def __contains__(self, value) -> bool:
+        value = str(value)
+        if self._bloom is not None and value not in self._bloom:
+            return False
+        if self.exact == EXACT_SET:
+            return value in self._values
+        values = self._values
+        i = bisect_left(values, value)
+        return i < len(values) and values[i] == value
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __repr__(self) -> str:
+        return (f"CompiledCollection({self.collection_id!r}, "
+                f"{len(self)} values, exact={self.exact!r}, "
+                f"bloom={self._bloom is not None})")
+
+
+class CollectionCache(Mapping):
+    """
+    Collection id -> CompiledCollection, downloaded and compiled the first
+    time it is looked up then shared by every opportunity referencing it.
+    Pass it as `collections` to targeting.CompiledTargeting or
+    bulk.qualification_matrix.
+
+    Thread safe: concurrent lookups of the same collection download it
+    once.
+
+    @loader: callable(collection_id) -> iterable of values, ie
+        registry.iter_collection. Compiled or memory-mapped collections it
+        returns are used as they are unless compile_kwargs are given
+    @compile_kwargs: passed to CompiledCollection (exact, bloom, ...)
+
+    >>> collections = registry.collection_cache(bloom=True)
+    >>> targeting = CompiledTargeting(opportunity, collections)
+    """
+
+    def __init__(self,
+                 loader: Callable[[str], Iterable],
+                 **compile_kwargs):
+        self.loader = loader
+        self.compile_kwargs = compile_kwargs
+        self._collections: Dict[str, Container] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, collection_id: str) -> Container:
+        collection_id = str(collection_id)
+        collection = self._collections.get(collection_id)
+        if collection is not None:
+            return collection
+        with self._lock:
+            lock = self._locks.setdefault(collection_id, threading.Lock())
+        with lock:
+            collection = self._collections.get(collection_id)
+            if collection is None:
+                collection = self.loader(collection_id)
+                if self.compile_kwargs or not isinstance(
+                        collection, (CompiledCollection, MappedCollection)):
+                    collection = CompiledCollection(collection_id,
+                                                    collection,
+                                                    **self.compile_kwargs)
+                self._collections[collection_id] = collection
+        return collection
+
+    def __contains__(self, collection_id) -> bool:
+        # Any collection can be loaded, lookups fail loudly if it can't
+        return isinstance(collection_id, (str, int))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._collections))
+
+    def __len__(self) -> int:
+        return len(self._collections)
+
+    def invalidate(self, collection_id: str) -> None:
+        """Drop a compiled collection so the next lookup downloads it
+        again"""
+        self._collections.pop(str(collection_id), None)
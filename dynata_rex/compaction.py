@@ -0,0 +1,103 @@
+"""
+Package: dynata_rex
+Filename: compaction.py
+Author(s): Grant W
+
+Description: Collapse repeated notifications before they are handled
+"""
+# Python Imports
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+# Third Party Imports
+
+# Local Imports
+
+
+class Compactor:
+    """
+    Collapses notifications for the same opportunity so the handler sees
+    each one once, latest wins, and skips re-deliveries identical to what
+    the handler last saw.
+
+    Given to a Consumer, batches arriving within `window` seconds of each
+    other (up to `max_size` notifications) are merged before compaction,
+    and every notification merged is acknowledged once the handler
+    returns, including the ones collapsed or skipped.
+
+    Identity is the structural hash of the notification, cached by frozen
+    models, so checking a re-delivery costs a dict lookup.
+
+    @window: seconds to wait for more batches before handing over the
+        first one, 0 to only merge batches already waiting
+    @max_size: notifications to merge at most
+    @recent: ids whose last handled version is remembered to skip
+        unchanged re-deliveries, least recently handled ones forgotten
+        first; 0 to disable
+    @key: callable(item) -> id notifications are collapsed by
+    @fingerprint: callable(item) -> value equal for unchanged
+        re-deliveries
+
+    >>> consumer = registry.consume(handler,
+    ...                             compactor=Compactor(window=0.5))
+    """
+
+    def __init__(self,
+                 window: float = 0.5,
+                 max_size: int = 500,
+                 recent: int = 10000,
+                 key: Callable[[Any], Any] = lambda item: item.id,
+                 fingerprint: Callable[[Any], Any] = hash):
+        if window < 0 or max_size < 1 or recent < 0:
+            raise ValueError('window and recent must be >= 0, max_size '
+                             '>= 1')
+        self.window = window
+        self.max_size = max_size
+        self.recent = recent
+        self.key = key
+        self.fingerprint = fingerprint
+        self.stats = {'received': 0, 'collapsed': 0, 'unchanged': 0,
+                      'handed': 0}
+        # id -> fingerprint of the version last handled
+        self._recent: OrderedDict = OrderedDict()
+
+    def collapse(self, items: List[Any]) -> List[Any]:
+        """The latest notification per id, ordered by arrival, minus those
+        unchanged since they were last handled"""
+        latest = {}
+        for item in items:
+            item_id = self.key(item)
+            # Re-insert so the order follows the latest arrival
+            latest.pop(item_id, None)
+            latest[item_id] = item
+        out = []
+        for item_id, item in latest.items():
+            seen = self._recent.get(item_id)
+            if seen is not None and seen == self.fingerprint(item):
+                self.stats['unchanged'] += 1
+                continue
+            out.append(item)
+        self.stats['received'] += len(items)
+        self.stats['collapsed'] += len(items) - len(latest)
+        self.stats['handed'] += len(out)
+        return out
+
+    def record(self, items: List[Any]) -> None:
+        """Remember the versions the handler processed"""
+        if not self.recent:
+            return
+        recent = self._recent
+        for item in items:
+            item_id = self.key(item)
+            recent[item_id] = self.fingerprint(item)
+            recent.move_to_end(item_id)
+        while len(recent) > self.recent:
+            recent.popitem(last=False)
+
+    def forget(self, item_id: Optional[Any] = None) -> None:
+        """Forget the handled version of an id, or of every id, so its next
+        delivery is handled even if unchanged"""
+        if item_id is None:
+            self._recent.clear()
+        else:
+            self._recent.pop(item_id, None)
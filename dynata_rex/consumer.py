@@ -0,0 +1,291 @@
+"""
+Package: dynata_rex
+Filename: consumer.py
+Author(s): Grant W
+
+Description: Continuous, pipelined consumers for notifications and invites
+"""
+# Python Imports
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Union
+
+# Third Party Imports
+
+# Local Imports
+from .logs import logger
+from .adaptive_limit import AdaptiveLimit
+from .ack_buffer import AckBuffer
+from .journal import Journal
+from .compaction import Compactor
+
+# Sentinel closing the batch and ack queues
+_STOP = object()
+
+
+class Consumer:
+    """
+    Polls the registry on a background thread and hands each batch to
+    `handler` on another, so the next batch is already being fetched while
+    the current one is handled. Handled batches are acknowledged from a
+    third thread.
+
+    @fetch: callable(limit) -> list of items, ie receive_notifications
+    @handler: callable(batch) called with every non-empty batch. A batch is
+        acknowledged once the handler returns; if it raises the error is
+        logged and the batch is left unacknowledged to be redelivered
+    @ack: callable(ids) acknowledging a list of item ids, or an AckBuffer
+        to batch them into fewer requests. The buffer is closed, flushing
+        it, when the consumer stops
+    @limit: items requested per poll, or an AdaptiveLimit sizing each poll
+        from how full, how slow and how long to handle the last batches were
+    @prefetch: fetched batches allowed to wait for the handler
+    @idle_delay: first sleep in seconds after an empty (or failed) poll
+    @max_idle_delay: cap on the sleep, which doubles on every further
+        empty poll and resets once a batch arrives
+    @key: callable(item) -> id to acknowledge it by
+    @journal: Journal to write each batch to before acknowledging it, as
+        soon as it is fetched. Batches are then marked done once handled,
+        and the ones left pending by a failed handler or a restart are
+        handled again when the consumer starts. Closed when the consumer
+        stops
+    @compactor: Compactor merging the batches that arrive within its
+        window and collapsing repeated notifications before `handler`
+
+    >>> consumer = Consumer(fetch, handler, ack).start()
+    >>> ...
+    >>> consumer.stop()
+    """
+
+    def __init__(self,
+                 fetch: Callable[[int], list],
+                 handler: Callable[[list], Any],
+                 ack: Callable[[list], Any],
+                 limit: Union[int, AdaptiveLimit] = 10,
+                 prefetch: int = 1,
+                 idle_delay: float = 1.0,
+                 max_idle_delay: float = 30.0,
+                 key: Callable[[Any], Any] = lambda item: item.id,
+                 journal: Optional[Journal] = None,
+                 compactor: Optional[Compactor] = None):
+        self.fetch = fetch
+        self.handler = handler
+        self.ack = ack
+        self.limit = limit
+        self.idle_delay = idle_delay
+        self.max_idle_delay = max_idle_delay
+        self.key = key
+        self.journal = journal
+        self.compactor = compactor
+        self.stats = {
+            'polls': 0,
+            'empty_polls': 0,
+            'fetch_errors': 0,
+            'batches': 0,
+            'items': 0,
+            'handler_errors': 0,
+            'acked': 0,
+            'ack_errors': 0,
+            'replayed': 0,
+            'skipped': 0,
+            'limit': self._current_limit()
+        }
+        self._batches = queue.Queue(maxsize=max(prefetch, 1))
+        self._acks = queue.Queue()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> 'Consumer':
+        """Start fetching, handling and acknowledging in the background"""
+        if self._threads:
+            raise RuntimeError('Consumer already started')
+        for target in (self._fetch_loop, self._handle_loop, self._ack_loop):
+            thread = threading.Thread(target=target,
+                                      name=f"rex-{target.__name__[1:]}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop polling and wait for the batch being handled and the
+        pending acknowledgements to finish. Prefetched batches that were
+        not handled yet are dropped unacknowledged."""
+        self._stopping.set()
+        self.join(timeout)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the consumer threads to exit"""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _current_limit(self) -> int:
+        if isinstance(self.limit, AdaptiveLimit):
+            return self.limit.limit
+        return self.limit
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Put onto a bounded queue, giving up once stopping"""
+        while not self._stopping.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _replay(self) -> bool:
+        """Queue the batches left pending in the journal, returns False if
+        stopped meanwhile"""
+        for seq, batch in self.journal.pending():
+            self.stats['replayed'] += len(batch)
+            if not self._put(self._batches, (seq, batch)):
+                return False
+        return True
+
+    def _fetch_loop(self) -> None:
+        delay = self.idle_delay
+        try:
+            if self.journal is not None and not self._replay():
+                return
+            while not self._stopping.is_set():
+                self.stats['polls'] += 1
+                limit = self.stats['limit'] = self._current_limit()
+                started = time.monotonic()
+                try:
+                    batch = self.fetch(limit)
+                except Exception:
+                    logger.exception('Error polling the registry')
+                    self.stats['fetch_errors'] += 1
+                    batch = None
+                if batch is not None and \
+                        isinstance(self.limit, AdaptiveLimit):
+                    self.limit.record_poll(limit, len(batch),
+                                           time.monotonic() - started)
+                if batch:
+                    delay = self.idle_delay
+                    seq = None
+                    if self.journal is not None:
+                        # Acknowledged once the journal is synced
+                        seq = self.journal.append(batch)
+                        self._acks.put([self.key(item) for item in batch])
+                    if not self._put(self._batches, (seq, batch)):
+                        break
+                    continue
+                if batch is not None:
+                    self.stats['empty_polls'] += 1
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_idle_delay)
+        finally:
+            # Unblock the handler, which may be waiting on an empty queue
+            self._stopping.set()
+
+    def _take(self) -> list:
+        """(seq, batch) pairs to handle together: the next batch, plus
+        with a compactor the ones arriving within its window"""
+        taken = [self._batches.get(timeout=0.1)]
+        if self.compactor is None:
+            return taken
+        size = len(taken[0][1])
+        deadline = time.monotonic() + self.compactor.window
+        while size < self.compactor.max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    taken.append(self._batches.get(timeout=remaining))
+                else:
+                    taken.append(self._batches.get_nowait())
+            except queue.Empty:
+                break
+            size += len(taken[-1][1])
+        return taken
+
+    def _handle_loop(self) -> None:
+        try:
+            while not self._stopping.is_set():
+                try:
+                    taken = self._take()
+                except queue.Empty:
+                    continue
+                batch = taken[0][1] if len(taken) == 1 else \
+                    [item for _, items in taken for item in items]
+                handed = batch
+                if self.compactor is not None:
+                    handed = self.compactor.collapse(batch)
+                started = time.monotonic()
+                try:
+                    if handed:
+                        self.handler(handed)
+                except Exception:
+                    logger.exception('Error handling batch, leaving it '
+                                     'unacknowledged')
+                    self.stats['handler_errors'] += 1
+                    continue
+                if self.compactor is not None:
+                    self.compactor.record(handed)
+                if isinstance(self.limit, AdaptiveLimit):
+                    self.limit.record_handled(len(batch),
+                                              time.monotonic() - started)
+                self.stats['batches'] += len(taken)
+                self.stats['items'] += len(batch)
+                self.stats['skipped'] += len(batch) - len(handed)
+                for seq, items in taken:
+                    if seq is not None:
+                        self.journal.done(seq)
+                    else:
+                        self._acks.put([self.key(item) for item in items])
+        finally:
+            # The fetch thread may still queue acknowledgements
+            self._threads[0].join()
+            self._acks.put(_STOP)
+
+    def _ack_loop(self) -> None:
+        stopped = False
+        while not stopped:
+            pending = [self._acks.get()]
+            # Take whatever else is waiting, so one journal sync covers it
+            while pending[-1] is not _STOP:
+                try:
+                    pending.append(self._acks.get_nowait())
+                except queue.Empty:
+                    break
+            if pending[-1] is _STOP:
+                stopped = True
+                pending.pop()
+            if pending and self.journal is not None:
+                try:
+                    self.journal.sync()
+                except Exception:
+                    logger.exception('Error syncing the journal, leaving '
+                                     'batches unacknowledged')
+                    self.stats['ack_errors'] += len(pending)
+                    continue
+            for ids in pending:
+                try:
+                    self.ack(ids)
+                    self.stats['acked'] += len(ids)
+                except Exception:
+                    logger.exception(f"Error acknowledging {ids}")
+                    self.stats['ack_errors'] += 1
+        if self.journal is not None:
+            try:
+                self.journal.close()
+            except Exception:
+                logger.exception('Error closing the journal')
+        if isinstance(self.ack, AckBuffer):
+            try:
+                self.ack.close()
+            except Exception:
+                logger.exception('Error flushing acknowledgements')
+                self.stats['ack_errors'] += 1
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
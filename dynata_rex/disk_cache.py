@@ -0,0 +1,362 @@
+"""
+Package: dynata_rex
+Filename: disk_cache.py
+Author(s): Grant W
+
+Description: Content-addressed on-disk cache of memory-mapped collections
+"""
+# Python Imports
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+# Third Party Imports
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Local Imports
+from .exceptions import RexClientException
+from .logs import logger
+
+_MAGIC = b'REXC'
+_VERSION = 1
+# magic, version, value count
+_HEADER = struct.Struct('<4sIQ')
+_SUFFIX = '.rexc'
+
+
+def write_collection(values: Iterable, f) -> str:
+    """
+    Write a collection's values to a binary file object as a sorted,
+    de-duplicated table that MappedCollection opens in place, returns the
+    sha256 digest of the values.
+
+    Layout: header, value count + 1 offsets (native 8 byte integers, the
+    cache is local to a host) then the UTF-8 values back to back.
+    """
+    encoded = sorted({str(value).encode() for value in values})
+    offsets = array('Q', [0])
+    digest = hashlib.sha256()
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+        # Length prefixed so ['ab', 'c'] and ['a', 'bc'] differ
+        digest.update(struct.pack('<I', len(value)))
+        digest.update(value)
+    f.write(_HEADER.pack(_MAGIC, _VERSION, len(encoded)))
+    f.write(offsets.tobytes())
+    for value in encoded:
+        f.write(value)
+    return digest.hexdigest()
+
+
+class MappedCollection:
+    """
+    A collection file memory-mapped read only: opening it costs no parsing
+    or copying, the OS pages values in as lookups touch them and shares
+    them between processes. Membership is a binary search, O(log n).
+
+    Values are compared as strings, like targeting cells do, so it can be
+    passed wherever targeting takes a collection.
+
+    @path: file written by write_collection()
+    @collection_id: id of the collection, for reference
+    """
+
+    def __init__(self, path: str, collection_id: Optional[str] = None):
+        self.path = path
+        self.collection_id = collection_id
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count = _HEADER.unpack_from(self._mmap)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"{path} is not a version {_VERSION} "
+                                 f"collection file")
+            start = _HEADER.size
+            self._data = start + 8 * (count + 1)
+            if len(self._mmap) < self._data:
+                raise ValueError(f"{path} is truncated")
+            self._offsets = memoryview(self._mmap)[start:self._data] \
+                .cast('Q')
+        except (ValueError, struct.error):
+            self._mmap.close()
+            raise
+        self._count = count
+
+    def _value(self, index: int) -> bytes:
+        data = self._data
+        offsets = self._offsets
+        return self._mmap[data + offsets[index]:data + offsets[index + 1]]
+
+    def __contains__(self, value) -> bool:
+        value = str(value).encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._value(middle) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self._count and self._value(low) == value
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self._count):
+            yield self._value(index).decode()
+
+    def __repr__(self) -> str:
+        return (f"MappedCollection({self.collection_id!r}, "
+                f"{self._count} values)")
+
+    def close(self) -> None:
+        self._offsets.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CollectionDiskCache:
+    """
+    Collections cached on disk across restarts, in the format of
+    write_collection() so workers map them instead of downloading them
+    again.
+
+    Blobs are content addressed: stored under the digest of their values,
+    with a small ref per key pointing at the digest, so collections with
+    the same values share one file and a re-download of unchanged values
+    writes nothing new. Least recently used blobs are evicted once the
+    cache grows past max_bytes.
+
+    Safe to share between processes on a host: files are written to a
+    temporary name and renamed into place, a per key lock lets a single
+    process download a collection while the others wait for it, and
+    eviction runs under a cache wide lock that storing a blob also holds
+    until it is mapped. Mapped blobs stay readable after they are evicted.
+
+    @directory: where to keep the cache, created if needed
+    @max_bytes: total size of the blobs to stay under
+    @max_age: seconds after which a key is downloaded again, in case the
+        collection changed; None keeps it until evicted
+
+    >>> cache = CollectionDiskCache('/var/cache/rex', max_bytes=2 << 30)
+    >>> collections = registry.collection_cache(disk_cache=cache)
+    """
+
+    def __init__(self,
+                 directory: str,
+                 max_bytes: int = 1 << 30,
+                 max_age: Optional[float] = None):
+        if fcntl is None:
+            raise RexClientException('CollectionDiskCache needs fcntl, '
+                                     'which is not available on this '
+                                     'platform')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        for name in ('blobs', 'refs', 'locks'):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return quote(key, safe='')
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest + _SUFFIX)
+
+    def _ref_path(self, key: str) -> str:
+        return os.path.join(self.directory, 'refs',
+                            self._name(key) + '.json')
+
+    @contextmanager
+    def _locked(self, name: str):
+        path = os.path.join(self.directory, 'locks', name + '.lock')
+        with open(path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_atomic(directory: str,
+                      write: Callable) -> Tuple[str, Any]:
+        """Write to a temporary file in directory, returns its path and
+        what write(f) returned"""
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                result = write(f)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path, result
+
+    def _ref(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._ref_path(key)) as f:
+                ref = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.max_age is not None and \
+                time.time() - ref['stored'] > self.max_age:
+            return None
+        return ref
+
+    def digest(self, key: str) -> Optional[str]:
+        """Content digest of the collection cached for key, or None if it
+        is not cached or expired"""
+        ref = self._ref(key)
+        return ref['digest'] if ref is not None else None
+
+    def get(self, key: str) -> Optional[MappedCollection]:
+        """The cached collection for key, or None if it is not cached or
+        expired"""
+        ref = self._ref(key)
+        if ref is None:
+            return None
+        path = self._blob_path(ref['digest'])
+        try:
+            collection = MappedCollection(path, key)
+        except FileNotFoundError:
+            # Evicted since the ref was read
+            return None
+        except ValueError as e:
+            logger.warning(f"Ignoring corrupt cached collection: {e}")
+            return None
+        try:
+            # Recency for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted since it was mapped, the mapping stays readable
+            pass
+        return collection
+
+    def put(self, key: str, values: Iterable) -> MappedCollection:
+        """Store a collection's values under key and map them"""
+        blobs = os.path.join(self.directory, 'blobs')
+        tmp_path, digest = self._write_atomic(blobs, lambda f:
+                                              write_collection(values, f))
+        path = self._blob_path(digest)
+        ref = json.dumps({'digest': digest, 'stored': time.time()})
+        try:
+            ref_path, _ = self._write_atomic(os.path.join(self.directory,
+                                                          'refs'),
+                                             lambda f: f.write(ref.encode()))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        try:
+            # Held until the blob is mapped, so no eviction removes it
+            # in between
+            with self._locked('cache'):
+                if os.path.exists(path):
+                    # Same values as a blob already stored
+                    os.unlink(tmp_path)
+                    os.utime(path)
+                else:
+                    os.replace(tmp_path, path)
+                os.replace(ref_path, self._ref_path(key))
+                collection = MappedCollection(path, key)
+        except BaseException:
+            for leftover in (tmp_path, ref_path):
+                try:
+                    os.unlink(leftover)
+                except FileNotFoundError:
+                    pass
+            raise
+        self.evict(keep=digest)
+        return collection
+
+    def get_or_load(self,
+                    key: str,
+                    loader: Callable[[], Iterable]) -> MappedCollection:
+        """The cached collection for key, calling loader() for its values
+        and caching them on a miss. Concurrent misses on the same key,
+        from any process, call the loader once."""
+        collection = self.get(key)
+        if collection is not None:
+            return collection
+        with self._locked('key-' + self._name(key)):
+            collection = self.get(key)
+            if collection is None:
+                collection = self.put(key, loader())
+        return collection
+
+    def invalidate(self, key: str) -> None:
+        """Forget key, its blob is left for eviction"""
+        try:
+            os.unlink(self._ref_path(key))
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> int:
+        """Total bytes of the stored blobs"""
+        return sum(entry.stat().st_size for entry in self._blobs())
+
+    def _blobs(self):
+        with os.scandir(os.path.join(self.directory, 'blobs')) as entries:
+            return [entry for entry in entries
+                    if entry.name.endswith(_SUFFIX)]
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Remove least recently used blobs, and the refs pointing at
+        them, until the cache is within max_bytes. Returns the number of
+        blobs removed.
+
+        @keep: digest of a blob not to evict, ie the one just stored
+        """
+        with self._locked('cache'):
+            blobs = []
+            for entry in self._blobs():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, entry))
+            total = sum(size for _, size, _ in blobs)
+            if total <= self.max_bytes:
+                return 0
+
+            evicted = set()
+            for _, size, entry in sorted(blobs, key=lambda b: b[0]):
+                if total <= self.max_bytes:
+                    break
+                digest = entry.name[:-len(_SUFFIX)]
+                if digest == keep:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted.add(digest)
+
+            refs = os.path.join(self.directory, 'refs')
+            with os.scandir(refs) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        with open(entry.path) as f:
+                            digest = json.load(f)['digest']
+                        if digest in evicted:
+                            os.unlink(entry.path)
+                    except (OSError, ValueError, KeyError):
+                        continue
+            return len(evicted)
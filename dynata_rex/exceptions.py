@@ -38,6 +38,13 @@ class InvalidCredentialsException(RexServiceException):
     pass
 
 
+class CircuitOpenException(RexServiceException):
+    """
+    Raised without calling REX while an endpoint's circuit is open.
+    """
+    pass
+
+
 class SignatureExpiredException(RexClientException):
     pass
 
@@ -8,7 +8,10 @@ Description: General helpers
 # Python Imports
 import os
 import random
+import threading
 import time
+from typing import Iterable, Iterator, List
+from urllib.parse import urlparse
 
 # Third Party Imports
 import requests
@@ -17,49 +20,193 @@ from requests.exceptions import ReadTimeout, ConnectionError
 
 # Local Imports
 from .exceptions import HttpTimeoutException, RexServiceException
+from .retry import RetryPolicy, parse_retry_after
+from .retry import DEFAULT_RETRIES  # noqa: F401
 
 
 DEFAULT_TIMEOUT = int(os.environ.get('DEFAULT_TIMEOUT', '60'))
-DEFAULT_RETRIES = int(os.environ.get('DEFAULT_RETRIES', '3'))
+DEFAULT_POOL_CONNECTIONS = int(
+    os.environ.get('DEFAULT_POOL_CONNECTIONS', '10'))
+DEFAULT_POOL_MAXSIZE = int(os.environ.get('DEFAULT_POOL_MAXSIZE', '10'))
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# TODO: Set dynata_rex.__version__ and use instead of 0.0.1
+USER_AGENT = 'rex-sdk-python/0.0.1'
+
+_SHARED_SESSION = None
+_SHARED_SESSION_PID = None
+_SHARED_SESSION_LOCK = threading.Lock()
 
 
 class TimeoutHTTPAdapter(HTTPAdapter):
 
-    def _wait(self, try_number):
-        interval = (2 ** try_number) + (random.randint(0, 1000) / 1000)
+    def _wait(self, try_number, interval=None):
+        if interval is None:
+            interval = (2 ** try_number) + (random.randint(0, 1000) / 1000)
         time.sleep(interval)
         return
 
     def __init__(self, *args, **kwargs):
-        _kwargs = {k: v for k, v in kwargs.items() if k != 'request_timeout'}
-        super().__init__(*args, **_kwargs)
-        self.maximum_retries = DEFAULT_RETRIES
+        """
+        Accepts the HTTPAdapter arguments (pool_connections, pool_maxsize,
+        pool_block) plus:
+
+        @request_timeout: default timeout in seconds for each request
+        @keepalive_timeout: seconds a host's pooled connections may sit idle
+            before they are dropped instead of reused, None to keep forever
+        @retry_policy: RetryPolicy deciding which failures are retried,
+            defaults to a new RetryPolicy()
+        """
+        self.request_timeout = kwargs.pop('request_timeout', DEFAULT_TIMEOUT)
+        self.keepalive_timeout = kwargs.pop('keepalive_timeout', None)
+        retry_policy = kwargs.pop('retry_policy', None)
+        self.retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy()
+        self._last_used = {}
+        self._last_used_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def maximum_retries(self) -> int:
+        return self.retry_policy.max_attempts
+
+    @maximum_retries.setter
+    def maximum_retries(self, value: int) -> None:
+        self.retry_policy.max_attempts = value
 
-    def send(self, request, try_count=1, **kwargs):
+    def _expire_idle_connections(self, url: str) -> None:
+        """Drop the pool for a host whose connections have been idle for
+        longer than keepalive_timeout, so we don't reuse sockets the server
+        has likely already closed"""
+        if not self.keepalive_timeout:
+            return
+        parsed = urlparse(url)
+        host = (parsed.scheme, parsed.hostname)
+        now = time.monotonic()
+        with self._last_used_lock:
+            last_used = self._last_used.get(host)
+            self._last_used[host] = now
+            if last_used is None or now - last_used <= self.keepalive_timeout:
+                return
+            pools = self.poolmanager.pools
+            with pools.lock:
+                stale = [key for key in pools.keys()
+                         if (key.key_scheme, key.key_host) == host]
+            for key in stale:
+                # Disposing the pool closes its idle connections
+                pools.pop(key, None)
+
+    def send(self, request, **kwargs):
         if "request_timeout" in kwargs:
             request_timeout = kwargs["request_timeout"]
             del kwargs["request_timeout"]
         else:
-            request_timeout = DEFAULT_TIMEOUT
-        kwargs["timeout"] = request_timeout
-        try:
-            return super().send(request, **kwargs)
-        except ReadTimeout as e:
-            raise HttpTimeoutException(e)
-        except ConnectionError as e:
-            try_count += 1
-            if try_count > self.maximum_retries:
-                raise RexServiceException from e
-            self._wait(try_count)
-            return self.send(request, try_count=try_count, **kwargs)
-
-
-def make_session(request_timeout=DEFAULT_TIMEOUT):
-    """Make a session and mount the TimeoutHTTPAdapter"""
+            request_timeout = self.request_timeout
+        policy = self.retry_policy
+        state = policy.start()
+        auth = getattr(request, 'rex_auth', None)
+        while True:
+            kwargs["timeout"] = state.attempt_timeout(request_timeout)
+            if auth is not None:
+                # Fresh expiration + signature for every attempt
+                auth.sign(request, remaining=state.remaining())
+            self._expire_idle_connections(request.url)
+            try:
+                response = super().send(request, **kwargs)
+            except ReadTimeout as e:
+                delay = state.next_delay(policy.timeout_class)
+                if delay is None:
+                    raise HttpTimeoutException(e)
+            except ConnectionError as e:
+                delay = state.next_delay(policy.connection_class)
+                if delay is None:
+                    raise RexServiceException from e
+            else:
+                retry_class = policy.classify_status(response.status_code)
+                if retry_class is None:
+                    return response
+                retry_after = parse_retry_after(
+                    response.headers.get('Retry-After'))
+                delay = state.next_delay(retry_class, retry_after)
+                if delay is None:
+                    return response
+                # Release the connection back to the pool before sleeping
+                response.close()
+            self._wait(state.attempt, delay)
+
+
+def make_session(request_timeout=DEFAULT_TIMEOUT,
+                 pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 pool_block: bool = False,
+                 keepalive_timeout: float = None,
+                 retry_policy: RetryPolicy = None):
+    """Make a session and mount the TimeoutHTTPAdapter
+
+    @request_timeout: default timeout in seconds for each request
+    @pool_connections: number of per-host connection pools to keep
+    @pool_maxsize: maximum connections kept open per host, size it to the
+        number of threads sharing the session
+    @pool_block: wait for a free connection instead of opening (and then
+        discarding) an extra one when a host's pool is exhausted
+    @keepalive_timeout: seconds a host's connections may stay idle before
+        they are dropped, None to keep them until the server closes them
+    @retry_policy: RetryPolicy for the session, defaults to RetryPolicy()
+    """
     session = requests.Session()
-    adapter = TimeoutHTTPAdapter(request_timeout=request_timeout)
-    # TODO: Set dynata_rex.__version__ and use instead of 0.0.1
-    session.headers["User-Agent"] = 'rex-sdk-python/0.0.1'
+    adapter = TimeoutHTTPAdapter(request_timeout=request_timeout,
+                                 pool_connections=pool_connections,
+                                 pool_maxsize=pool_maxsize,
+                                 pool_block=pool_block,
+                                 keepalive_timeout=keepalive_timeout,
+                                 retry_policy=retry_policy)
+    session.headers["User-Agent"] = USER_AGENT
     session.mount('https://', adapter)
     session.mount('http://', adapter)
     return session
+
+
+def get_shared_session(**kwargs) -> requests.Session:
+    """Get the process-wide session, creating it with `make_session(**kwargs)`
+    on first use.
+
+    Clients built with `session=get_shared_session()` reuse the same pooled
+    connections to registry.rex and respondent.rex. kwargs only apply when
+    the session is created; a forked child process gets its own session so
+    sockets are never shared between processes.
+    """
+    global _SHARED_SESSION, _SHARED_SESSION_PID
+    with _SHARED_SESSION_LOCK:
+        if _SHARED_SESSION is None or _SHARED_SESSION_PID != os.getpid():
+            _SHARED_SESSION = make_session(**kwargs)
+            _SHARED_SESSION_PID = os.getpid()
+        return _SHARED_SESSION
+
+
+def iter_lines(chunks: Iterable[bytes],
+               encoding: str = 'utf-8') -> Iterator[str]:
+    """Split a stream of byte chunks into decoded lines.
+
+    Matches `content.decode(encoding).split('\\n')`, including the trailing
+    empty string after a final newline, while only holding one partial line
+    in memory.
+    """
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode(encoding)
+    yield pending.decode(encoding)
+
+
+def split_shards(shards: List[int], parts: int) -> List[List[int]]:
+    """Split shards into `parts` contiguous, near equal ranges. Parts past
+    the number of shards are empty."""
+    size, extra = divmod(len(shards), parts)
+    out = []
+    start = 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        out.append(shards[start:end])
+        start = end
+    return out
@@ -0,0 +1,222 @@
+"""
+Package: dynata_rex
+Filename: journal.py
+Author(s): Grant W
+
+Description: Write-ahead journal of received batches, for acking early
+"""
+# Python Imports
+import os
+import struct
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Third Party Imports
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Local Imports
+from .codec import get_default_codec
+from .exceptions import RexClientException
+from .logs import logger
+
+# payload length, crc32 of kind + seq + payload, kind, sequence number
+_RECORD = struct.Struct('<IIBQ')
+_KIND = struct.Struct('<BQ')
+_BATCH = 1
+_DONE = 2
+
+
+class Journal:
+    """
+    Append-only log of received batches, so a consumer can acknowledge a
+    batch as soon as it is journaled, before handling it, and still handle
+    it at least once: batches not marked done are replayed by pending()
+    after a crash or restart.
+
+    append() only writes to the OS; sync() makes every batch appended so
+    far durable with a single fsync, so one fsync covers all the batches
+    received while the previous one ran. Acknowledge a batch only once a
+    sync() after its append() returned.
+
+    Records carry a CRC; a torn record at the end, from a crash mid write,
+    is dropped on open. The file is rewritten with just the pending
+    batches once it grows past max_bytes.
+
+    @path: journal file, created if needed. One journal per consumer, the
+        file is locked against other processes where fcntl is available
+    @encode: callable(batch) -> bytes
+    @decode: callable(bytes) -> batch
+    @max_bytes: size past which the journal is compacted
+
+    >>> journal = Journal('/var/lib/rex/notifications.journal')
+    >>> seq = journal.append(batch)
+    >>> journal.sync()
+    >>> registry.ack_notifications([o.id for o in batch])
+    >>> handle(batch)
+    >>> journal.done(seq)
+    """
+
+    def __init__(self,
+                 path: str,
+                 encode: Optional[Callable[[list], bytes]] = None,
+                 decode: Optional[Callable[[bytes], list]] = None,
+                 max_bytes: int = 64 << 20):
+        codec = get_default_codec()
+        self.path = path
+        self.encode = encode or codec.dumps
+        self.decode = decode or codec.loads
+        self.max_bytes = max_bytes
+        self.stats = {'appended': 0, 'done': 0, 'syncs': 0,
+                      'compactions': 0}
+        # seq -> encoded batch, for every batch not done yet
+        self._pending: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self._file = None
+        self._open()
+
+    def _open(self) -> None:
+        f = open(self.path, 'a+b')
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                raise RexClientException(f"Journal {self.path} is in use "
+                                         f"by another process")
+        f.seek(0)
+        end, last_seq = self._replay(f)
+        size = f.seek(0, os.SEEK_END)
+        if size > end:
+            logger.warning(f"Dropping {size - end} bytes of torn records "
+                           f"from the end of {self.path}")
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+        self._seq = last_seq
+        self._file = f
+
+    def _replay(self, f) -> Tuple[int, int]:
+        """Load the pending batches, returns the offset after the last
+        intact record and the last sequence number"""
+        end = 0
+        last_seq = 0
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                break
+            length, crc, kind, seq = _RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or \
+                    zlib.crc32(payload, zlib.crc32(header[8:])) != crc:
+                break
+            if kind == _BATCH:
+                self._pending[seq] = payload
+            elif kind == _DONE:
+                self._pending.pop(seq, None)
+            else:
+                break
+            end += _RECORD.size + length
+            last_seq = max(last_seq, seq)
+        return end, last_seq
+
+    @staticmethod
+    def _record(kind: int, seq: int, payload: bytes = b'') -> bytes:
+        crc = zlib.crc32(payload, zlib.crc32(_KIND.pack(kind, seq)))
+        return _RECORD.pack(len(payload), crc, kind, seq) + payload
+
+    def _write(self, record: bytes) -> None:
+        """Write a record, holding _lock"""
+        if self._file is None:
+            raise RuntimeError('Journal is closed')
+        self._file.write(record)
+        self._written += 1
+
+    def append(self, batch: list) -> int:
+        """Journal a batch, returns its sequence number for done(). Not
+        durable until sync()"""
+        payload = self.encode(batch)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._write(self._record(_BATCH, seq, payload))
+            self._pending[seq] = payload
+        self.stats['appended'] += 1
+        return seq
+
+    def sync(self) -> None:
+        """Make every batch appended so far durable. Concurrent and
+        repeated calls share one fsync"""
+        with self._sync_lock:
+            with self._lock:
+                target = self._written
+                if target <= self._synced or self._file is None:
+                    return
+                self._file.flush()
+                fileno = self._file.fileno()
+            os.fsync(fileno)
+            self._synced = target
+            self.stats['syncs'] += 1
+
+    def done(self, seq: int) -> None:
+        """Mark a batch handled so it is not replayed. Not synced: losing
+        the mark to a crash only replays the batch again"""
+        with self._lock:
+            if self._pending.pop(seq, None) is None:
+                return
+            self._write(self._record(_DONE, seq))
+            compact = self._file.tell() > self.max_bytes
+        self.stats['done'] += 1
+        if compact:
+            self.compact()
+
+    def pending(self) -> List[Tuple[int, list]]:
+        """(seq, batch) for every batch not done, oldest first"""
+        with self._lock:
+            pending = sorted(self._pending.items())
+        return [(seq, self.decode(payload)) for seq, payload in pending]
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def compact(self) -> None:
+        """Rewrite the journal with only the pending batches"""
+        tmp_path = self.path + '.compact'
+        with self._sync_lock, self._lock:
+            if self._file is None:
+                return
+            with open(tmp_path, 'wb') as f:
+                for seq, payload in sorted(self._pending.items()):
+                    f.write(self._record(_BATCH, seq, payload))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._file.close()
+            self._file = None
+            self._pending.clear()
+            seq = self._seq
+            self._open()
+            # Keep numbering past batches done and dropped
+            self._seq = max(self._seq, seq)
+            self._written = self._synced = 0
+        self.stats['compactions'] += 1
+
+    def close(self) -> None:
+        """Sync and close the journal"""
+        self.sync()
+        with self._sync_lock, self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,541 @@
+"""
+Package: dynata_rex
+Filename: leases.py
+Author(s): Grant W
+
+Description: Lease based shard assignment between consumer nodes
+"""
+# Python Imports
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# Third Party Imports
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Local Imports
+from .logs import logger
+from .helpers import split_shards
+from .exceptions import RexClientException
+from .opportunity_registry import OpportunityRegistry
+
+
+class LeaseBackend:
+    """
+    Shared store of live members and shard leases.
+
+    Every method must be atomic across the processes and nodes sharing the
+    store. Expiry times are wall clock (time.time()) seconds, so the clocks
+    of the nodes need to be roughly in sync.
+
+    Methods should give up, raising, after `timeout` seconds waiting for
+    the store, so a node notices it cannot renew its leases before they
+    lapse. None means calls may block indefinitely.
+    """
+    timeout: Optional[float] = None
+
+    def heartbeat(self, owner: str, ttl: float) -> None:
+        """Mark owner alive for the next ttl seconds"""
+        raise NotImplementedError
+
+    def members(self) -> List[str]:
+        """Owners whose heartbeat has not expired"""
+        raise NotImplementedError
+
+    def acquire(self, shard: int, owner: str, ttl: float) -> bool:
+        """Take or renew the lease on shard for ttl seconds, False if
+        another owner holds an unexpired lease on it"""
+        raise NotImplementedError
+
+    def release(self, shard: int, owner: str) -> None:
+        """Give up owner's lease on shard"""
+        raise NotImplementedError
+
+    def leave(self, owner: str) -> None:
+        """Remove owner and every lease it holds"""
+        raise NotImplementedError
+
+    def leases(self) -> Dict[int, str]:
+        """Unexpired leases, shard -> owner"""
+        raise NotImplementedError
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """Leases in a SQLite database file shared by every consumer process
+    on a host, or by several hosts on a filesystem with working locks
+
+    @path: database file, created if needed
+    @timeout: seconds to wait for the database lock, at most the
+        coordinator's heartbeat_interval
+    """
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self.path = path
+        self.timeout = timeout
+        with self._transaction() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS members '
+                       '(owner TEXT PRIMARY KEY, expires REAL NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS leases '
+                       '(shard INTEGER PRIMARY KEY, owner TEXT NOT NULL, '
+                       'expires REAL NOT NULL)')
+
+    @contextmanager
+    def _transaction(self):
+        db = sqlite3.connect(self.path,
+                             timeout=self.timeout,
+                             isolation_level=None)
+        try:
+            # Take the write lock up front so reads and writes are atomic
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        finally:
+            db.close()
+
+    def heartbeat(self, owner: str, ttl: float) -> None:
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO members VALUES (?, ?)',
+                       (owner, time.time() + ttl))
+
+    def members(self) -> List[str]:
+        with self._transaction() as db:
+            rows = db.execute('SELECT owner FROM members WHERE expires > ?',
+                              (time.time(),))
+            return [owner for owner, in rows]
+
+    def acquire(self, shard: int, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute('SELECT owner, expires FROM leases '
+                             'WHERE shard = ?', (shard,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            db.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?)',
+                       (shard, owner, now + ttl))
+            return True
+
+    def release(self, shard: int, owner: str) -> None:
+        with self._transaction() as db:
+            db.execute('DELETE FROM leases WHERE shard = ? AND owner = ?',
+                       (shard, owner))
+
+    def leave(self, owner: str) -> None:
+        with self._transaction() as db:
+            db.execute('DELETE FROM leases WHERE owner = ?', (owner,))
+            db.execute('DELETE FROM members WHERE owner = ?', (owner,))
+
+    def leases(self) -> Dict[int, str]:
+        with self._transaction() as db:
+            rows = db.execute('SELECT shard, owner FROM leases '
+                              'WHERE expires > ?', (time.time(),))
+            return dict(rows)
+
+
+class FileLeaseBackend(LeaseBackend):
+    """Leases in a json file in a shared directory, serialized with an
+    exclusive flock on a lock file next to it (POSIX only)
+
+    @directory: shared directory, created if needed
+    @timeout: seconds to wait for the lock, at most the coordinator's
+        heartbeat_interval
+    """
+
+    def __init__(self, directory: str, timeout: float = 1.0):
+        if fcntl is None:
+            raise RexClientException('FileLeaseBackend needs fcntl, use '
+                                     'SqliteLeaseBackend on this platform')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.timeout = timeout
+        self.state_path = os.path.join(directory, 'leases.json')
+        self.lock_path = os.path.join(directory, 'leases.lock')
+
+    @contextmanager
+    def _transaction(self):
+        with open(self.lock_path, 'a') as lock:
+            self._lock(lock)
+            try:
+                try:
+                    with open(self.state_path) as f:
+                        state = json.load(f)
+                except FileNotFoundError:
+                    state = {'members': {}, 'leases': {}}
+                before = json.dumps(state, sort_keys=True)
+                yield state
+                if json.dumps(state, sort_keys=True) != before:
+                    self._write(state)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _lock(self, lock) -> None:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise RexClientException(f"Timed out waiting for "
+                                             f"{self.lock_path}")
+                time.sleep(0.01)
+
+    def _write(self, state: dict) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def heartbeat(self, owner: str, ttl: float) -> None:
+        with self._transaction() as state:
+            state['members'][owner] = time.time() + ttl
+
+    def members(self) -> List[str]:
+        now = time.time()
+        with self._transaction() as state:
+            return [owner for owner, expires in state['members'].items()
+                    if expires > now]
+
+    def acquire(self, shard: int, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._transaction() as state:
+            # json object keys are strings
+            lease = state['leases'].get(str(shard))
+            if lease is not None and lease[0] != owner and lease[1] > now:
+                return False
+            state['leases'][str(shard)] = [owner, now + ttl]
+            return True
+
+    def release(self, shard: int, owner: str) -> None:
+        with self._transaction() as state:
+            lease = state['leases'].get(str(shard))
+            if lease is not None and lease[0] == owner:
+                del state['leases'][str(shard)]
+
+    def leave(self, owner: str) -> None:
+        with self._transaction() as state:
+            state['members'].pop(owner, None)
+            state['leases'] = {shard: lease
+                               for shard, lease in state['leases'].items()
+                               if lease[0] != owner}
+
+    def leases(self) -> Dict[int, str]:
+        now = time.time()
+        with self._transaction() as state:
+            return {int(shard): owner
+                    for shard, (owner, expires) in state['leases'].items()
+                    if expires > now}
+
+
+class ShardCoordinator:
+    """
+    Claims shards through leases so consumer nodes can come and go without
+    renumbering them.
+
+    Every heartbeat_interval the coordinator refreshes its membership,
+    splits the shards into contiguous ranges over the live members (sorted
+    by name) and moves towards its own range: shards outside it are handed
+    back with on_release(), free or expired shards in it are leased and
+    handed to on_acquire(), and held shards are renewed. A shard handed
+    back keeps its lease, renewed every round, until is_released() says
+    its work in flight finished; only then is the lease released for
+    another node to take. A shard whose lease could not be renewed was
+    taken over and is handed to on_release() straight away.
+
+    A shard is only ever consumed by the holder of its lease, so a handover
+    leaves it unconsumed for at most one heartbeat_interval after its last
+    batch, and a node that dies stops holding its shards once lease_ttl
+    passes. A node that cannot renew its leases, ie the backend is
+    unreachable, hands every shard to on_release() once
+    lease_ttl - heartbeat_interval passes since its last complete renewal,
+    before another node may lease them.
+
+    @backend: LeaseBackend shared by every node
+    @shard_count: total shards consuming the Opportunity Registry
+    @on_acquire: callable(shard) to start consuming a shard
+    @on_release: callable(shard) to stop consuming a shard; must stop
+        fetching and handling new batches before it returns, and return
+        promptly: it runs on the heartbeat thread, which renews no leases
+        meanwhile
+    @is_released: callable(shard) returning True once a shard handed to
+        on_release() finished its work in flight, defaults to as soon as
+        on_release() returns
+    @owner: unique name of this node, defaults to host:pid:random
+    @lease_ttl: seconds a lease or heartbeat stays valid without renewal
+    @heartbeat_interval: seconds between rebalances, must be well under
+        lease_ttl and at least the backend's timeout
+    """
+
+    def __init__(self,
+                 backend: LeaseBackend,
+                 shard_count: int,
+                 on_acquire: Callable[[int], Any],
+                 on_release: Callable[[int], Any],
+                 is_released: Optional[Callable[[int], bool]] = None,
+                 owner: Optional[str] = None,
+                 lease_ttl: float = 15.0,
+                 heartbeat_interval: float = 5.0):
+        if heartbeat_interval * 2 > lease_ttl:
+            raise ValueError('heartbeat_interval must be at most half of '
+                             'lease_ttl')
+        if backend.timeout is not None and \
+                backend.timeout > heartbeat_interval:
+            raise ValueError("the backend's timeout must be at most "
+                             "heartbeat_interval")
+        self.backend = backend
+        self.shard_count = shard_count
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.is_released = is_released or (lambda shard: True)
+        self.owner = owner or \
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._owned: Set[int] = set()
+        # Shards handed to on_release() whose lease is kept until they are
+        # released
+        self._releasing: Set[int] = set()
+        # time.monotonic() at the start of the last round that renewed
+        # every owned lease
+        self._renewed = time.monotonic()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def owned(self) -> Set[int]:
+        """Shards currently leased and being consumed by this node"""
+        return set(self._owned)
+
+    def _desired(self) -> Set[int]:
+        members = set(self.backend.members())
+        members.add(self.owner)
+        members = sorted(members)
+        shards = list(range(1, self.shard_count + 1))
+        return set(split_shards(shards, len(members))[
+            members.index(self.owner)])
+
+    def _drop(self, shard: int) -> None:
+        self._owned.discard(shard)
+        self._releasing.add(shard)
+        try:
+            self.on_release(shard)
+        except Exception:
+            logger.exception(f"Error releasing shard {shard}")
+
+    def _overdue(self) -> bool:
+        """True once the owned leases may lapse before the next round"""
+        return bool(self._owned or self._releasing) and \
+            time.monotonic() - self._renewed >= \
+            self.lease_ttl - self.heartbeat_interval
+
+    def rebalance(self) -> Set[int]:
+        """Run one round of heartbeat, renewal and rebalancing, returns the
+        shards owned afterwards. If the round fails once the owned leases
+        are overdue for renewal, every owned shard is dropped before the
+        error is raised."""
+        started = time.monotonic()
+        if not self._owned and not self._releasing:
+            self._renewed = started
+        try:
+            self._rebalance()
+        except Exception:
+            if self._owned and self._overdue():
+                logger.error(f"{self.owner} could not renew its leases in "
+                             f"time, stopping shards {sorted(self._owned)}")
+                for shard in sorted(self._owned):
+                    self._drop(shard)
+            raise
+        self._renewed = started
+        return self.owned
+
+    def _rebalance(self) -> None:
+        self.backend.heartbeat(self.owner, self.lease_ttl)
+        desired = self._desired()
+
+        for shard in sorted(self._owned - desired):
+            self._drop(shard)
+        self._settle(desired)
+
+        for shard in sorted(desired - self._releasing):
+            if self._overdue():
+                raise RexClientException('Lease renewal overdue')
+            held = shard in self._owned
+            if self.backend.acquire(shard, self.owner, self.lease_ttl):
+                if not held:
+                    logger.info(f"{self.owner} acquired shard {shard}")
+                    self._owned.add(shard)
+                    try:
+                        self.on_acquire(shard)
+                    except Exception:
+                        logger.exception(f"Error starting shard {shard}")
+                        self._owned.discard(shard)
+                        self.backend.release(shard, self.owner)
+            elif held:
+                logger.warning(f"{self.owner} lost the lease on shard "
+                               f"{shard}")
+                self._drop(shard)
+
+    def _settle(self, desired: Set[int], renew: bool = True) -> None:
+        """Release the leases of the shards handed back whose work in flight
+        finished, unless desired again, and renew the others"""
+        for shard in sorted(self._releasing):
+            if self.is_released(shard):
+                self._releasing.discard(shard)
+                if shard not in desired:
+                    self.backend.release(shard, self.owner)
+                    logger.info(f"{self.owner} released shard {shard}")
+                continue
+            if not renew:
+                continue
+            if self._overdue():
+                raise RexClientException('Lease renewal overdue')
+            if not self.backend.acquire(shard, self.owner, self.lease_ttl):
+                logger.warning(f"{self.owner} lost the lease on shard "
+                               f"{shard} before it was released")
+                self._releasing.discard(shard)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.rebalance()
+            except Exception:
+                logger.exception('Error rebalancing shards')
+            self._stopping.wait(self.heartbeat_interval)
+
+    def start(self) -> 'ShardCoordinator':
+        """Rebalance every heartbeat_interval on a background thread"""
+        if self._thread is not None:
+            raise RuntimeError('ShardCoordinator already started')
+        self._thread = threading.Thread(target=self._run,
+                                        name='rex-shard-leases',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop consuming every owned shard, wait for them to be released
+        while renewing their leases, and leave, letting the other nodes
+        pick the shards up on their next rebalance"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        for shard in sorted(self._owned):
+            self._drop(shard)
+        renewed = time.monotonic()
+        while True:
+            renew = time.monotonic() - renewed >= self.heartbeat_interval
+            self._settle(set(), renew=renew)
+            if not self._releasing:
+                break
+            if renew:
+                renewed = time.monotonic()
+            time.sleep(min(0.05, self.heartbeat_interval))
+        self.backend.leave(self.owner)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class LeasedConsumer(ShardCoordinator):
+    """
+    ShardCoordinator running registry.consume() for every shard it holds.
+
+    Releasing a shard signals its consumer to stop without waiting for it,
+    so the heartbeat thread keeps renewing the other leases; the batch in
+    flight finishes in the background, see join(), and the shard's lease
+    is only released once its consumer exited.
+
+    @handler: callable(batch) given every batch of every owned shard
+    @access_key: liam access key for REX
+    @secret_key: liam secret key for REX
+    @registry_kwargs: passed to each shard's registry (base_url, ...)
+    @consumer_kwargs: passed to consume() (limit, ...)
+    @invites: consume invites rather than notifications
+    @kwargs: passed to ShardCoordinator (owner, lease_ttl, ...)
+
+    >>> backend = SqliteLeaseBackend('/var/run/rex/leases.db')
+    >>> with LeasedConsumer(backend, 16, handler, key, secret):
+    ...     ...
+    """
+
+    def __init__(self,
+                 backend: LeaseBackend,
+                 shard_count: int,
+                 handler: Callable[[list], Any],
+                 access_key: str,
+                 secret_key: str,
+                 registry_kwargs: Optional[dict] = None,
+                 consumer_kwargs: Optional[dict] = None,
+                 invites: bool = False,
+                 registry_class: type = OpportunityRegistry,
+                 **kwargs):
+        super().__init__(backend,
+                         shard_count,
+                         on_acquire=self._start_shard,
+                         on_release=self._stop_shard,
+                         is_released=self._shard_stopped,
+                         **kwargs)
+        self.handler = handler
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.registry_kwargs = registry_kwargs or {}
+        self.consumer_kwargs = consumer_kwargs or {}
+        self.invites = invites
+        self.registry_class = registry_class
+        self.consumers = {}
+        # shard -> consumer last signalled to stop
+        self._released = {}
+
+    def _start_shard(self, shard: int) -> None:
+        registry = self.registry_class(self.access_key,
+                                       self.secret_key,
+                                       shard_count=self.shard_count,
+                                       current_shard=shard,
+                                       **self.registry_kwargs)
+        consume = registry.consume_invites if self.invites \
+            else registry.consume
+        self.consumers[shard] = consume(self.handler,
+                                        **self.consumer_kwargs)
+
+    def _stop_shard(self, shard: int) -> None:
+        consumer = self.consumers.pop(shard, None)
+        if consumer is not None:
+            # No new batch is fetched or handled once signalled
+            consumer.stop(timeout=0)
+            self._released[shard] = consumer
+
+    def _shard_stopped(self, shard: int) -> bool:
+        consumer = self._released.get(shard)
+        return consumer is None or not consumer.running
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the consumers of released shards to finish their batch
+        in flight"""
+        for consumer in list(self._released.values()):
+            consumer.join(timeout)
+
+    def stop(self) -> None:
+        """Stop consuming every shard and leave, then wait for the batches
+        in flight"""
+        super().stop()
+        self.join()
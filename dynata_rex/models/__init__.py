@@ -16,10 +16,14 @@ from .opportunity_registry import (
     RangeCell,
     ValueCell,
     ListCell,
+    CollectionCell,
+    TargetingCell,
     Links,
     Quota,
     Filter,
+    OpportunityHeader,
     Opportunity,
+    LazyOpportunity,
     Invite
 )
 
@@ -47,10 +51,14 @@ __all__ = [
     'RangeCell',
     'ValueCell',
     'ListCell',
+    'CollectionCell',
+    'TargetingCell',
     'Links',
     'Quota',
     'Filter',
+    'OpportunityHeader',
     'Opportunity',
+    'LazyOpportunity',
     'GatewayGenderEnum',
     'GatewayDispositionsEnum',
     'GatewayStatusEnum',
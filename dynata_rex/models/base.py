@@ -14,6 +14,24 @@ from pydantic import BaseModel
 
 # Local Imports
 
+# Key the cached hash is kept under in the instance __dict__. It is not a
+# field or a private attribute, so pydantic ignores it when comparing or
+# dumping models.
+_HASH_KEY = '__structural_hash__'
+
+
+def _freeze(value):
+    """Hashable stand-in for a field value. Models are kept as is so their
+    own (cached) __hash__ is reused."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
 
 class BaseObject:
     def __str__(self):
@@ -23,15 +41,47 @@ class BaseObject:
 class HashableModel(BaseObject, BaseModel):
     """
     Base class for all objects in the Opportunity Registry
+
+    Hashes on the structure of the field values. Frozen models compute the
+    hash once and cache it, so nested models are only hashed the first time
+    their parent is.
     """
     def __hash__(self):
+        cached = self.__dict__.get(_HASH_KEY)
+        if cached is not None:
+            return cached
         try:
-            return hash((type(self),) + tuple(self.__dict__.values()))
+            value = hash((type(self),) + tuple(
+                _freeze(getattr(self, name))
+                for name in type(self).model_fields))
         except TypeError:
-            _json = self.json(sort_keys=True)
+            _json = self.model_dump_json()
             to_hash = str(type(self)) + _json
             digest = hashlib.sha256(to_hash.encode('utf-8')).hexdigest()
-            return int(digest, 16) % 10**19
+            value = int(digest, 16) % 10**19
+        if self.model_config.get('frozen'):
+            self.__dict__[_HASH_KEY] = value
+        return value
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        if _HASH_KEY in state['__dict__']:
+            # String hashes are seeded per process, so the cached value is
+            # wrong wherever the model is unpickled
+            state['__dict__'] = {key: value for key, value
+                                 in state['__dict__'].items()
+                                 if key != _HASH_KEY}
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.__dict__.pop(_HASH_KEY, None)
+
+    def model_copy(self, *, update=None, deep=False):
+        copied = super().model_copy(update=update, deep=deep)
+        # The copy may differ from the original, hash it afresh
+        copied.__dict__.pop(_HASH_KEY, None)
+        return copied
 
 
 class FallbackEnum(Enum):
@@ -7,11 +7,12 @@ Description: Implementation of dataclasses for Opportunity Registry opps
 """
 # Python Imports
 from enum import Enum
-from typing import List, Optional, Union
-from typing_extensions import Literal
+from functools import cached_property
+from typing import Any, List, Optional, Union
+from typing_extensions import Annotated, Literal
 
 # Third Party Imports
-from pydantic import Field, HttpUrl
+from pydantic import ConfigDict, Field, HttpUrl, TypeAdapter
 
 # Local Imports
 from .base import HashableModel, FallbackEnum
@@ -79,16 +80,22 @@ class CellTypeEnum(Enum):
 
 
 class Locale(HashableModel):
+    model_config = ConfigDict(frozen=True)
+
     language: str
     country: str
 
 
 class Range(HashableModel):
+    model_config = ConfigDict(frozen=True)
+
     from_: Union[int, None] = Field(alias='from')
     to: Union[int, None] = None
 
 
 class Cell(HashableModel):
+    model_config = ConfigDict(frozen=True)
+
     tag: str
     attribute_id: int
     negate: bool
@@ -115,12 +122,24 @@ class CollectionCell(Cell):
     collection_: str = Field(alias='collection')
 
 
+# `kind` routes each cell straight to its class instead of trying every
+# member of the union in turn
+TargetingCell = Annotated[
+    Union[RangeCell, ListCell, ValueCell, CollectionCell],
+    Field(discriminator='kind')
+]
+
+
 class Links(HashableModel):
+    model_config = ConfigDict(frozen=True)
+
     live: HttpUrl
     # test: HttpUrl
 
 
 class Quota(HashableModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     cells: List[str]
     count: int
@@ -128,15 +147,16 @@ class Quota(HashableModel):
 
 
 class Filter(HashableModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     cells: List[str]
 
 
-class Opportunity(HashableModel):
-    class Config:
-        allow_population_by_field_name = True
-        validate_assignment = True
-        allow_mutation = False
+class OpportunityHeader(HashableModel):
+    """Every Opportunity field except the targeting (filters, cells and
+    quotas)"""
+    model_config = ConfigDict(frozen=True)
 
     id: int
     status: StatusEnum
@@ -156,15 +176,64 @@ class Opportunity(HashableModel):
     category_exclusions: List[CategoryEnum]
     category_ids: List[CategoryEnum]
     devices: List[DevicesEnum]
+
+
+class Opportunity(OpportunityHeader):
+    model_config = ConfigDict(populate_by_name=True,
+                              validate_assignment=True,
+                              frozen=True)
+
     filters: List[List[Filter]]
-    cells: List[Union[RangeCell, ListCell, ValueCell, CollectionCell]]
+    cells: List[TargetingCell]
     quotas: List[List[Quota]]
 
 
+_FILTERS = TypeAdapter(List[List[Filter]])
+_CELLS = TypeAdapter(List[TargetingCell])
+_QUOTAS = TypeAdapter(List[List[Quota]])
+
+
+class LazyOpportunity(OpportunityHeader):
+    """
+    Opportunity that validates its header fields eagerly but keeps the raw
+    targeting payload, validating `filters`, `cells` and `quotas` (and
+    caching the result) only when they are first accessed.
+
+    Invalid targeting raises pydantic.ValidationError on that first access
+    rather than when the opportunity is parsed.
+    """
+    model_config = ConfigDict(populate_by_name=True)
+
+    raw_filters: Any = Field(alias='filters')
+    raw_cells: Any = Field(alias='cells')
+    raw_quotas: Any = Field(alias='quotas')
+
+    @cached_property
+    def filters(self) -> List[List[Filter]]:
+        return _FILTERS.validate_python(self.raw_filters)
+
+    @cached_property
+    def cells(self) -> List[TargetingCell]:
+        return _CELLS.validate_python(self.raw_cells)
+
+    @cached_property
+    def quotas(self) -> List[List[Quota]]:
+        return _QUOTAS.validate_python(self.raw_quotas)
+
+    def to_opportunity(self) -> Opportunity:
+        """Fully validated Opportunity for this notification"""
+        header = {name: getattr(self, name)
+                  for name in OpportunityHeader.model_fields}
+        return Opportunity.model_construct(filters=self.filters,
+                                           cells=self.cells,
+                                           quotas=self.quotas,
+                                           **header)
+
+
 class Invite(HashableModel):
     id: int
     collection_id: str
     respondent_id: str
-    expiration: Optional[int]
+    expiration: Optional[int] = None
     modified: str
     created: str
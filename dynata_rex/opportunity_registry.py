@@ -7,7 +7,9 @@ Description: API interaction for smor
 """
 # Python Imports
 import json
-from typing import List
+import os
+import tempfile
+from typing import Any, BinaryIO, Callable, Iterator, List, Tuple, Union
 
 # Third Party Imports
 import pydantic
@@ -15,12 +17,30 @@ import pydantic
 # Local Imports
 import dynata_rex.models as models
 from .signer import RexRequest
+from .consumer import Consumer
+from .adaptive_limit import AdaptiveLimit
+from .ack_buffer import AckBuffer
+from .journal import Journal
+from .collection_index import CollectionCache
+from .disk_cache import CollectionDiskCache, MappedCollection
+from .helpers import iter_lines, DEFAULT_CHUNK_SIZE
 from .logs import logger
 from .exceptions import InvalidShardException
 
+# Built once, validating a whole response body straight from bytes
+_OPPORTUNITIES = pydantic.TypeAdapter(List[models.Opportunity])
+_LAZY_OPPORTUNITIES = pydantic.TypeAdapter(List[models.LazyOpportunity])
+_INVITES = pydantic.TypeAdapter(List[models.Invite])
 
-class OpportunityRegistry:
+
+class BaseOpportunityRegistry:
+    """
+    Endpoints, payloads and parsing shared by OpportunityRegistry and
+    aio.AsyncOpportunityRegistry. Calls to the registry return whatever
+    _requester_class returns, a result or an awaitable.
+    """
     _BASE_URL = 'https://registry.rex.dynata.com'
+    _requester_class = RexRequest
 
     def __init__(self,
                  access_key: str,
@@ -28,7 +48,9 @@ class OpportunityRegistry:
                  base_url: str = _BASE_URL,
                  default_ttl: int = 10,
                  shard_count: int = 1,
-                 current_shard: int = 1):
+                 current_shard: int = 1,
+                 session=None,
+                 circuit_breaker=None):
         """
         @access_key: liam access key for REX
         @secret_key: liam secret key for REX
@@ -38,11 +60,18 @@ class OpportunityRegistry:
         @shard_count  : number of total shards consuming Opportunity Registry
         @current_shard: curent shard
         @default_ttl: time to live for signature in seconds
+        @session: http session to share between clients, ie
+            helpers.get_shared_session()
+        @circuit_breaker: CircuitBreaker to fail fast on degraded endpoints
         """
         self.default_ttl = default_ttl
-        self.make_request = RexRequest(access_key,
-                                       secret_key,
-                                       default_ttl=default_ttl)
+        self.make_request = self._requester_class(
+            access_key,
+            secret_key,
+            default_ttl=default_ttl,
+            session=session,
+            circuit_breaker=circuit_breaker
+        )
         self.base_url = self._format_base_url(base_url)
 
         if current_shard > shard_count:
@@ -77,18 +106,27 @@ class OpportunityRegistry:
         }
         return self.make_request.post(endpoint, data)
 
-    def _receive_notifications(self, limit: int = 10) -> List[dict]:
-        """Raw receive notifications"""
-        endpoint = f"{self.base_url}/receive-notifications"
-        data = {
+    def _receive_notifications_payload(self, limit: int) -> dict:
+        return {
             "limit": limit,
             "shards": {
                 "count": self.shard_count,
                 "current": self.current_shard
             }
         }
+
+    def _receive_notifications(self, limit: int = 10) -> List[dict]:
+        """Raw receive notifications"""
+        endpoint = f"{self.base_url}/receive-notifications"
+        data = self._receive_notifications_payload(limit)
         return self.make_request.post(endpoint, data)
 
+    def _receive_notifications_raw(self, limit: int = 10) -> bytes:
+        """Raw receive notifications as undecoded response bytes"""
+        endpoint = f"{self.base_url}/receive-notifications"
+        data = self._receive_notifications_payload(limit)
+        return self.make_request.post_raw(endpoint, data)
+
     def _receive_invites(self, limit: int = 10) -> list[dict]:
         """Raw receive invites"""
         endpoint = f"{self.base_url}/receive_invites"
@@ -97,48 +135,72 @@ class OpportunityRegistry:
         }
         return self.make_request.post(endpoint, data)
 
-    def list_opportunities(self, limit: int = 10) -> List[models.Opportunity]:
-        """
-        [Deprecated - please use receive_notifications()]
-        Get opportunities from Opportunity Registry"""
-        opportunities = self._list_opportunities(limit=limit)
-        out = []
-        for opp in opportunities:
-            try:
-                out.append(models.Opportunity(**opp))
-            except pydantic.error_wrappers.ValidationError:
-                opportunity_id = opp['id']
-                logger.warning(
-                    f"Unable to parse {opportunity_id}, excluding...")
-                logger.warning(json.dumps(opp, indent=4))
-                # Ack opportunity so we don't see it again
-                self.ack_opportunity(opportunity_id)
-
-        return out
+    def _receive_invites_raw(self, limit: int = 10) -> bytes:
+        """Raw receive invites as undecoded response bytes"""
+        endpoint = f"{self.base_url}/receive_invites"
+        data = {
+            "limit": limit
+        }
+        return self.make_request.post_raw(endpoint, data)
 
-    def receive_notifications(self,
-                              limit: int = 10) -> List[models.Opportunity]:
-        """Get opportunity notifications from Opportunity Registry"""
-        opportunities = self._receive_notifications(limit=limit)
+    def _parse_opportunities(self, opportunities: List[dict]
+                             ) -> Tuple[List[models.Opportunity], List[int]]:
+        """Convert raw opportunities into models, returning the parsed
+        opportunities and the ids of those that could not be parsed"""
         out = []
+        invalid = []
         for opp in opportunities:
             try:
                 out.append(models.Opportunity(**opp))
-            except pydantic.error_wrappers.ValidationError:
+            except pydantic.ValidationError:
                 opportunity_id = opp['id']
                 logger.warning(
                     f"Unable to parse {opportunity_id}, excluding...")
                 logger.warning(json.dumps(opp, indent=4))
-                # Ack notification so we don't see it again
-                self.ack_notification(opportunity_id)
+                invalid.append(opportunity_id)
+        return out, invalid
 
-        return out
+    def _parse_opportunities_json(self, raw: bytes, lazy: bool = False
+                                  ) -> Tuple[List[models.Opportunity],
+                                             List[int]]:
+        """Validate a raw json array of opportunities straight into models,
+        returning the parsed opportunities and the ids of those that could
+        not be parsed"""
+        adapter = _LAZY_OPPORTUNITIES if lazy else _OPPORTUNITIES
+        return self._validate_json_batch(adapter, raw)
 
-    def get_opportunity(self, opportunity_id: int) -> models.Opportunity:
-        """Get specific opportunity from SMOR
+    def _validate_json_batch(self,
+                             adapter: pydantic.TypeAdapter,
+                             raw: bytes) -> Tuple[list, list]:
+        """Validate a json array with a cached list TypeAdapter.
+
+        The whole batch is validated from bytes in one pass; only when some
+        items fail is the array decoded so the valid items can be kept and
+        the ids of the invalid ones returned.
         """
-        opportunity = self._get_opportunity(opportunity_id)
-        return models.Opportunity(**opportunity)
+        if not raw.strip():
+            return [], []
+        try:
+            return adapter.validate_json(raw), []
+        except pydantic.ValidationError as e:
+            errors = e.errors()
+            if not all(error['loc'] and isinstance(error['loc'][0], int)
+                       for error in errors):
+                # Not a json array of items, nothing to isolate
+                raise
+        failed = {error['loc'][0] for error in errors}
+        items = self.make_request.codec.loads(raw)
+        invalid = []
+        for index in sorted(failed):
+            item = items[index]
+            item_id = item.get('id') if isinstance(item, dict) else None
+            logger.warning(f"Unable to parse {item_id}, excluding...")
+            logger.warning(json.dumps(item, indent=4))
+            if item_id is not None:
+                invalid.append(item_id)
+        valid = [item for index, item in enumerate(items)
+                 if index not in failed]
+        return adapter.validate_python(valid), invalid
 
     def list_project_opportunities(self, project_id: int) -> List[int]:
         """List related opportunities from a project id"""
@@ -172,12 +234,14 @@ class OpportunityRegistry:
         res = self.make_request.post(endpoint, opportunities)
         return res
 
-    def download_collection(self, collection_id: str) -> list:
-        """Download targeting from a collection cell"""
+    def iter_collection_chunks(self,
+                               collection_id: str,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE
+                               ) -> Iterator[bytes]:
+        """Stream the raw bytes of a collection as they are received"""
         endpoint = f"{self.base_url}/download-collection"
         data = {"id": str(collection_id)}
-        res = self.make_request.post(endpoint, data)
-        return str(res).split('\n')
+        return self.make_request.stream(endpoint, data, chunk_size=chunk_size)
 
     def ack_invites(self, invites: list[int]) -> None:
         """Acknowledge a list of invites"""
@@ -185,25 +249,284 @@ class OpportunityRegistry:
         res = self.make_request.post(endpoint, invites)
         return res
 
-    def receive_invites(self, limit: int = 10) -> List[models.Invite]:
-        """Receive invites from opportunity registry"""
-        invites = self._receive_invites(limit=limit)
+    def _parse_invites(self, invites: List[dict]
+                       ) -> Tuple[List[models.Invite], List[int]]:
+        """Convert raw invites into models, returning the parsed invites
+        and the ids of those that could not be parsed"""
         out = []
+        invalid = []
         for inv in invites:
             try:
                 out.append(models.Invite(**inv))
-            except pydantic.error_wrappers.ValidationError:
+            except pydantic.ValidationError:
                 invite_id = inv['id']
                 logger.warning(
                     f"Unable to parse {invite_id}, excluding...")
                 logger.warning(json.dumps(inv, indent=4))
-                # Ack invites so we don't see it again
-                self.ack_invites(invite_id)
+                invalid.append(invite_id)
+        return out, invalid
+
+    def _parse_invites_json(self, raw: bytes
+                            ) -> Tuple[List[models.Invite], List[int]]:
+        """Validate a raw json array of invites straight into models,
+        returning the parsed invites and the ids of those that could not be
+        parsed"""
+        return self._validate_json_batch(_INVITES, raw)
+
+    def iter_invite_collection_chunks(self,
+                                      invite_id: str,
+                                      chunk_size: int = DEFAULT_CHUNK_SIZE
+                                      ) -> Iterator[bytes]:
+        """Stream the raw bytes of an invite collection as they are
+        received"""
+        endpoint = f"{self.base_url}/download-invite-collection"
+        data = {"id": invite_id}
+        return self.make_request.stream(endpoint, data, chunk_size=chunk_size)
+
+
+class OpportunityRegistry(BaseOpportunityRegistry):
+    """
+    Client for the Opportunity Registry, with the threaded helpers
+    (consume, AckBuffer, collection caches) built on its blocking calls.
+    """
+
+    def list_opportunities(self, limit: int = 10) -> List[models.Opportunity]:
+        """
+        [Deprecated - please use receive_notifications()]
+        Get opportunities from Opportunity Registry"""
+        opportunities = self._list_opportunities(limit=limit)
+        out, invalid = self._parse_opportunities(opportunities)
+        for opportunity_id in invalid:
+            # Ack opportunity so we don't see it again
+            self.ack_opportunity(opportunity_id)
+
+        return out
+
+    def receive_notifications(self,
+                              limit: int = 10,
+                              lazy: bool = False,
+                              acks: AckBuffer = None
+                              ) -> List[models.Opportunity]:
+        """Get opportunity notifications from Opportunity Registry
+
+        @lazy: return LazyOpportunity objects, deferring validation of
+            filters, cells and quotas until they are accessed
+        @acks: AckBuffer to queue the ids of invalid notifications on,
+            instead of acknowledging them with a request of their own
+        """
+        raw = self._receive_notifications_raw(limit=limit)
+        out, invalid = self._parse_opportunities_json(raw, lazy=lazy)
+        # Ack notifications so we don't see them again
+        if acks is not None:
+            acks.add(invalid)
+        elif invalid:
+            self.ack_notifications(invalid)
+        return out
+
+    def notification_acks(self,
+                          max_size: int = 100,
+                          max_delay: float = 1.0) -> AckBuffer:
+        """AckBuffer batching ids into ack_notifications() calls"""
+        return AckBuffer(self.ack_notifications, max_size, max_delay)
+
+    def consume(self,
+                handler: Callable[[List[models.Opportunity]], Any],
+                limit: Union[int, AdaptiveLimit] = 10,
+                lazy: bool = False,
+                journal: Union[str, Journal] = None,
+                **kwargs) -> Consumer:
+        """Start a Consumer handing notification batches to `handler` while
+        the next batch is fetched, acknowledging each batch once handled.
+
+        @limit: notifications per poll, or an AdaptiveLimit to size polls
+            to the backlog and the handler
+        @lazy: hand over LazyOpportunity objects
+        @journal: path of a Journal (or a Journal) to write batches to so
+            they are acknowledged as soon as received and replayed after a
+            restart until handled, see Consumer
+        @kwargs: passed to Consumer (prefetch, idle_delay, ...)
+
+        >>> consumer = registry.consume(handle_opportunities)
+        >>> ...
+        >>> consumer.stop()
+        """
+        acks = self.notification_acks()
+
+        def fetch(limit):
+            return self.receive_notifications(limit=limit,
+                                              lazy=lazy,
+                                              acks=acks)
+
+        adapter = _LAZY_OPPORTUNITIES if lazy else _OPPORTUNITIES
+        return Consumer(fetch,
+                        handler,
+                        acks,
+                        limit=limit,
+                        journal=self._journal(journal, adapter),
+                        **kwargs).start()
+
+    @staticmethod
+    def _journal(journal: Union[str, Journal, None],
+                 adapter: pydantic.TypeAdapter) -> Journal:
+        """Journal at a path storing batches of adapter's models"""
+        if journal is None or isinstance(journal, Journal):
+            return journal
+        return Journal(journal,
+                       encode=lambda batch: adapter.dump_json(batch,
+                                                              by_alias=True),
+                       decode=adapter.validate_json)
+
+    def get_opportunity(self, opportunity_id: int) -> models.Opportunity:
+        """Get specific opportunity from SMOR
+        """
+        opportunity = self._get_opportunity(opportunity_id)
+        return models.Opportunity(**opportunity)
+
+    def download_collection(self, collection_id: str) -> list:
+        """Download targeting from a collection cell"""
+        return list(self.iter_collection(collection_id))
+
+    def collection_cache(self,
+                         disk_cache: CollectionDiskCache = None,
+                         **compile_kwargs) -> CollectionCache:
+        """Collection id -> CompiledCollection, downloaded on first use
+        and shared by every opportunity referencing it, see
+        collection_index.CompiledCollection for compile_kwargs
+
+        @disk_cache: map collections from this cache, downloading only
+            the ones it does not hold yet
+        """
+        if disk_cache is None:
+            return CollectionCache(self.iter_collection, **compile_kwargs)
+        return CollectionCache(
+            lambda collection_id: self.cached_collection(collection_id,
+                                                         disk_cache),
+            **compile_kwargs)
+
+    def cached_collection(self,
+                          collection_id: str,
+                          disk_cache: CollectionDiskCache
+                          ) -> MappedCollection:
+        """A collection mapped from the disk cache, downloaded into it
+        first if needed"""
+        return disk_cache.get_or_load(
+            f"collection-{collection_id}",
+            lambda: self.iter_collection(collection_id))
+
+    def iter_collection(self,
+                        collection_id: str,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE
+                        ) -> Iterator[str]:
+        """Stream the lines of a collection without holding the whole
+        download in memory"""
+        return iter_lines(self.iter_collection_chunks(collection_id,
+                                                      chunk_size))
+
+    def download_collection_to_file(self,
+                                    collection_id: str,
+                                    destination: Union[str, BinaryIO],
+                                    chunk_size: int = DEFAULT_CHUNK_SIZE
+                                    ) -> int:
+        """Spool a collection to a path or binary file object, returns the
+        number of bytes written"""
+        return self._spool(self.iter_collection_chunks(collection_id,
+                                                       chunk_size),
+                           destination)
+
+    @staticmethod
+    def _spool(chunks: Iterator[bytes],
+               destination: Union[str, BinaryIO]) -> int:
+        """Write chunks to destination. Paths are written to a temporary
+        file first and moved into place once the download completes."""
+        if not isinstance(destination, (str, os.PathLike)):
+            written = 0
+            for chunk in chunks:
+                written += destination.write(chunk)
+            return written
+
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                written = OpportunityRegistry._spool(chunks, f)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return written
+
+    def receive_invites(self,
+                        limit: int = 10,
+                        acks: AckBuffer = None) -> List[models.Invite]:
+        """Receive invites from opportunity registry
+
+        @acks: AckBuffer to queue the ids of invalid invites on, instead of
+            acknowledging them with a request of their own
+        """
+        raw = self._receive_invites_raw(limit=limit)
+        out, invalid = self._parse_invites_json(raw)
+        # Ack invites so we don't see them again
+        if acks is not None:
+            acks.add(invalid)
+        elif invalid:
+            self.ack_invites(invalid)
         return out
 
+    def consume_invites(self,
+                        handler: Callable[[List[models.Invite]], Any],
+                        limit: Union[int, AdaptiveLimit] = 10,
+                        journal: Union[str, Journal] = None,
+                        **kwargs) -> Consumer:
+        """Start a Consumer handing invite batches to `handler`, see
+        consume()"""
+        acks = self.invite_acks()
+
+        def fetch(limit):
+            return self.receive_invites(limit=limit, acks=acks)
+
+        return Consumer(fetch,
+                        handler,
+                        acks,
+                        limit=limit,
+                        journal=self._journal(journal, _INVITES),
+                        **kwargs).start()
+
+    def invite_acks(self,
+                    max_size: int = 100,
+                    max_delay: float = 1.0) -> AckBuffer:
+        """AckBuffer batching ids into ack_invites() calls"""
+        return AckBuffer(self.ack_invites, max_size, max_delay)
+
     def download_invite_collection(self, invite_id: str) -> list:
         """Download invite collection from opportunity registry"""
-        endpoints = f"{self.base_url}/download-invite-collection"
-        data = {"id": invite_id}
-        res = self.make_request.post(endpoints, data)
-        return str(res).split('\n')
+        return list(self.iter_invite_collection(invite_id))
+
+    def cached_invite_collection(self,
+                                 invite_id: str,
+                                 disk_cache: CollectionDiskCache
+                                 ) -> MappedCollection:
+        """An invite collection mapped from the disk cache, downloaded
+        into it first if needed"""
+        return disk_cache.get_or_load(
+            f"invite-{invite_id}",
+            lambda: self.iter_invite_collection(invite_id))
+
+    def iter_invite_collection(self,
+                               invite_id: str,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE
+                               ) -> Iterator[str]:
+        """Stream the lines of an invite collection without holding the
+        whole download in memory"""
+        return iter_lines(self.iter_invite_collection_chunks(invite_id,
+                                                             chunk_size))
+
+    def download_invite_collection_to_file(self,
+                                           invite_id: str,
+                                           destination: Union[str, BinaryIO],
+                                           chunk_size: int = DEFAULT_CHUNK_SIZE
+                                           ) -> int:
+        """Spool an invite collection to a path or binary file object,
+        returns the number of bytes written"""
+        return self._spool(self.iter_invite_collection_chunks(invite_id,
+                                                              chunk_size),
+                           destination)
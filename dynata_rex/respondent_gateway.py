@@ -27,12 +27,15 @@ class RespondentGateway:
     """
 
     _BASE_URL = 'https://respondent.rex.dynata.com'
+    _requester_class = RexRequest
 
     def __init__(self,
                  access_key: str,
                  secret_key: str,
                  base_url: str = _BASE_URL,
-                 default_ttl: int = 10):
+                 default_ttl: int = 10,
+                 session=None,
+                 circuit_breaker=None):
         """
         @access_key: liam access key for REX
         @secret_key: liam secret key for REX
@@ -40,6 +43,9 @@ class RespondentGateway:
         # Optional
         @base_url: url of Gateway
         @ttl: time to live for signature in seconds
+        @session: http session to share between clients, ie
+            helpers.get_shared_session()
+        @circuit_breaker: CircuitBreaker to fail fast on degraded endpoints
         """
         self.access_key = access_key
         self.secret_key = secret_key
@@ -47,9 +53,13 @@ class RespondentGateway:
         self.base_url = base_url
 
         # MR for API requests
-        self.make_request = RexRequest(access_key,
-                                       secret_key,
-                                       default_ttl=default_ttl)
+        self.make_request = self._requester_class(
+            access_key,
+            secret_key,
+            default_ttl=default_ttl,
+            session=session,
+            circuit_breaker=circuit_breaker
+        )
         # Signer for signing/verifying URLs
         self.signer = Signer(access_key, secret_key, default_ttl=default_ttl)
 
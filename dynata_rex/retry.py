@@ -0,0 +1,232 @@
+"""
+Package: dynata_rex
+Filename: retry.py
+Author(s): Grant W
+
+Description: Retry policies shared by the sync and asyncio requesters
+"""
+# Python Imports
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Union
+
+# Third Party Imports
+
+# Local Imports
+
+DEFAULT_RETRIES = int(os.environ.get('DEFAULT_RETRIES', '3'))
+
+
+class RetryClass:
+    """
+    Backoff settings for one kind of failure
+
+    @name: label used in logs
+    @base_delay: smallest sleep in seconds between attempts
+    @max_delay: largest sleep in seconds between attempts
+    @max_attempts: cap on total attempts for this kind of failure, defaults
+        to the policy's max_attempts
+    """
+    def __init__(self,
+                 name: str,
+                 base_delay: float = 1.0,
+                 max_delay: float = 30.0,
+                 max_attempts: Optional[int] = None):
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+    def __repr__(self):
+        return (f"RetryClass({self.name!r}, base_delay={self.base_delay}, "
+                f"max_delay={self.max_delay}, "
+                f"max_attempts={self.max_attempts})")
+
+
+CONNECTION_ERROR = RetryClass('connection', base_delay=2.0, max_delay=16.0)
+TIMEOUT = RetryClass('timeout', base_delay=1.0, max_delay=8.0)
+THROTTLED = RetryClass('throttled', base_delay=2.0, max_delay=60.0)
+UNAVAILABLE = RetryClass('unavailable', base_delay=1.0, max_delay=30.0)
+BAD_GATEWAY = RetryClass('bad_gateway', base_delay=0.5, max_delay=8.0)
+
+DEFAULT_STATUS_CLASSES = {
+    429: THROTTLED,
+    502: BAD_GATEWAY,
+    503: UNAVAILABLE,
+}
+
+
+class RetryBudget:
+    """
+    Token bucket capping retries to a share of requests.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so
+    over time at most `ratio` of the traffic can be retries. `min_tokens` is
+    the starting allowance so a fresh client can still retry, `max_tokens`
+    bounds the burst of retries after a long calm period.
+    """
+    def __init__(self,
+                 ratio: float = 0.2,
+                 min_tokens: float = 10.0,
+                 max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def deposit(self) -> None:
+        """Record a new request"""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Try to spend a retry, False if the budget is exhausted"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    Decides whether, and how long to wait before, retrying a request.
+
+    @max_attempts: total attempts per request, including the first
+    @status_classes: response status code -> RetryClass to retry it with
+    @connection_class: RetryClass for connection errors, None to not retry
+    @timeout_class: RetryClass for read timeouts, None to not retry
+    @deadline: seconds a request may take across all attempts and sleeps
+    @budget: RetryBudget shared by every request using this policy,
+        defaults to a new RetryBudget() per policy
+    @respect_retry_after: honour the Retry-After header on retried statuses;
+        a Retry-After longer than the class' max_delay, or than the time
+        left before the deadline, is not waited for and the response is
+        returned as is
+
+    Sleeps use decorrelated jitter: a random value between the class'
+    base_delay and three times the previous sleep, capped at max_delay.
+    """
+    def __init__(self,
+                 max_attempts: int = DEFAULT_RETRIES,
+                 status_classes: Optional[Dict[int, RetryClass]] = None,
+                 connection_class: Optional[RetryClass] = CONNECTION_ERROR,
+                 timeout_class: Optional[RetryClass] = None,
+                 deadline: Optional[float] = None,
+                 budget: Optional[RetryBudget] = None,
+                 respect_retry_after: bool = True):
+        self.max_attempts = max_attempts
+        if status_classes is None:
+            status_classes = dict(DEFAULT_STATUS_CLASSES)
+        self.status_classes = status_classes
+        self.connection_class = connection_class
+        self.timeout_class = timeout_class
+        self.deadline = deadline
+        self.budget = budget if budget is not None else RetryBudget()
+        self.respect_retry_after = respect_retry_after
+
+    @classmethod
+    def disabled(cls) -> 'RetryPolicy':
+        """A policy that never retries"""
+        return cls(max_attempts=1,
+                   status_classes={},
+                   connection_class=None,
+                   timeout_class=None)
+
+    def classify_status(self, status_code: int) -> Optional[RetryClass]:
+        return self.status_classes.get(status_code)
+
+    def start(self) -> 'RetryState':
+        """Begin tracking a new request"""
+        self.budget.deposit()
+        return RetryState(self)
+
+
+class RetryState:
+    """Retry bookkeeping for a single request, from RetryPolicy.start()"""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.attempt = 1
+        self.started = time.monotonic()
+        self._class_attempts = {}
+        self._last_delay = None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, None if there is no deadline"""
+        if self.policy.deadline is None:
+            return None
+        return self.policy.deadline - (time.monotonic() - self.started)
+
+    def attempt_timeout(self, timeout):
+        """Shrink a requests-style timeout so an attempt can't outlive the
+        deadline"""
+        remaining = self.remaining()
+        if remaining is None or not isinstance(timeout, (int, float)):
+            return timeout
+        return max(min(timeout, remaining), 0.001)
+
+    def next_delay(self,
+                   retry_class: Optional[RetryClass],
+                   retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if the request
+        should not be retried"""
+        if retry_class is None:
+            return None
+        max_attempts = retry_class.max_attempts or self.policy.max_attempts
+        class_attempts = self._class_attempts.get(retry_class.name, 1)
+        if self.attempt >= self.policy.max_attempts or \
+                class_attempts >= max_attempts:
+            return None
+
+        previous = self._last_delay or retry_class.base_delay
+        delay = min(retry_class.max_delay,
+                    random.uniform(retry_class.base_delay, previous * 3))
+        if retry_after is not None and self.policy.respect_retry_after:
+            if retry_after > retry_class.max_delay:
+                # Not worth blocking the caller for, let it decide
+                return None
+            delay = max(delay, retry_after)
+
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        if not self.policy.budget.withdraw():
+            return None
+
+        self.attempt += 1
+        self._class_attempts[retry_class.name] = class_attempts + 1
+        self._last_delay = delay
+        return delay
+
+
+def parse_retry_after(value: Union[str, None]) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) to seconds,
+    None if it is missing or not a finite delay"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        if not math.isfinite(seconds):
+            return None
+        return max(seconds, 0.0)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
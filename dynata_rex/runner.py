@@ -0,0 +1,254 @@
+"""
+Package: dynata_rex
+Filename: runner.py
+Author(s): Grant W
+
+Description: Multi-process runner consuming every shard of the registry
+"""
+# Python Imports
+import multiprocessing
+import os
+import queue
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Third Party Imports
+
+# Local Imports
+from .logs import logger
+from .helpers import split_shards
+from .opportunity_registry import OpportunityRegistry
+
+# Consumer stats that are gauges rather than counters, not summed
+_GAUGES = {'limit'}
+
+
+def _run_worker(shards: List[int],
+                handler: Callable,
+                access_key: str,
+                secret_key: str,
+                shard_count: int,
+                registry_class: type,
+                registry_kwargs: dict,
+                consumer_kwargs: dict,
+                invites: bool,
+                stats_interval: float,
+                stats_queue,
+                stopping) -> None:
+    """Worker process body: consume `shards` until `stopping` is set,
+    reporting each consumer's stats every `stats_interval` seconds"""
+    consumers = []
+
+    def report():
+        for shard, consumer in consumers:
+            stats_queue.put((shard, os.getpid(), dict(consumer.stats)))
+
+    try:
+        for shard in shards:
+            registry = registry_class(access_key,
+                                      secret_key,
+                                      shard_count=shard_count,
+                                      current_shard=shard,
+                                      **registry_kwargs)
+            consume = registry.consume_invites if invites \
+                else registry.consume
+            consumers.append((shard, consume(handler, **consumer_kwargs)))
+        while not stopping.wait(stats_interval):
+            report()
+            for shard, consumer in consumers:
+                if not consumer.running:
+                    raise RuntimeError(f"Consumer for shard {shard} died")
+    finally:
+        for _, consumer in consumers:
+            consumer.stop()
+        report()
+
+
+class ShardRunner:
+    """
+    Runs a consumer for every shard across worker processes, restarting
+    workers that exit unexpectedly and aggregating their stats.
+
+    @handler: callable(batch) passed to registry.consume() in every worker.
+        Must be picklable (a module level function) when processes are
+        spawned rather than forked
+    @access_key: liam access key for REX
+    @secret_key: liam secret key for REX
+    @shard_count: total shards consuming the Opportunity Registry
+    @shards: shard numbers this runner consumes, defaults to all of
+        1..shard_count. Lets several nodes split the shards between them
+    @processes: worker processes, defaults to one per shard up to the
+        number of CPUs. Each worker consumes a contiguous range of shards
+    @registry_kwargs: passed to the registry in each worker (base_url, ...)
+    @consumer_kwargs: passed to consume() in each worker (limit, ...)
+    @invites: consume invites rather than notifications
+    @restart_delay: seconds to wait before restarting a crashed worker
+    @stats_interval: seconds between stats reports from the workers
+    @registry_class: registry built in each worker
+
+    >>> runner = ShardRunner(handle, key, secret, shard_count=8)
+    >>> runner.run()  # until KeyboardInterrupt or runner.stop()
+    """
+
+    def __init__(self,
+                 handler: Callable[[list], Any],
+                 access_key: str,
+                 secret_key: str,
+                 shard_count: int,
+                 shards: Optional[Iterable[int]] = None,
+                 processes: Optional[int] = None,
+                 registry_kwargs: Optional[dict] = None,
+                 consumer_kwargs: Optional[dict] = None,
+                 invites: bool = False,
+                 restart_delay: float = 1.0,
+                 stats_interval: float = 5.0,
+                 registry_class: type = OpportunityRegistry):
+        shards = sorted(set(shards if shards is not None
+                            else range(1, shard_count + 1)))
+        if not shards or shards[0] < 1 or shards[-1] > shard_count:
+            raise ValueError('shards must be within 1..shard_count')
+        if processes is None:
+            processes = min(len(shards), os.cpu_count() or 1)
+        processes = max(1, min(processes, len(shards)))
+        self.handler = handler
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.shard_count = shard_count
+        self.assignments = split_shards(shards, processes)
+        self.registry_kwargs = registry_kwargs or {}
+        self.consumer_kwargs = consumer_kwargs or {}
+        self.invites = invites
+        self.restart_delay = restart_delay
+        self.stats_interval = stats_interval
+        self.registry_class = registry_class
+        self.restarts = 0
+        self._context = multiprocessing.get_context()
+        self._stopping = self._context.Event()
+        self._stats_queue = self._context.Queue()
+        self._workers: List[Optional[multiprocessing.Process]] = \
+            [None] * processes
+        self._latest: Dict[int, tuple] = {}
+        self._retired: Dict[int, dict] = {}
+        self._started = None
+
+    def _spawn(self, index: int) -> None:
+        worker = self._context.Process(
+            target=_run_worker,
+            name=f"rex-shards-{index}",
+            args=(self.assignments[index],
+                  self.handler,
+                  self.access_key,
+                  self.secret_key,
+                  self.shard_count,
+                  self.registry_class,
+                  self.registry_kwargs,
+                  self.consumer_kwargs,
+                  self.invites,
+                  self.stats_interval,
+                  self._stats_queue,
+                  self._stopping),
+            daemon=True)
+        worker.start()
+        self._workers[index] = worker
+
+    def start(self) -> 'ShardRunner':
+        """Start a worker process for every range of shards"""
+        if self._started is not None:
+            raise RuntimeError('ShardRunner already started')
+        self._started = time.monotonic()
+        for index in range(len(self.assignments)):
+            self._spawn(index)
+        return self
+
+    def check(self) -> None:
+        """Collect stats and restart workers that exited while running"""
+        self._collect()
+        if self._stopping.is_set():
+            return
+        for index, worker in enumerate(self._workers):
+            if worker is None or worker.is_alive():
+                continue
+            logger.warning(f"Worker for shards {self.assignments[index]} "
+                           f"exited with {worker.exitcode}, restarting")
+            worker.join()
+            time.sleep(self.restart_delay)
+            self.restarts += 1
+            self._spawn(index)
+
+    def run(self, check_interval: float = 1.0) -> None:
+        """Start (if needed) and supervise the workers until stop() is
+        called or the process is interrupted"""
+        if self._started is None:
+            self.start()
+        try:
+            while not self._stopping.wait(check_interval):
+                self.check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Stop every worker, letting them finish their current batch and
+        flush their acknowledgements"""
+        self._stopping.set()
+        # Drain first so no worker blocks flushing stats into a full pipe
+        self._collect()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            if worker is None:
+                continue
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                logger.warning(f"Terminating {worker.name}")
+                worker.terminate()
+                worker.join()
+        self._collect()
+
+    def _collect(self) -> None:
+        """Drain the stats reported by the workers"""
+        while True:
+            try:
+                shard, pid, stats = self._stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            previous = self._latest.get(shard)
+            if previous is not None and previous[0] != pid:
+                # Restarted worker, keep what the previous one got through
+                retired = self._retired.setdefault(shard, {})
+                for key, value in previous[1].items():
+                    if key not in _GAUGES:
+                        retired[key] = retired.get(key, 0) + value
+            self._latest[shard] = (pid, stats)
+
+    def stats(self) -> dict:
+        """Stats summed over every shard, including crashed workers, with
+        the overall intake rate in items per second"""
+        self._collect()
+        shards = {}
+        for shard, (_, latest) in self._latest.items():
+            merged = dict(latest)
+            for key, value in self._retired.get(shard, {}).items():
+                merged[key] = merged.get(key, 0) + value
+            shards[shard] = merged
+        total = {}
+        for merged in shards.values():
+            for key, value in merged.items():
+                if key not in _GAUGES:
+                    total[key] = total.get(key, 0) + value
+        elapsed = time.monotonic() - self._started if self._started else 0
+        return {
+            'workers': sum(1 for worker in self._workers
+                           if worker is not None and worker.is_alive()),
+            'restarts': self.restarts,
+            'shards': shards,
+            'total': total,
+            'items_per_second': total.get('items', 0) / elapsed
+            if elapsed else 0.0
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
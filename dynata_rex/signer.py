@@ -6,16 +6,22 @@ Author(s): Grant W
 # Python Imports
 import hashlib
 import hmac
+import math
+import time
 from datetime import datetime, timedelta
-import json
-from typing import Union
+from typing import Iterator, Optional, Tuple, Union
 from urllib.parse import urlencode
 
 # Third Party Imports
+from requests.auth import AuthBase
+from requests.exceptions import RequestException
 
 # Local Imports
 from .logs import logger
-from .helpers import make_session
+from .helpers import make_session, DEFAULT_CHUNK_SIZE
+from .retry import RetryPolicy
+from .circuit_breaker import CircuitBreaker
+from .codec import get_default_codec
 from .exceptions import HttpTimeoutException, RexServiceException
 
 
@@ -99,11 +105,14 @@ class Signer:
         encoded_params = urlencode(sorted_params)
         return hashlib.sha256(encoded_params.encode('utf-8')).hexdigest()
 
-    def _create_request_body_signing_string(self, request_body: str) -> str:
+    def _create_request_body_signing_string(
+            self, request_body: Union[str, bytes]) -> str:
         """SHA256 digest of the request body as a hexidecimal string
         in lowercase
         """
-        return hashlib.sha256(request_body.encode('utf-8')).hexdigest()
+        if isinstance(request_body, str):
+            request_body = request_body.encode('utf-8')
+        return hashlib.sha256(request_body).hexdigest()
 
     def sign_query_params_from_expiration_date(self,
                                                parameters: dict,
@@ -159,12 +168,50 @@ class RexRequest:
     def __init__(self,
                  access_key,
                  secret_key,
-                 default_ttl: int = 10):
+                 default_ttl: int = 10,
+                 session=None,
+                 retry_policy: RetryPolicy = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 codec=None):
+        """
+        @session: requests.Session to send with, ie a shared session from
+            helpers.get_shared_session(). Defaults to a new make_session()
+        @retry_policy: RetryPolicy for the session built when no session is
+            given, defaults to RetryPolicy()
+        @circuit_breaker: optional CircuitBreaker to fail fast on degraded
+            endpoints
+        @codec: json codec with dumps(obj) -> bytes and loads(bytes),
+            defaults to codec.get_default_codec()
+        """
         self.default_ttl = default_ttl
         self.access_key = access_key
         self.secret_key = secret_key
         self.signer = Signer(access_key, secret_key)
-        self.session = make_session()
+        if session is None:
+            session = make_session(retry_policy=retry_policy)
+        self.session = session
+        self.circuit_breaker = circuit_breaker
+        self.codec = codec if codec is not None else get_default_codec()
+
+    def _before_call(self, url: str) -> Tuple[float, Optional[int]]:
+        """Check the circuit breaker, returns the call start time and the
+        circuit generation it was let through in"""
+        generation = None
+        if self.circuit_breaker is not None:
+            generation = self.circuit_breaker.before_call(url)
+        return time.monotonic(), generation
+
+    def _after_call(self,
+                    url: str,
+                    call: Tuple[float, Optional[int]],
+                    failed: bool) -> None:
+        """Report the outcome of a call to the circuit breaker"""
+        if self.circuit_breaker is not None:
+            started, generation = call
+            self.circuit_breaker.record(url,
+                                        success=not failed,
+                                        duration=time.monotonic() - started,
+                                        generation=generation)
 
     def _signature(self, ttl: int = None, signing_string: str = None) -> str:
         if ttl is None:
@@ -176,12 +223,22 @@ class RexRequest:
             signing_string=signing_string
         )
 
+    def _ttl_for_deadline(self, remaining: Union[float, None] = None) -> int:
+        """Signature TTL for an attempt with `remaining` seconds left before
+        the request deadline: the default TTL, but never valid for longer
+        than the caller is still waiting"""
+        if remaining is None:
+            return self.default_ttl
+        return max(1, min(self.default_ttl, math.ceil(remaining)))
+
     def _create_auth_headers(self,
                              additional_headers={},
-                             body=''):
+                             body='',
+                             ttl: int = None):
         signing_string = self.signer._create_request_body_signing_string(body)
 
-        signature, expiration = self._signature(signing_string=signing_string)
+        signature, expiration = self._signature(ttl=ttl,
+                                                signing_string=signing_string)
         base = {
             'dynata-expiration': expiration,
             'dynata-access-key': self.access_key,
@@ -193,38 +250,143 @@ class RexRequest:
     def dispatch(self,
                  url,
                  data='',
-                 method='GET') -> Union[dict, str]:
+                 method='GET',
+                 raw: bool = False) -> Union[dict, str, bytes]:
+        """Sign and send a request. Returns the decoded json body (or text),
+        or the undecoded body bytes when `raw` is set."""
 
         additional_headers = {}
         if data:
             additional_headers = {'Content-type': 'application/json'}
-            data = json.dumps(data)
+            # Serialized once; the same buffer is signed and sent
+            data = self.codec.dumps(data)
 
-        headers = self._create_auth_headers(additional_headers,
-                                            body=data)
+        if not hasattr(self.session, method.lower()):
+            raise AttributeError('Invalid http method provided.')
+
+        method = getattr(self.session, method.lower())
+
+        call = self._before_call(url)
+        try:
+            # Signed by RexAuth when the request is prepared, and again by
+            # TimeoutHTTPAdapter before every retry
+            res = method(url,
+                         data=data,
+                         headers=additional_headers,
+                         auth=RexAuth(self))
+        except Exception:
+            self._after_call(url, call, failed=True)
+            raise
+        self._after_call(url, call,
+                         failed=CircuitBreaker.is_failure_status(
+                             res.status_code))
+        if raw:
+            self._raise_for_status(res.status_code, res.content, data)
+            return res.content
+        return self._parse_response(res.status_code, res.content, data)
+
+    def stream(self,
+               url,
+               data='',
+               method='POST',
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """Dispatch a request and yield the response body in chunks as it
+        arrives instead of buffering it, for large downloads.
+
+        The request is sent on the first iteration; the connection is
+        released once the generator is exhausted or closed.
+        """
+        additional_headers = {}
+        if data:
+            additional_headers = {'Content-type': 'application/json'}
+            # Serialized once; the same buffer is signed and sent
+            data = self.codec.dumps(data)
 
         if not hasattr(self.session, method.lower()):
             raise AttributeError('Invalid http method provided.')
 
         method = getattr(self.session, method.lower())
 
-        res = method(url, data=data, headers=headers)
-        if res.status_code > 299:
-            if res.status_code == 504:
-                raise HttpTimeoutException(res.content)
+        call = self._before_call(url)
+        try:
+            res = method(url,
+                         data=data,
+                         headers=additional_headers,
+                         auth=RexAuth(self),
+                         stream=True)
+        except Exception:
+            self._after_call(url, call, failed=True)
+            raise
+        self._after_call(url, call,
+                         failed=CircuitBreaker.is_failure_status(
+                             res.status_code))
+        with res:
+            if res.status_code > 299:
+                # Only error bodies are read whole, to report them
+                self._raise_for_status(res.status_code, res.content, data)
+            try:
+                yield from res.iter_content(chunk_size=chunk_size)
+            except RequestException as e:
+                raise RexServiceException from e
+
+    def _raise_for_status(self,
+                          status_code: int,
+                          content: bytes,
+                          data='') -> None:
+        if status_code > 299:
+            if status_code == 504:
+                raise HttpTimeoutException(content)
             if data:
                 logger.warning(data)
-            logger.warning(res.__dict__)
-            raise RexServiceException(res.content.decode('utf-8'))
+            logger.warning(f"{status_code}: {content}")
+            raise RexServiceException(content.decode('utf-8'))
+
+    def _parse_response(self,
+                        status_code: int,
+                        content: bytes,
+                        data='') -> Union[dict, str]:
+        """Raise for error statuses, otherwise decode the body as json and
+        fall back to plain text"""
+        self._raise_for_status(status_code, content, data)
         try:
-            return res.json()
-        except json.decoder.JSONDecodeError as e:
-            if res.status_code != 204:
-                logger.debug(str(e), res.__dict__, exc_info=1)
-        return res.content.decode('utf-8')
+            return self.codec.loads(content)
+        except ValueError as e:
+            if status_code != 204:
+                logger.debug(str(e), exc_info=1)
+        return content.decode('utf-8')
 
     def get(self, url: str):
         return self.dispatch(url)
 
     def post(self, url, data):
         return self.dispatch(url, data=data, method='POST')
+
+    def post_raw(self, url, data) -> bytes:
+        """POST and return the undecoded response body"""
+        return self.dispatch(url, data=data, method='POST', raw=True)
+
+
+class RexAuth(AuthBase):
+    """requests auth hook adding the REX signature headers.
+
+    The hook stays attached to the prepared request as `rex_auth` so the
+    adapter can re-sign each retry with a fresh expiration instead of
+    resending a signature that may have expired while backing off.
+    """
+
+    def __init__(self, requester: RexRequest):
+        self.requester = requester
+
+    def sign(self, request, remaining: Union[float, None] = None):
+        """(Re)sign a prepared request, `remaining` being the seconds left
+        before the request deadline if there is one"""
+        ttl = self.requester._ttl_for_deadline(remaining)
+        headers = self.requester._create_auth_headers(body=request.body or '',
+                                                      ttl=ttl)
+        request.headers.update(headers)
+        return request
+
+    def __call__(self, request):
+        self.sign(request)
+        request.rex_auth = self
+        return request
@@ -0,0 +1,151 @@
+"""
+Package: dynata_rex
+Filename: snapshot.py
+Author(s): Grant W
+
+Description: Snapshots of live opportunities, for warm restarts
+"""
+# Python Imports
+import gc
+import json
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+# Third Party Imports
+from pydantic import TypeAdapter
+
+# Local Imports
+from .disk_cache import CollectionDiskCache
+from .models import CollectionCell, LazyOpportunity, Opportunity
+from .store import OpportunityStore
+
+_MAGIC = b'REXS'
+_VERSION = 1
+# magic, version, opportunity count, meta length
+_HEADER = struct.Struct('<4sIQQ')
+
+_OPPORTUNITIES = TypeAdapter(List[Opportunity])
+_LAZY_OPPORTUNITIES = TypeAdapter(List[LazyOpportunity])
+
+
+@contextmanager
+def _gc_paused():
+    """Allocating many long lived objects at once triggers collections
+    that scan everything and free nothing, pause them meanwhile"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class Snapshot(NamedTuple):
+    """
+    A loaded snapshot.
+
+    @opportunities: restored opportunities
+    @created: unix time the snapshot was taken
+    @collections: collection id -> content digest in the disk cache (or
+        None) for every collection the opportunities reference
+    @metadata: what was passed to save_snapshot()
+    """
+    opportunities: List[Union[Opportunity, LazyOpportunity]]
+    created: float
+    collections: Dict[str, Optional[str]]
+    metadata: dict
+
+    def to_store(self) -> OpportunityStore:
+        """OpportunityStore of the restored opportunities, to keep
+        applying notifications to"""
+        with _gc_paused():
+            return OpportunityStore(self.opportunities)
+
+
+def save_snapshot(opportunities: Iterable[Opportunity],
+                  path: str,
+                  disk_cache: Optional[CollectionDiskCache] = None,
+                  metadata: Optional[dict] = None) -> int:
+    """
+    Write opportunities (ie an OpportunityStore) to path, atomically
+    replacing any previous snapshot. Returns the number written.
+
+    @disk_cache: record the digest each referenced collection is cached
+        under, see Snapshot.collections
+    @metadata: JSON serializable data to keep with the snapshot, ie the
+        shard it was taken on
+    """
+    opportunities = [o.to_opportunity() if isinstance(o, LazyOpportunity)
+                     else o for o in opportunities]
+    collections = {}
+    for opportunity in opportunities:
+        for cell in opportunity.cells:
+            if isinstance(cell, CollectionCell):
+                collections[cell.collection_] = None
+    if disk_cache is not None:
+        for collection_id in collections:
+            collections[collection_id] = disk_cache.digest(
+                f"collection-{collection_id}")
+
+    meta = json.dumps({
+        'created': time.time(),
+        'metadata': metadata or {},
+        'collections': collections,
+    }).encode('utf-8')
+    body = _OPPORTUNITIES.dump_json(opportunities, by_alias=True)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(opportunities),
+                                 len(meta)))
+            f.write(meta)
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(opportunities)
+
+
+def load_snapshot(path: Union[str, os.PathLike],
+                  lazy: bool = False) -> Snapshot:
+    """
+    Restore the opportunities written by save_snapshot().
+
+    The opportunities are parsed and validated straight from the file's
+    bytes by pydantic-core in one call, with garbage collection paused.
+
+    @lazy: restore LazyOpportunity objects, deferring the targeting
+        validation to first access, as with receive_notifications()
+
+    Raises ValueError if path is not a snapshot of this version.
+    """
+    with open(path, 'rb') as f:
+        try:
+            magic, version, count, meta_size = _HEADER.unpack(
+                f.read(_HEADER.size))
+        except struct.error:
+            raise ValueError(f"{path} is not a snapshot")
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} "
+                             f"snapshot")
+        meta = json.loads(f.read(meta_size))
+        body = f.read()
+
+    adapter = _LAZY_OPPORTUNITIES if lazy else _OPPORTUNITIES
+    with _gc_paused():
+        opportunities = adapter.validate_json(body)
+    if len(opportunities) != count:
+        raise ValueError(f"{path} holds {len(opportunities)} "
+                         f"opportunities, expected {count}")
+    return Snapshot(opportunities,
+                    meta['created'],
+                    meta['collections'],
+                    meta['metadata'])
@@ -0,0 +1,297 @@
+"""
+Package: dynata_rex
+Filename: store.py
+Author(s): Grant W
+
+Description: In-memory, indexed store of live opportunities
+"""
+# Python Imports
+import heapq
+import threading
+from itertools import islice
+from bisect import bisect_left, bisect_right, insort
+from enum import Enum
+from typing import (Any, Callable, Dict, Iterable, Iterator, List,
+                    NamedTuple, Optional, Set)
+
+# Third Party Imports
+
+# Local Imports
+from .models import CategoryEnum, DevicesEnum, Opportunity, StatusEnum
+
+# Secondary index name -> keys an opportunity is filed under
+INDEXES: Dict[str, Callable[[Opportunity], Iterable[Any]]] = {
+    'project_id': lambda o: [o.project_id],
+    'group_id': lambda o: [o.group_id],
+    'country': lambda o: [o.locale.country],
+    'language': lambda o: [o.locale.language],
+    'category_ids': lambda o: o.category_ids,
+    'devices': lambda o: o.devices,
+    'status': lambda o: [o.status],
+}
+
+# Sorted index name -> numeric value an opportunity is ordered by
+RANGE_INDEXES: Dict[str, Callable[[Opportunity], float]] = {
+    'cost_per_interview': lambda o: o.cost_per_interview,
+    'length_of_interview': lambda o: o.length_of_interview,
+    'incidence_rate': lambda o: o.incidence_rate,
+    'days_in_field': lambda o: o.days_in_field,
+    # Expected payout per respondent sent: CPI weighted by incidence
+    'expected_earnings': lambda o: o.cost_per_interview *
+    o.incidence_rate / 100,
+}
+
+# Indexes keyed by enum members, so lookups can also be made by value
+_INDEX_ENUMS: Dict[str, type] = {
+    'category_ids': CategoryEnum,
+    'devices': DevicesEnum,
+    'status': StatusEnum,
+}
+
+
+class Range(NamedTuple):
+    """Inclusive bounds for a sorted index criterion, None leaves that end
+    open. ie `cost_per_interview=Range(min=1.5)`"""
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+class OpportunityStore:
+    """
+    Live opportunities by id, with secondary indexes so candidates are
+    found by set lookups instead of scanning every opportunity.
+
+    Numeric fields (see RANGE_INDEXES) are kept in sorted indexes for
+    Range criteria and top-k ordering with query().
+
+    Notifications are applied incrementally: OPEN and PAUSED opportunities
+    are inserted or replaced, CLOSED ones are evicted. Safe to feed from a
+    consumer thread while other threads query it.
+
+    >>> store = OpportunityStore()
+    >>> consumer = registry.consume(store.apply_all)
+    >>> store.find(country='US', language='en', devices='mobile')
+    >>> store.query(status='OPEN', country='US', language='en',
+    ...             cost_per_interview=Range(min=1.5),
+    ...             length_of_interview=Range(max=15),
+    ...             order_by='expected_earnings', limit=10)
+    """
+
+    def __init__(self, opportunities: Iterable[Opportunity] = ()):
+        self._opportunities: Dict[int, Opportunity] = {}
+        self._indexes: Dict[str, Dict[Any, Set[int]]] = {
+            name: {} for name in INDEXES
+        }
+        # Sorted (value, id) pairs per numeric field
+        self._sorted: Dict[str, List[tuple]] = {
+            name: [] for name in RANGE_INDEXES
+        }
+        # Numeric field -> id -> value, to check Range criteria per
+        # candidate
+        self._values: Dict[str, Dict[int, float]] = {
+            name: {} for name in RANGE_INDEXES
+        }
+        self._lock = threading.RLock()
+        self.apply_all(opportunities)
+
+    def __len__(self) -> int:
+        return len(self._opportunities)
+
+    def __contains__(self, opportunity_id: int) -> bool:
+        return opportunity_id in self._opportunities
+
+    def __iter__(self) -> Iterator[Opportunity]:
+        with self._lock:
+            return iter(list(self._opportunities.values()))
+
+    def get(self, opportunity_id: int) -> Optional[Opportunity]:
+        return self._opportunities.get(opportunity_id)
+
+    def _index(self, opportunity: Opportunity) -> None:
+        for name, keys in INDEXES.items():
+            index = self._indexes[name]
+            for key in keys(opportunity):
+                index.setdefault(key, set()).add(opportunity.id)
+        for name, value in RANGE_INDEXES.items():
+            value = self._values[name][opportunity.id] = value(opportunity)
+            insort(self._sorted[name], (value, opportunity.id))
+
+    def _unindex(self, opportunity: Opportunity) -> None:
+        for name, keys in INDEXES.items():
+            index = self._indexes[name]
+            for key in keys(opportunity):
+                ids = index.get(key)
+                if ids is None:
+                    continue
+                ids.discard(opportunity.id)
+                if not ids:
+                    del index[key]
+        for name, values in self._values.items():
+            value = values.pop(opportunity.id)
+            index = self._sorted[name]
+            del index[bisect_left(index, (value, opportunity.id))]
+
+    def apply(self, opportunity: Opportunity) -> bool:
+        """Apply a notification, returns True if the opportunity is live
+        (stored) afterwards and False if it was evicted"""
+        if opportunity.status is StatusEnum.CLOSED:
+            self.remove(opportunity.id)
+            return False
+        with self._lock:
+            previous = self._opportunities.get(opportunity.id)
+            if previous is not None:
+                self._unindex(previous)
+            self._opportunities[opportunity.id] = opportunity
+            self._index(opportunity)
+        return True
+
+    def apply_all(self, opportunities: Iterable[Opportunity]) -> None:
+        """Apply a batch of notifications, ie as a consume() handler"""
+        with self._lock:
+            for opportunity in opportunities:
+                self.apply(opportunity)
+
+    def remove(self, opportunity_id: int) -> Optional[Opportunity]:
+        """Evict an opportunity, returning it if it was stored"""
+        with self._lock:
+            opportunity = self._opportunities.pop(opportunity_id, None)
+            if opportunity is not None:
+                self._unindex(opportunity)
+            return opportunity
+
+    @staticmethod
+    def _keys(name: str, value: Any) -> List[Any]:
+        """Index keys for a criterion, a single value or a collection of
+        alternatives"""
+        if name not in INDEXES:
+            raise ValueError(f"No index on {name}, expected one of "
+                             f"{', '.join(INDEXES)}")
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = value
+        else:
+            values = [value]
+        enum = _INDEX_ENUMS.get(name)
+        if enum is None:
+            return list(values)
+        return [v if isinstance(v, Enum) else enum(v) for v in values]
+
+    def _bounds(self, name: str, bounds: Range) -> slice:
+        """Slice of the sorted index on name within the bounds"""
+        index = self._sorted[name]
+        low = 0 if bounds.min is None else \
+            bisect_left(index, (bounds.min,))
+        high = len(index) if bounds.max is None else \
+            bisect_right(index, (bounds.max, float('inf')))
+        return slice(low, max(low, high))
+
+    def ids(self, **criteria) -> Set[int]:
+        """Ids of the opportunities matching every criterion.
+
+        Criteria are index names mapped to a value, or a collection of
+        values any of which may match, for INDEXES, and to a Range for
+        RANGE_INDEXES. Without criteria every stored id is returned.
+
+        Candidates come from the most selective criterion and are checked
+        against the others.
+        """
+        with self._lock:
+            if not criteria:
+                return set(self._opportunities)
+            sets = []
+            ranges = []
+            for name, value in criteria.items():
+                if isinstance(value, Range):
+                    if name not in RANGE_INDEXES:
+                        raise ValueError(
+                            f"No sorted index on {name}, expected one of "
+                            f"{', '.join(RANGE_INDEXES)}")
+                    ranges.append((name, value, self._bounds(name, value)))
+                    continue
+                keys = self._keys(name, value)
+                index = self._indexes[name]
+                ids = set()
+                for key in keys:
+                    ids |= index.get(key, set())
+                if not ids:
+                    return set()
+                if len(ids) < len(self._opportunities):
+                    # Criteria every opportunity meets filter nothing
+                    sets.append(ids)
+
+            sets.sort(key=len)
+            ranges.sort(key=lambda r: r[2].stop - r[2].start)
+            if not sets and not ranges:
+                return set(self._opportunities)
+            if ranges and (not sets or ranges[0][2].stop -
+                           ranges[0][2].start < len(sets[0])):
+                name, _, bounds = ranges.pop(0)
+                out = {opportunity_id for _, opportunity_id
+                       in self._sorted[name][bounds]}
+            else:
+                out = set(sets.pop(0))
+            for ids in sets:
+                out &= ids
+            for name, bounds, _ in ranges:
+                values = self._values[name]
+                if bounds.min is not None:
+                    out = {i for i in out if values[i] >= bounds.min}
+                if bounds.max is not None:
+                    out = {i for i in out if values[i] <= bounds.max}
+            return out
+
+    def find(self, **criteria) -> List[Opportunity]:
+        """Opportunities matching every criterion, in no particular order,
+        see ids()"""
+        with self._lock:
+            return [self._opportunities[opportunity_id]
+                    for opportunity_id in self.ids(**criteria)]
+
+    def query(self,
+              order_by: Optional[str] = None,
+              descending: bool = True,
+              limit: Optional[int] = None,
+              **criteria) -> List[Opportunity]:
+        """Opportunities matching every criterion (see ids()), ordered by a
+        RANGE_INDEXES field and cut to the top `limit`.
+
+        Broad queries walk the sorted index from the best end and stop
+        after `limit` matches; narrow ones only sort their candidates.
+        """
+        with self._lock:
+            if order_by is None:
+                ids = list(self.ids(**criteria))
+                if limit is not None:
+                    ids = ids[:limit]
+                return [self._opportunities[i] for i in ids]
+            if order_by not in RANGE_INDEXES:
+                raise ValueError(f"Cannot order by {order_by}, expected one "
+                                 f"of {', '.join(RANGE_INDEXES)}")
+
+            index = self._sorted[order_by]
+            ordered = reversed(index) if descending else iter(index)
+            if not criteria:
+                return [self._opportunities[i]
+                        for _, i in islice(ordered, limit)]
+
+            candidates = self.ids(**criteria)
+            # Walking the index reaches `limit` matches after about
+            # limit * len(index) / len(candidates) entries
+            if limit is not None and \
+                    len(candidates) ** 2 > limit * len(index):
+                ids = []
+                for _, opportunity_id in ordered:
+                    if opportunity_id in candidates:
+                        ids.append(opportunity_id)
+                        if len(ids) == limit:
+                            break
+            else:
+                def key(opportunity_id):
+                    return (self._values[order_by][opportunity_id],
+                            opportunity_id)
+                if limit is None:
+                    ids = sorted(candidates, key=key, reverse=descending)
+                elif descending:
+                    ids = heapq.nlargest(limit, candidates, key=key)
+                else:
+                    ids = heapq.nsmallest(limit, candidates, key=key)
+            return [self._opportunities[i] for i in ids]
@@ -0,0 +1,187 @@
+"""
+Package: dynata_rex
+Filename: targeting.py
+Author(s): Grant W
+
+Description: Evaluate opportunity targeting against respondent profiles
+"""
+# Python Imports
+from typing import (Any, Callable, Container, Dict, List, Mapping,
+                    NamedTuple, Optional, Tuple)
+
+# Third Party Imports
+
+# Local Imports
+from .models import (Cell, CollectionCell, ListCell, Opportunity, Quota,
+                     RangeCell, StatusEnum, ValueCell)
+
+# attribute_id -> answer, or a collection of answers for multi-select
+Profile = Mapping[int, Any]
+Predicate = Callable[[Any], bool]
+
+
+class Qualification(NamedTuple):
+    """Outcome of evaluating a profile against an opportunity
+
+    @qualified: the profile passes every filter and fits an open quota in
+        every quota group
+    @quotas: quotas the profile falls into, one list per quota group
+    """
+    qualified: bool
+    quotas: List[List[Quota]]
+
+
+def _answers(value: Any) -> Tuple[Any, ...]:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(value)
+    return (value,)
+
+
+def _in(values: Container) -> Predicate:
+    def predicate(answer):
+        return any(str(a) in values for a in _answers(answer))
+    return predicate
+
+
+def _in_range(low: Optional[float], high: Optional[float]) -> Predicate:
+    def predicate(answer):
+        for a in _answers(answer):
+            try:
+                number = float(a)
+            except (TypeError, ValueError):
+                continue
+            if (low is None or number >= low) and \
+                    (high is None or number <= high):
+                return True
+        return False
+    return predicate
+
+
+def compile_cell(cell: Cell,
+                 collections: Optional[Mapping[str, Container]] = None
+                 ) -> Callable[[Profile], bool]:
+    """
+    Predicate telling whether a profile matches a cell.
+
+    Answers are compared as strings for value, list and collection cells
+    and as numbers for (inclusive) range cells; any one answer of a
+    multi-select matching is enough. A profile without an answer for the
+    cell's attribute does not match it, negated or not.
+
+    @collections: collection id -> container of the collection's values,
+        required for collection cells
+    """
+    if isinstance(cell, RangeCell):
+        match = _in_range(cell.range_.from_, cell.range_.to)
+    elif isinstance(cell, ListCell):
+        match = _in(frozenset(cell.list_))
+    elif isinstance(cell, ValueCell):
+        match = _in(frozenset([cell.value]))
+    elif isinstance(cell, CollectionCell):
+        if collections is None or cell.collection_ not in collections:
+            raise ValueError(f"Collection {cell.collection_} of cell "
+                             f"{cell.tag} was not provided")
+        values = collections[cell.collection_]
+        if isinstance(values, (list, tuple)):
+            # ie straight from download_collection(), avoid O(n) lookups
+            values = frozenset(str(value) for value in values)
+        match = _in(values)
+    else:
+        raise ValueError(f"Unsupported cell kind {cell.kind}")
+
+    attribute_id = cell.attribute_id
+    negate = cell.negate
+
+    def predicate(profile: Profile) -> bool:
+        answer = profile.get(attribute_id)
+        if answer is None:
+            return False
+        return match(answer) is not negate
+    return predicate
+
+
+class CompiledTargeting:
+    """
+    An opportunity's targeting compiled into predicates once, to evaluate
+    many profiles against it.
+
+    Filters: every outer group must pass, a group passes when any one of
+    its filters does, and a filter passes when the profile matches all of
+    its cells. Quotas: in every outer group the profile must fall into at
+    least one OPEN quota, ie match all of the quota's cells; a quota
+    without cells takes everyone. Each cell is evaluated at most once per
+    profile.
+
+    @opportunity: Opportunity (or LazyOpportunity) to compile
+    @collections: collection id -> container of values, for collection
+        cells, ie registry.collection_cache() to compile each collection
+        once for every opportunity referencing it
+    """
+
+    def __init__(self,
+                 opportunity: Opportunity,
+                 collections: Optional[Mapping[str, Container]] = None):
+        self.opportunity_id = opportunity.id
+        self.cells: Dict[str, Callable[[Profile], bool]] = {
+            cell.tag: compile_cell(cell, collections)
+            for cell in opportunity.cells
+        }
+        self.filters: Tuple[Tuple[Tuple[str, ...], ...], ...] = tuple(
+            tuple(self._tags(f.cells) for f in group)
+            for group in opportunity.filters
+        )
+        self.quotas: Tuple[Tuple[Tuple[Quota, Tuple[str, ...]], ...],
+                           ...] = tuple(
+            tuple((quota, self._tags(quota.cells)) for quota in group)
+            for group in opportunity.quotas
+        )
+
+    def _tags(self, tags: List[str]) -> Tuple[str, ...]:
+        for tag in tags:
+            if tag not in self.cells:
+                raise ValueError(f"Opportunity {self.opportunity_id} "
+                                 f"references unknown cell {tag}")
+        return tuple(tags)
+
+    def _matcher(self, profile: Profile) -> Callable[[Tuple[str, ...]],
+                                                     bool]:
+        """all-cells-match check for tag tuples, memoized per profile"""
+        results = {}
+        cells = self.cells
+
+        def matches(tags):
+            for tag in tags:
+                result = results.get(tag)
+                if result is None:
+                    result = results[tag] = cells[tag](profile)
+                if not result:
+                    return False
+            return True
+        return matches
+
+    def _passes_filters(self, matches) -> bool:
+        return all(any(matches(tags) for tags in group)
+                   for group in self.filters)
+
+    def passes_filters(self, profile: Profile) -> bool:
+        """Whether the profile passes every filter group"""
+        return self._passes_filters(self._matcher(profile))
+
+    def evaluate(self, profile: Profile) -> Qualification:
+        """Whether the profile qualifies and which quotas it falls into"""
+        matches = self._matcher(profile)
+        quotas = [[quota for quota, tags in group if matches(tags)]
+                  for group in self.quotas]
+        qualified = self._passes_filters(matches) and all(
+            any(quota.status is StatusEnum.OPEN for quota in group)
+            for group in quotas)
+        return Qualification(qualified, quotas)
+
+    def qualifies(self, profile: Profile) -> bool:
+        """Whether the profile passes every filter and fits an open quota
+        in every quota group"""
+        matches = self._matcher(profile)
+        return self._passes_filters(matches) and all(
+            any(quota.status is StatusEnum.OPEN and matches(tags)
+                for quota, tags in group)
+            for group in self.quotas)
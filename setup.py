@@ -23,7 +23,13 @@ setuptools.setup(
     setup_requires=['pytest-runner'],
     extras_require={
         # pip install -e ".[testing]"
-        "testing": ['pytest'],
+        "testing": ['pytest', 'aiohttp', 'numpy'],
+        # pip install -e ".[async]"
+        "async": ['aiohttp'],
+        # pip install -e ".[orjson]"
+        "orjson": ['orjson'],
+        # pip install -e ".[numpy]"
+        "numpy": ['numpy'],
         ':python_version == "3.6"': [
             "typing-extensions==4.12.2",
             'dataclasses==0.8'
@@ -6,13 +6,17 @@ Author(s): Grant W
 Description: Common values and functions for tests
 """
 # Python Imports
+import copy
+import io
 import os
 import json
+import time
 
 # Third Party Imports
 from requests.models import Response
 
 # Dynata Imports
+from dynata_rex.models import Opportunity
 
 # Local Imports
 
@@ -55,6 +59,19 @@ class ResponseMock:
         response = Response()
         response.status_code = status_code
         response._content = str.encode(content)
+        response.raw = io.BytesIO(response._content)
+        response.headers['content-type'] = content_type
+        return response
+
+    @staticmethod
+    def _streaming_response_mock(status_code,
+                                 content='',
+                                 content_type='text/plain'):
+        """Response whose body is only read from `raw` on demand, as with
+        stream=True"""
+        response = Response()
+        response.status_code = status_code
+        response.raw = io.BytesIO(str.encode(content))
         response.headers['content-type'] = content_type
         return response
 
@@ -65,3 +82,49 @@ class ResponseMock:
     @classmethod
     def _504(cls, *args, **kwargs):
         return cls._response_mock(504)
+
+
+def opportunity(cells=None, filters=None, quotas=None, **changes):
+    """Opportunity from the second sample notification with fields replaced.
+    Replacing the targeting (cells, filters) defaults quotas to a single
+    open one without cells"""
+    raw = copy.deepcopy(TEST_DATA['test_receive_notifications'][1])
+    raw.update(changes)
+    if cells is not None:
+        raw['cells'] = cells
+    if filters is not None:
+        raw['filters'] = [[{'id': f"f{i}-{j}", 'cells': tags}
+                           for j, tags in enumerate(group)]
+                          for i, group in enumerate(filters)]
+    if quotas is None and (cells is not None or filters is not None):
+        quotas = [[{'id': 'all', 'cells': [], 'count': 10,
+                    'status': 'OPEN'}]]
+    if quotas is not None:
+        raw['quotas'] = quotas
+    return Opportunity(**raw)
+
+
+def cell(tag, attribute_id, kind, negate=False, **values):
+    """Raw targeting cell"""
+    return dict(tag=tag, attribute_id=attribute_id, kind=kind,
+                negate=negate, **values)
+
+
+def batches_then_empty(*batches):
+    """fetch() returning each batch in turn, then empty polls"""
+    pending = list(batches)
+    calls = []
+
+    def fetch(limit, **kwargs):
+        calls.append(limit)
+        return pending.pop(0) if pending else []
+    fetch.calls = calls
+    return fetch
+
+
+def wait_for(condition, timeout=2.0, interval=0.005):
+    """Poll until condition() is true, failing after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(interval)
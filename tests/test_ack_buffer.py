@@ -0,0 +1,123 @@
+"""
+Package: src.tests
+Filename: test_ack_buffer.py
+Author(s): Grant W
+
+Description: Tests for the acknowledgement buffer
+"""
+# Python Imports
+import json
+import time
+from unittest.mock import patch
+
+# Third Party Imports
+import pytest
+import requests
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex import AckBuffer
+
+# Local Imports
+from .shared import (ACCESS_KEY,
+                     SECRET_KEY,
+                     BASE_URL,
+                     ResponseMock,
+                     TEST_DATA)
+
+REGISTRY = dynata_rex.OpportunityRegistry(ACCESS_KEY, SECRET_KEY, BASE_URL)
+
+
+def test_flushes_on_size_in_one_call():
+    sent = []
+    acks = AckBuffer(sent.append, max_size=4, max_delay=None)
+
+    acks.add(1)
+    acks.add([2, 2])
+    assert sent == []
+    acks.add([3, 4])
+
+    assert sent == [[1, 2, 3, 4]]
+    assert len(acks) == 0
+
+
+def test_flush_splits_into_max_size_requests():
+    sent = []
+    acks = AckBuffer(sent.append, max_size=2, max_delay=None)
+    acks._pending = dict.fromkeys([1, 2, 3, 4, 5])
+
+    assert acks.flush() == 5
+    assert sent == [[1, 2], [3, 4], [5]]
+
+
+def test_flushes_on_delay():
+    sent = []
+    acks = AckBuffer(sent.append, max_size=100, max_delay=0.01)
+
+    acks.add([1, 2])
+    deadline = time.monotonic() + 2
+    while not sent and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    assert sent == [[1, 2]]
+
+
+def test_close_flushes_and_rejects_new_ids():
+    sent = []
+    with AckBuffer(sent.append, max_delay=None) as acks:
+        acks.add([5, 6])
+
+    assert sent == [[5, 6]]
+    with pytest.raises(RuntimeError):
+        acks.add(7)
+
+
+def test_failed_flush_keeps_ids():
+    calls = []
+
+    def ack(ids):
+        calls.append(ids)
+        if len(calls) == 1:
+            raise dynata_rex.RexServiceException('down')
+
+    acks = AckBuffer(ack, max_delay=None)
+    acks.add([1, 2])
+    with pytest.raises(dynata_rex.RexServiceException):
+        acks.flush()
+    acks.add(3)
+    acks.flush()
+
+    assert calls == [[1, 2], [1, 2, 3]]
+    assert acks.stats['errors'] == 1
+
+
+@patch.object(dynata_rex.OpportunityRegistry, "ack_notifications")
+@patch.object(requests.Session, "post")
+def test_receive_notifications_buffers_invalid_acks(session_post, ack):
+    data = list(TEST_DATA['test_receive_notifications'])
+    data.append({"id": 999998, "status": "CLOSED"})
+    data.append({"id": 999999, "status": "CLOSED"})
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=json.dumps(data), content_type="application/json"
+    )
+
+    with REGISTRY.notification_acks(max_delay=None) as acks:
+        REGISTRY.receive_notifications(acks=acks)
+        REGISTRY.receive_notifications(acks=acks)
+        assert not ack.called
+
+    assert ack.call_args_list == [(([999998, 999999],),)]
+
+
+@patch.object(dynata_rex.OpportunityRegistry, "ack_invites")
+@patch.object(requests.Session, "post")
+def test_receive_invites_buffers_invalid_acks(session_post, ack):
+    data = TEST_DATA['test_receive_invites'] + [{"id": 444}, {"id": 555}]
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=json.dumps(data), content_type="application/json"
+    )
+
+    with REGISTRY.invite_acks(max_delay=None) as acks:
+        REGISTRY.receive_invites(acks=acks)
+
+    assert ack.call_args_list == [(([444, 555],),)]
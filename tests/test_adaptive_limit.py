@@ -0,0 +1,82 @@
+"""
+Package: src.tests
+Filename: test_adaptive_limit.py
+Author(s): Grant W
+
+Description: Tests for the adaptive poll limit
+"""
+# Python Imports
+from types import SimpleNamespace
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex import AdaptiveLimit
+from dynata_rex.consumer import Consumer
+
+# Local Imports
+
+
+def test_full_batches_increase_additively():
+    limit = AdaptiveLimit(initial=10, step=5, maximum=22)
+
+    assert limit.record_poll(10, received=10, latency=0.1) == 15
+    assert limit.record_poll(15, received=15, latency=0.1) == 20
+    assert limit.record_poll(20, received=20, latency=0.1) == 22
+
+
+def test_partial_and_empty_batches_hold_the_limit():
+    limit = AdaptiveLimit(initial=40)
+
+    assert limit.record_poll(40, received=12, latency=0.1) == 40
+    assert limit.record_poll(40, received=0, latency=0.1) == 40
+
+
+def test_slow_poll_decreases_multiplicatively():
+    limit = AdaptiveLimit(initial=40, target_latency=2, minimum=8)
+
+    assert limit.record_poll(40, received=40, latency=3) == 20
+    assert limit.record_poll(20, received=20, latency=3) == 10
+    assert limit.record_poll(10, received=10, latency=3) == 8
+
+
+def test_slow_handler_decreases_from_batch_size():
+    limit = AdaptiveLimit(initial=100, target_handle_time=1)
+
+    assert limit.record_handled(60, handle_time=0.5) == 100
+    assert limit.record_handled(60, handle_time=2) == 30
+
+
+def test_stats_hook_reports_changes():
+    updates = []
+    limit = AdaptiveLimit(initial=10, step=10, on_update=updates.append)
+
+    limit.record_poll(10, received=10, latency=0.2)
+    limit.record_poll(20, received=3, latency=0.2)
+
+    assert updates == [{'limit': 20, 'previous': 10, 'reason': 'full',
+                        'received': 10, 'latency': 0.2}]
+
+
+def test_initial_outside_bounds():
+    with pytest.raises(ValueError):
+        AdaptiveLimit(initial=0, minimum=1)
+
+
+def test_consumer_polls_with_adaptive_limit():
+    limits = []
+
+    def fetch(limit):
+        limits.append(limit)
+        if len(limits) == 3:
+            consumer._stopping.set()
+        return [SimpleNamespace(id=i) for i in range(limit)]
+
+    consumer = Consumer(fetch, lambda batch: None, lambda ids: None,
+                        limit=AdaptiveLimit(initial=5, step=5),
+                        prefetch=3)
+    consumer._fetch_loop()
+
+    assert limits == [5, 10, 15]
+    assert consumer.stats['limit'] == 15
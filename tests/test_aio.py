@@ -0,0 +1,296 @@
+"""
+Package: src.tests
+Filename: test_aio.py
+Author(s): Grant W
+
+Description: Tests for the asyncio clients
+"""
+# Python Imports
+from unittest.mock import patch
+import asyncio
+import json
+
+# Third Party Imports
+import aiohttp
+import pytest
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex.aio import (AsyncRexRequest,
+                            AsyncOpportunityRegistry,
+                            AsyncRespondentGateway)
+
+# Local Imports
+from .shared import (ACCESS_KEY,
+                     SECRET_KEY,
+                     BASE_URL,
+                     TEST_DATA)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def fake_send(status_code, content=b'', response_headers=None):
+    """Build a replacement for AsyncRexRequest._send that records calls"""
+    calls = []
+
+    async def _send(self, method, url, data, headers, timeout=None):
+        calls.append((method, url, data, headers))
+        if isinstance(status_code, Exception):
+            raise status_code
+        return status_code, content, response_headers or {}
+
+    _send.calls = calls
+    return _send
+
+
+def test_async_requester_returns_dict_from_json():
+    send = fake_send(200, json.dumps({"whoo": "hoo"}).encode())
+    with patch.object(AsyncRexRequest, '_send', send):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        r = run(requester.post('https://not-a-real-url-abcdefg.com',
+                               data={"a": 1}))
+    assert r == {"whoo": "hoo"}
+    method, _, data, headers = send.calls[0]
+    assert method == 'POST'
+    assert data == requester.codec.dumps({"a": 1})
+    assert 'dynata-signature' in headers
+
+
+def test_async_requester_returns_content_from_non_json():
+    with patch.object(AsyncRexRequest, '_send', fake_send(200, b'hello')):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        r = run(requester.get('https://not-a-real-url-abcdefg.com'))
+    assert r == 'hello'
+
+
+def test_async_requester_504_raises_timeout_exception():
+    with patch.object(AsyncRexRequest, '_send', fake_send(504)):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        with pytest.raises(dynata_rex.exceptions.HttpTimeoutException):
+            run(requester.get('https://not-a-real-url-abcdefg.com'))
+
+
+def test_async_requester_5XX_raises_service_exception():
+    with patch.object(AsyncRexRequest, '_send', fake_send(500)):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        with pytest.raises(dynata_rex.exceptions.RexServiceException):
+            run(requester.get('https://not-a-real-url-abcdefg.com'))
+
+
+def test_async_requester_client_timeout_raises_timeout_exception():
+    send = fake_send(asyncio.TimeoutError())
+    with patch.object(AsyncRexRequest, '_send', send):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        with pytest.raises(dynata_rex.exceptions.HttpTimeoutException):
+            run(requester.get('https://not-a-real-url-abcdefg.com'))
+    assert len(send.calls) == 1
+
+
+@patch('dynata_rex.aio.signer.wait')
+def test_async_requester_retries_connection_errors(wait_method):
+    async def _wait(try_number, interval=None):
+        return None
+    wait_method.side_effect = _wait
+
+    send = fake_send(aiohttp.ClientConnectionError())
+    with patch.object(AsyncRexRequest, '_send', send):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        with pytest.raises(dynata_rex.exceptions.RexServiceException):
+            run(requester.get('https://not-a-real-url-abcdefg.com'))
+    assert len(send.calls) == dynata_rex.helpers.DEFAULT_RETRIES
+    assert wait_method.call_count == dynata_rex.helpers.DEFAULT_RETRIES - 1
+
+
+@patch('dynata_rex.aio.signer.wait')
+def test_async_requester_retries_retryable_status(wait_method):
+    async def _wait(try_number, interval=None):
+        return None
+    wait_method.side_effect = _wait
+
+    send = fake_send(503, response_headers={'Retry-After': '2'})
+    with patch.object(AsyncRexRequest, '_send', send):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        with pytest.raises(dynata_rex.exceptions.RexServiceException):
+            run(requester.get('https://not-a-real-url-abcdefg.com'))
+    assert len(send.calls) == dynata_rex.helpers.DEFAULT_RETRIES
+    for call in wait_method.call_args_list:
+        assert call[0][1] >= 2
+
+
+@patch('dynata_rex.aio.signer.wait')
+@patch.object(dynata_rex.signer.Signer, 'create_expiration_date')
+def test_async_requester_resigns_retries(expiration, wait_method):
+    async def _wait(try_number, interval=None):
+        return None
+    wait_method.side_effect = _wait
+    expiration.side_effect = ["2000-01-01T00:00:0%d.000Z" % i
+                              for i in range(10)]
+
+    send = fake_send(503)
+    with patch.object(AsyncRexRequest, '_send', send):
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        with pytest.raises(dynata_rex.exceptions.RexServiceException):
+            run(requester.get('https://not-a-real-url-abcdefg.com'))
+    signatures = {call[3]['dynata-signature'] for call in send.calls}
+    assert len(signatures) == len(send.calls)
+
+
+def test_async_requester_invalid_method():
+    requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+    with pytest.raises(AttributeError):
+        run(requester.dispatch('https://not-a-real-url-abcdefg.com',
+                               method='NOT_A_METHOD'))
+
+
+def test_async_receive_notifications():
+    data = TEST_DATA['test_receive_notifications']
+    send = fake_send(200, json.dumps(data).encode())
+
+    async def _run():
+        async with AsyncOpportunityRegistry(ACCESS_KEY,
+                                            SECRET_KEY,
+                                            BASE_URL) as registry:
+            return await registry.receive_notifications()
+
+    with patch.object(AsyncRexRequest, '_send', send):
+        r = run(_run())
+
+    assert len(r) == len(data)
+    for opportunity in r:
+        assert isinstance(opportunity, dynata_rex.models.Opportunity)
+    assert send.calls[0][1] == f'{BASE_URL}/receive-notifications'
+
+
+def test_async_receive_notifications_acks_invalid_together():
+    data = TEST_DATA['test_receive_notifications'] + [{"id": 999999},
+                                                      {"id": 999998}]
+    send = fake_send(200, json.dumps(data).encode())
+    registry = AsyncOpportunityRegistry(ACCESS_KEY, SECRET_KEY, BASE_URL)
+
+    with patch.object(AsyncRexRequest, '_send', send):
+        r = run(registry.receive_notifications())
+
+    assert len(r) == len(data) - 2
+    assert len(send.calls) == 2
+    assert send.calls[1][1] == f'{BASE_URL}/ack-notifications'
+    assert send.calls[1][2] == registry.make_request.codec.dumps(
+        [999999, 999998])
+
+
+def test_async_ack_notifications():
+    send = fake_send(204)
+    registry = AsyncOpportunityRegistry(ACCESS_KEY, SECRET_KEY, BASE_URL)
+    with patch.object(AsyncRexRequest, '_send', send):
+        run(registry.ack_notifications([1, 2, 3]))
+    assert send.calls[0][1] == f'{BASE_URL}/ack-notifications'
+    assert send.calls[0][2] == registry.make_request.codec.dumps([1, 2, 3])
+
+
+def fake_stream(content, size=7):
+    """Build a replacement for AsyncRexRequest.stream"""
+    calls = []
+
+    async def _stream(self, url, data='', method='POST', chunk_size=None):
+        calls.append((url, data))
+        for i in range(0, len(content), size):
+            yield content[i:i + size]
+
+    _stream.calls = calls
+    return _stream
+
+
+def test_async_download_collection():
+    data = TEST_DATA['test_download_collection']
+    registry = AsyncOpportunityRegistry(ACCESS_KEY, SECRET_KEY, BASE_URL)
+    stream = fake_stream(data.encode())
+    with patch.object(AsyncRexRequest, 'stream', stream):
+        r = run(registry.download_collection('1234567'))
+    assert r == data.split('\n')
+    assert stream.calls[0] == (f'{BASE_URL}/download-collection',
+                               {"id": "1234567"})
+
+
+def test_async_download_collection_to_file(tmp_path):
+    data = TEST_DATA['test_download_invite_collection']
+    registry = AsyncOpportunityRegistry(ACCESS_KEY, SECRET_KEY, BASE_URL)
+    destination = tmp_path / 'invites.txt'
+    with patch.object(AsyncRexRequest, 'stream', fake_stream(data.encode())):
+        written = run(registry.download_invite_collection_to_file(
+            '1234567', str(destination)))
+    assert written == len(data.encode())
+    assert destination.read_text() == data
+
+
+class FakeStreamSession:
+    """Stands in for aiohttp.ClientSession, records request() kwargs"""
+    closed = False
+
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(kwargs)
+        response = self
+
+        class _Response:
+            status = 200
+
+            class content:
+                @staticmethod
+                async def iter_chunked(size):
+                    yield response.content
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return None
+
+        return _Response()
+
+
+def test_async_stream_has_no_total_timeout():
+    async def _run():
+        return [chunk async for chunk in
+                requester.stream(f'{BASE_URL}/download-collection')]
+
+    session = FakeStreamSession(b'a\nb')
+    requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY, request_timeout=5,
+                                session=session)
+    assert run(_run()) == [b'a\nb']
+    timeout = session.calls[0]['timeout']
+    assert timeout.total is None
+    assert timeout.sock_read == 5
+
+
+def test_async_create_context():
+    send = fake_send(200, json.dumps({"id": "context-id"}).encode())
+    gateway = AsyncRespondentGateway(ACCESS_KEY, SECRET_KEY, BASE_URL)
+    with patch.object(AsyncRexRequest, '_send', send):
+        r = run(gateway.create_context('context-id', {"gender": "male"}))
+    assert r == 'context-id'
+    assert send.calls[0][1] == f'{BASE_URL}/create-context'
+
+
+def test_async_registry_has_no_threaded_helpers():
+    registry = AsyncOpportunityRegistry(ACCESS_KEY, SECRET_KEY, BASE_URL)
+    for name in ('consume', 'consume_invites', 'notification_acks',
+                 'invite_acks', 'collection_cache', 'cached_collection',
+                 'cached_invite_collection'):
+        assert not hasattr(registry, name)
+    assert not isinstance(registry, dynata_rex.OpportunityRegistry)
+
+
+def test_async_session_is_pooled_and_reused():
+    async def _run():
+        requester = AsyncRexRequest(ACCESS_KEY, SECRET_KEY)
+        session = requester._get_session()
+        assert requester._get_session() is session
+        assert isinstance(session.connector, aiohttp.TCPConnector)
+        await requester.close()
+        assert session.closed
+
+    run(_run())
@@ -0,0 +1,214 @@
+"""
+Package: src.tests
+Filename: test_bulk.py
+Author(s): Grant W
+
+Description: Tests for vectorized bulk qualification
+"""
+# Python Imports
+from collections import Counter
+from unittest.mock import patch
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex.models import Opportunity
+from dynata_rex.targeting import CompiledTargeting
+
+# Local Imports
+from .shared import TEST_DATA, cell, opportunity
+
+np = pytest.importorskip('numpy')
+bulk = pytest.importorskip('dynata_rex.bulk')
+
+RAW = TEST_DATA['test_receive_notifications'][1]
+AGE, GENDER, POSTAL_CODE, REGION = 80, 1, 8, 3
+COLLECTIONS = {'2169971': {'90210', '10001'}}
+
+
+OPPORTUNITIES = [
+    Opportunity(**RAW),
+    opportunity(id=2,
+                cells=[cell('male', GENDER, 'VALUE', value='1'),
+                       cell('female', GENDER, 'VALUE', value='2'),
+                       cell('adult', AGE, 'RANGE',
+                            range={'from': 18, 'to': None}),
+                       cell('not-south', REGION, 'LIST', negate=True,
+                            list=['3', '4'])],
+                filters=[[['male', 'adult'], ['female']], [['not-south']]]),
+    opportunity(id=3,
+                cells=[cell('young', AGE, 'RANGE',
+                            range={'from': 18, 'to': 34}),
+                       cell('old', AGE, 'RANGE',
+                            range={'from': 35, 'to': None})],
+                filters=[],
+                quotas=[[{'id': 'y', 'cells': ['young'], 'count': 0,
+                          'status': 'CLOSED'},
+                         {'id': 'o', 'cells': ['old'], 'count': 5,
+                          'status': 'OPEN'}]]),
+]
+
+PANEL = {
+    AGE: np.array([30, 17, 45, 22, np.nan, 60, 35]),
+    GENDER: np.array(['1', '1', '2', '2', '1', '', '1'], dtype=object),
+    POSTAL_CODE: np.array(['90210', '90210', '10001', '60601', '90210',
+                           '90210', None], dtype=object),
+    REGION: np.array([1, 3, 2, 4, 1, 2, 5]),
+}
+
+
+def profiles():
+    for row in range(len(PANEL[AGE])):
+        profile = {}
+        for attribute_id, column in PANEL.items():
+            value = column[row]
+            if value is None or value == '' or \
+                    (isinstance(value, float) and np.isnan(value)):
+                continue
+            profile[attribute_id] = value
+        yield profile
+
+
+def test_matrix_matches_scalar_evaluator():
+    matrix = bulk.qualification_matrix(PANEL, OPPORTUNITIES, COLLECTIONS)
+
+    expected = np.array([
+        [CompiledTargeting(o, COLLECTIONS).qualifies(profile)
+         for o in OPPORTUNITIES]
+        for profile in profiles()
+    ])
+    assert matrix.shape == (7, 3)
+    assert matrix.dtype == bool
+    assert (matrix == expected).all()
+    assert matrix[:, 0].tolist() == \
+        [True, False, False, False, False, False, False]
+    assert matrix[:, 2].tolist() == \
+        [False, False, True, False, False, True, True]
+
+
+def test_chunks_cover_the_panel():
+    full = bulk.qualification_matrix(PANEL, OPPORTUNITIES, COLLECTIONS)
+
+    chunks = list(bulk.iter_qualification(PANEL, OPPORTUNITIES, COLLECTIONS,
+                                          chunk_size=3))
+
+    assert [start for start, _ in chunks] == [0, 3, 6]
+    assert [len(matrix) for _, matrix in chunks] == [3, 3, 1]
+    assert (np.vstack([matrix for _, matrix in chunks]) == full).all()
+
+
+def test_fills_given_output(tmp_path):
+    out = np.lib.format.open_memmap(str(tmp_path / 'matrix.npy'), mode='w+',
+                                    dtype=bool, shape=(7, 3))
+
+    result = bulk.qualification_matrix(PANEL, OPPORTUNITIES, COLLECTIONS,
+                                       chunk_size=2, out=out)
+
+    assert result is out
+    assert out[:, 0].tolist() == \
+        [True, False, False, False, False, False, False]
+    with pytest.raises(ValueError):
+        bulk.qualification_matrix(PANEL, OPPORTUNITIES, COLLECTIONS,
+                                  out=np.empty((1, 1), dtype=bool))
+
+
+def test_shared_cells_are_computed_once_per_chunk():
+    chunk = bulk._Chunk(bulk._columns(PANEL), 0, 7)
+    compiled = bulk.compile_bulk(OPPORTUNITIES * 2, COLLECTIONS)
+    for targeting in compiled:
+        targeting.evaluate(chunk)
+
+    # Identical cells of different opportunities share one mask
+    assert len(chunk._masks) == 7
+
+
+def test_masks_are_dropped_once_no_opportunity_needs_them():
+    compiled = bulk.compile_bulk(OPPORTUNITIES * 2, COLLECTIONS)
+    uses = Counter(key for targeting in compiled for key in targeting.keys)
+    chunk = bulk._Chunk(bulk._columns(PANEL), 0, 7, uses)
+    for targeting in compiled[:3]:
+        targeting.evaluate(chunk)
+        chunk.release(targeting.keys)
+    # Still needed by the copies
+    assert len(chunk._masks) == 7
+
+    for targeting in compiled[3:]:
+        targeting.evaluate(chunk)
+        chunk.release(targeting.keys)
+    assert chunk._masks == {}
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'filters': [[['missing']]]},
+    {'filters': [], 'quotas': [[{'id': 'q', 'cells': ['missing'], 'count': 1,
+                                 'status': 'CLOSED'}]]},
+])
+def test_unknown_cells_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        bulk.BulkTargeting(opportunity(id=4, cells=[], **kwargs))
+
+
+def test_missing_collection_is_rejected():
+    with pytest.raises(ValueError):
+        bulk.BulkTargeting(OPPORTUNITIES[0])
+
+
+def test_columns_are_converted_once():
+    panel = {attribute_id: column.tolist()
+             for attribute_id, column in PANEL.items()}
+    with patch.object(bulk, '_Chunk', wraps=bulk._Chunk) as chunk:
+        chunks = list(bulk.iter_qualification(panel, OPPORTUNITIES,
+                                              COLLECTIONS, chunk_size=2))
+
+    assert chunk.call_count == 4
+    columns = chunk.call_args_list[0][0][0]
+    assert all(isinstance(column, np.ndarray)
+               for column in columns.values())
+    # Every chunk slices the same arrays
+    assert all(call[0][0] is columns for call in chunk.call_args_list)
+    full = bulk.qualification_matrix(PANEL, OPPORTUNITIES, COLLECTIONS)
+    assert (np.vstack([matrix for _, matrix in chunks]) == full).all()
+
+
+def test_values_compare_as_strings_like_the_scalar_evaluator():
+    opportunities = [
+        opportunity(id=1,
+                    cells=[cell('zip', POSTAL_CODE, 'VALUE',
+                                value='01234')],
+                    filters=[[['zip']]]),
+        opportunity(id=2,
+                    cells=[cell('region', REGION, 'LIST', list=['3'])],
+                    filters=[[['region']]]),
+    ]
+    panels = [
+        {POSTAL_CODE: np.array([1234, 1234]),
+         REGION: np.array([3, 4])},
+        {POSTAL_CODE: np.array(['01234', 1234], dtype=object),
+         REGION: np.array([3.0, np.nan])},
+    ]
+
+    for panel in panels:
+        matrix = bulk.qualification_matrix(panel, opportunities)
+        expected = [[CompiledTargeting(o).qualifies(
+            {POSTAL_CODE: panel[POSTAL_CODE][row],
+             REGION: panel[REGION][row]})
+            for o in opportunities] for row in range(2)]
+        assert matrix.tolist() == expected
+
+    # Zero padded codes need string columns, float columns hold '3.0'
+    assert bulk.qualification_matrix(panels[0], opportunities).tolist() == \
+        [[False, True], [False, False]]
+    assert bulk.qualification_matrix(panels[1], opportunities).tolist() == \
+        [[True, False], [False, False]]
+
+
+def test_missing_attribute_column():
+    panel = {GENDER: np.array(['1', '2'])}
+    matrix = bulk.qualification_matrix(panel, OPPORTUNITIES[1:2])
+    assert matrix[:, 0].tolist() == [False, False]
+
+
+def test_ragged_panel():
+    with pytest.raises(ValueError):
+        bulk.qualification_matrix({1: [1, 2], 2: [1]}, OPPORTUNITIES[1:2])
@@ -0,0 +1,160 @@
+"""
+Package: src.tests
+Filename: test_circuit_breaker.py
+Author(s): Grant W
+
+Description: Tests for the per-endpoint circuit breaker
+"""
+# Python Imports
+from unittest.mock import patch
+import time
+
+# Third Party Imports
+import requests
+import pytest
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex import CircuitBreaker, CircuitStateEnum, CircuitOpenException
+from dynata_rex.signer import RexRequest
+
+# Local Imports
+from .shared import ACCESS_KEY, SECRET_KEY, BASE_URL, ResponseMock
+
+ENDPOINT = f'{BASE_URL}/receive-notifications'
+
+
+def _fail(breaker, url=ENDPOINT, count=1, duration=0.1):
+    for _ in range(count):
+        generation = breaker.before_call(url)
+        breaker.record(url, success=False, duration=duration,
+                       generation=generation)
+
+
+def test_opens_on_failure_rate():
+    breaker = CircuitBreaker(minimum_calls=4, failure_rate_threshold=0.5)
+    _fail(breaker, count=3)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.CLOSED
+    _fail(breaker)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.OPEN
+    assert not breaker.allows(ENDPOINT)
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call(ENDPOINT)
+
+
+def test_opens_on_slow_calls():
+    breaker = CircuitBreaker(minimum_calls=2,
+                             slow_call_duration=1,
+                             slow_call_rate_threshold=1.0)
+    for _ in range(2):
+        breaker.before_call(ENDPOINT)
+        breaker.record(ENDPOINT, success=True, duration=5)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.OPEN
+
+
+def test_circuits_are_per_endpoint():
+    breaker = CircuitBreaker(minimum_calls=1)
+    _fail(breaker)
+    assert breaker.state('/receive-notifications') is CircuitStateEnum.OPEN
+    assert breaker.state(f'{BASE_URL}/ack-notifications') is \
+        CircuitStateEnum.CLOSED
+
+
+@patch.object(time, 'monotonic')
+def test_half_open_probe_closes_circuit(monotonic):
+    monotonic.return_value = 100
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=30)
+    _fail(breaker)
+    monotonic.return_value = 131
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.HALF_OPEN
+
+    breaker.before_call(ENDPOINT)
+    # Only one probe in flight at a time
+    assert not breaker.allows(ENDPOINT)
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call(ENDPOINT)
+
+    breaker.record(ENDPOINT, success=True, duration=0.1)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.CLOSED
+
+
+@patch.object(time, 'monotonic')
+def test_half_open_probe_failure_reopens(monotonic):
+    monotonic.return_value = 100
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=30)
+    _fail(breaker)
+    monotonic.return_value = 131
+    _fail(breaker)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.OPEN
+
+
+@patch.object(time, 'monotonic')
+def test_calls_from_before_half_open_are_not_probes(monotonic):
+    monotonic.return_value = 100
+    breaker = CircuitBreaker(minimum_calls=2, open_duration=30)
+    # Reserved while closed, still in flight when the circuit opens
+    late = breaker.before_call(ENDPOINT)
+    _fail(breaker, count=2)
+    monotonic.return_value = 131
+    probe = breaker.before_call(ENDPOINT)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.HALF_OPEN
+
+    # The late success neither closes the circuit nor frees a probe slot
+    breaker.record(ENDPOINT, success=True, duration=0.1, generation=late)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.HALF_OPEN
+    assert not breaker.allows(ENDPOINT)
+
+    breaker.record(ENDPOINT, success=True, duration=0.1, generation=probe)
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.CLOSED
+
+
+def test_snapshot():
+    breaker = CircuitBreaker(minimum_calls=10)
+    _fail(breaker, count=2)
+    breaker.before_call(ENDPOINT)
+    breaker.record(ENDPOINT, success=True, duration=0.1)
+    snapshot = breaker.snapshot()['/receive-notifications']
+    assert snapshot['state'] is CircuitStateEnum.CLOSED
+    assert snapshot['calls'] == 3
+    assert snapshot['failure_rate'] == pytest.approx(2 / 3)
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.Session, "post")
+def test_rex_request_fails_fast_when_open(session_post, wait_method):
+    session_post.return_value = ResponseMock._response_mock(500)
+    breaker = CircuitBreaker(minimum_calls=2)
+    requester = RexRequest(ACCESS_KEY, SECRET_KEY, circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(dynata_rex.exceptions.RexServiceException):
+            requester.post(ENDPOINT, data={"limit": 1})
+    assert session_post.call_count == 2
+
+    with pytest.raises(CircuitOpenException):
+        requester.post(ENDPOINT, data={"limit": 1})
+    assert session_post.call_count == 2
+
+
+@patch.object(requests.Session, "post")
+def test_client_errors_do_not_open_circuit(session_post):
+    session_post.return_value = ResponseMock._response_mock(400)
+    breaker = CircuitBreaker(minimum_calls=2)
+    registry = dynata_rex.OpportunityRegistry(ACCESS_KEY, SECRET_KEY,
+                                              BASE_URL,
+                                              circuit_breaker=breaker)
+    for _ in range(3):
+        with pytest.raises(dynata_rex.exceptions.RexServiceException):
+            registry.ack_notifications([1])
+    assert breaker.state(f'{BASE_URL}/ack-notifications') is \
+        CircuitStateEnum.CLOSED
+
+
+@patch.object(requests.Session, "post")
+def test_exceptions_count_as_failures(session_post):
+    session_post.side_effect = dynata_rex.exceptions.HttpTimeoutException()
+    breaker = CircuitBreaker(minimum_calls=1)
+    requester = RexRequest(ACCESS_KEY, SECRET_KEY, circuit_breaker=breaker)
+    with pytest.raises(dynata_rex.exceptions.HttpTimeoutException):
+        requester.post(ENDPOINT, data={"limit": 1})
+    assert breaker.state(ENDPOINT) is CircuitStateEnum.OPEN
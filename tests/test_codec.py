@@ -0,0 +1,83 @@
+"""
+Package: src.tests
+Filename: test_codec.py
+Author(s): Grant W
+
+Description: Tests for the json codecs
+"""
+# Python Imports
+from unittest.mock import patch
+import hashlib
+import json
+
+# Third Party Imports
+import requests
+import pytest
+
+# Dynata Imports
+from dynata_rex import codec
+from dynata_rex.signer import RexRequest, Signer
+
+# Local Imports
+from .shared import ACCESS_KEY, SECRET_KEY, ResponseMock
+
+PAYLOAD = {"limit": 10, "shards": {"count": 1, "current": 1}, "name": "é"}
+
+
+def _codecs():
+    out = [codec.JsonCodec()]
+    if codec.orjson is not None:
+        out.append(codec.OrjsonCodec())
+    return out
+
+
+@pytest.mark.parametrize('json_codec', _codecs(), ids=lambda c: c.name)
+def test_codec_round_trip(json_codec):
+    encoded = json_codec.dumps(PAYLOAD)
+    assert isinstance(encoded, bytes)
+    assert json_codec.loads(encoded) == PAYLOAD
+    with pytest.raises(ValueError):
+        json_codec.loads(b'not json')
+
+
+@pytest.mark.parametrize('json_codec', _codecs(), ids=lambda c: c.name)
+def test_codec_encodes_what_json_does(json_codec):
+    payload = {1: 'a', 'big': 2 ** 70, 'nested': [{2: None}]}
+    assert json_codec.loads(json_codec.dumps(payload)) == \
+        json.loads(json.dumps(payload))
+
+
+def test_default_codec_prefers_orjson():
+    expected = codec.OrjsonCodec if codec.orjson is not None \
+        else codec.JsonCodec
+    assert isinstance(codec.get_default_codec(), expected)
+
+
+@patch.object(codec, 'orjson', None)
+def test_default_codec_falls_back_to_json():
+    assert isinstance(codec.get_default_codec(), codec.JsonCodec)
+    with pytest.raises(ImportError):
+        codec.OrjsonCodec()
+
+
+def test_signing_string_accepts_bytes():
+    signer = Signer(ACCESS_KEY, SECRET_KEY)
+    body = json.dumps(PAYLOAD)
+    assert signer._create_request_body_signing_string(body) == \
+        signer._create_request_body_signing_string(body.encode('utf-8'))
+
+
+@pytest.mark.parametrize('json_codec', _codecs(), ids=lambda c: c.name)
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_dispatch_signs_and_sends_same_buffer(adapter_send, json_codec):
+    adapter_send.return_value = ResponseMock._response_mock(
+        200, content=json.dumps({"whoo": "hoo"}))
+    requester = RexRequest(ACCESS_KEY, SECRET_KEY, codec=json_codec)
+
+    r = requester.post('https://not-a-real-url-abcdefg.com', data=PAYLOAD)
+
+    assert r == {"whoo": "hoo"}
+    sent = adapter_send.call_args[0][0]
+    assert sent.body == json_codec.dumps(PAYLOAD)
+    assert sent.headers['dynata-signing-string'] == \
+        hashlib.sha256(sent.body).hexdigest()
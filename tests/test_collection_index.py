@@ -0,0 +1,116 @@
+"""
+Package: src.tests
+Filename: test_collection_index.py
+Author(s): Grant W
+
+Description: Tests for compiled collections
+"""
+# Python Imports
+import threading
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex import OpportunityRegistry
+from dynata_rex.collection_index import (BloomFilter, CollectionCache,
+                                         CompiledCollection)
+from dynata_rex.models import Opportunity
+from dynata_rex.targeting import CompiledTargeting
+
+# Local Imports
+from .shared import TEST_DATA
+
+RAW = TEST_DATA['test_receive_notifications'][1]
+POSTAL_CODES = [f"{code:05d}" for code in range(0, 20000, 2)]
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(len(POSTAL_CODES), error_rate=0.01)
+    for code in POSTAL_CODES:
+        bloom.add(code)
+
+    assert all(code in bloom for code in POSTAL_CODES)
+    misses = [f"{code:05d}" for code in range(1, 20000, 2)]
+    false_positives = sum(code in bloom for code in misses)
+    assert false_positives < len(misses) * 0.03
+
+
+def test_bloom_filter_validates_error_rate():
+    with pytest.raises(ValueError):
+        BloomFilter(10, error_rate=1)
+
+
+@pytest.mark.parametrize('exact', ['set', 'sorted'])
+@pytest.mark.parametrize('bloom', [False, True])
+def test_compiled_collection_membership(exact, bloom):
+    collection = CompiledCollection('1', POSTAL_CODES + ['00000'],
+                                    exact=exact, bloom=bloom)
+
+    assert len(collection) == len(POSTAL_CODES)
+    assert '00000' in collection
+    assert '19998' in collection
+    assert '00001' not in collection
+    assert '99999' not in collection
+    assert '' not in collection
+    # Compared as strings, like targeting cells
+    assert 10000 in collection
+    assert sorted(collection) == sorted(POSTAL_CODES)
+
+
+def test_compiled_collection_validates_exact():
+    with pytest.raises(ValueError):
+        CompiledCollection('1', [], exact='list')
+
+
+def test_cache_loads_each_collection_once():
+    calls = []
+
+    def loader(collection_id):
+        calls.append(collection_id)
+        return iter(['90210', '10001'])
+
+    cache = CollectionCache(loader, bloom=True)
+    threads = [threading.Thread(target=lambda: cache['2169971'])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['2169971']
+    assert cache[2169971] is cache['2169971']
+    assert list(cache) == ['2169971']
+    assert '90210' in cache['2169971']
+
+    cache.invalidate('2169971')
+    cache['2169971']
+    assert calls == ['2169971', '2169971']
+
+
+def test_cache_shared_between_opportunities():
+    calls = []
+
+    def loader(collection_id):
+        calls.append(collection_id)
+        return ['90210', '10001']
+
+    cache = CollectionCache(loader)
+    first = CompiledTargeting(Opportunity(**RAW), cache)
+    second = CompiledTargeting(Opportunity(**{**RAW, 'id': 2}), cache)
+
+    profile = {80: 30, 1: '1', 8: '90210'}
+    assert first.qualifies(profile)
+    assert second.qualifies(profile)
+    assert not second.qualifies({**profile, 8: '60601'})
+    assert calls == ['2169971']
+
+
+def test_registry_collection_cache():
+    registry = OpportunityRegistry('key', 'secret')
+    registry.iter_collection = lambda collection_id: iter(['a', 'b'])
+
+    cache = registry.collection_cache(exact='sorted')
+
+    assert 'b' in cache['1']
+    assert cache['1'].exact == 'sorted'
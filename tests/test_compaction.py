@@ -0,0 +1,148 @@
+"""
+Package: src.tests
+Filename: test_compaction.py
+Author(s): Grant W
+
+Description: Tests for notification compaction
+"""
+# Python Imports
+import threading
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex import Compactor
+from dynata_rex.consumer import Consumer
+
+# Local Imports
+from .shared import (TEST_DATA,
+                     batches_then_empty,
+                     opportunity,
+                     wait_for)
+
+RAW = TEST_DATA['test_receive_notifications'][1]
+
+
+def test_latest_notification_wins():
+    compactor = Compactor()
+    first = opportunity(completes=1)
+    other = opportunity(id=2)
+    latest = opportunity(completes=2)
+
+    assert compactor.collapse([first, other, latest]) == [other, latest]
+    assert compactor.stats == {'received': 3, 'collapsed': 1,
+                               'unchanged': 0, 'handed': 2}
+
+
+def test_unchanged_redeliveries_are_skipped():
+    compactor = Compactor()
+    handled = compactor.collapse([opportunity()])
+    compactor.record(handled)
+
+    # Equal content, not the same object
+    assert compactor.collapse([opportunity()]) == []
+    assert compactor.collapse([opportunity(completes=5)]) == \
+        [opportunity(completes=5)]
+    assert compactor.stats['unchanged'] == 1
+
+    compactor.forget(RAW['id'])
+    assert compactor.collapse([opportunity()]) == [opportunity()]
+
+
+def test_recent_ids_are_bounded():
+    compactor = Compactor(recent=2)
+    compactor.record([opportunity(id=i) for i in range(1, 4)])
+
+    assert list(compactor._recent) == [2, 3]
+    assert compactor.collapse([opportunity(id=1)]) == [opportunity(id=1)]
+    assert compactor.collapse([opportunity(id=3)]) == []
+
+    disabled = Compactor(recent=0)
+    disabled.record([opportunity()])
+    assert disabled.collapse([opportunity()]) == [opportunity()]
+
+
+def test_validates_arguments():
+    with pytest.raises(ValueError):
+        Compactor(max_size=0)
+    with pytest.raises(ValueError):
+        Compactor(window=-1)
+
+
+def test_consumer_merges_batches_within_window():
+    fetch = batches_then_empty([opportunity(completes=1)],
+                               [opportunity(completes=2), opportunity(id=2)],
+                               [opportunity(completes=2)])
+    handled = []
+    acked = []
+
+    consumer = Consumer(fetch, handled.append, acked.append, prefetch=3,
+                        idle_delay=0.01,
+                        compactor=Compactor(window=0.5)).start()
+    wait_for(lambda: len(acked) == 3)
+    consumer.stop()
+
+    # Ordered by latest arrival
+    assert handled == [[opportunity(id=2), opportunity(completes=2)]]
+    # Collapsed notifications are acknowledged with their batches
+    assert acked == [[RAW['id']], [RAW['id'], 2], [RAW['id']]]
+    assert consumer.stats['batches'] == 3
+    assert consumer.stats['items'] == 4
+    assert consumer.stats['skipped'] == 2
+
+
+def test_consumer_skips_handler_for_unchanged_batches():
+    compactor = Compactor(window=0)
+    compactor.record([opportunity()])
+    fetch = batches_then_empty([opportunity()])
+    handled = []
+    acked = []
+
+    consumer = Consumer(fetch, handled.append, acked.append,
+                        idle_delay=0.01, compactor=compactor).start()
+    wait_for(lambda: acked == [[RAW['id']]])
+    consumer.stop()
+
+    assert handled == []
+
+
+def test_consumer_merge_stops_at_max_size():
+    release = threading.Event()
+    fetch = batches_then_empty([opportunity(id=1)], [opportunity(id=2)],
+                               [opportunity(id=3)])
+    handled = []
+
+    def handler(batch):
+        handled.append([o.id for o in batch])
+
+    def fetch_later(limit):
+        release.wait(2)
+        return fetch(limit)
+
+    consumer = Consumer(fetch_later, handler, lambda ids: None, prefetch=3,
+                        idle_delay=0.01,
+                        compactor=Compactor(window=1, max_size=2)).start()
+    release.set()
+    wait_for(lambda: sum(map(len, handled)) == 3, timeout=8)
+    consumer.stop()
+
+    assert handled[0] == [1, 2]
+
+
+def test_failed_handler_leaves_merged_batches_unacknowledged():
+    compactor = Compactor(window=0.2)
+    fetch = batches_then_empty([opportunity()], [opportunity(id=2)])
+    acked = []
+
+    def failing(batch):
+        raise ValueError('boom')
+
+    consumer = Consumer(fetch, failing, acked.append, prefetch=2,
+                        idle_delay=0.01, compactor=compactor).start()
+    wait_for(lambda: consumer.stats['handler_errors'] == 1)
+    consumer.stop()
+
+    assert acked == []
+    # Not remembered, so a redelivery is handled
+    assert compactor.collapse([opportunity()]) == [opportunity()]
@@ -0,0 +1,130 @@
+"""
+Package: src.tests
+Filename: test_consumer.py
+Author(s): Grant W
+
+Description: Tests for the continuous consumer
+"""
+# Python Imports
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Third Party Imports
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex.consumer import Consumer
+
+# Local Imports
+from .shared import (ACCESS_KEY,
+                     SECRET_KEY,
+                     BASE_URL,
+                     batches_then_empty,
+                     wait_for)
+
+
+def items(*ids):
+    return [SimpleNamespace(id=i) for i in ids]
+
+
+def test_consumer_handles_and_acks_every_batch():
+    fetch = batches_then_empty(items(1, 2), items(3))
+    handled = []
+    acked = []
+
+    consumer = Consumer(fetch, handled.append, acked.append,
+                        limit=5, idle_delay=0.01).start()
+    wait_for(lambda: len(acked) == 2)
+    consumer.stop()
+
+    assert [[i.id for i in batch] for batch in handled] == [[1, 2], [3]]
+    assert acked == [[1, 2], [3]]
+    assert set(fetch.calls) == {5}
+    assert consumer.stats['items'] == 3
+    assert consumer.stats['acked'] == 3
+    assert not consumer.running
+
+
+def test_consumer_fetches_while_handling():
+    fetch = batches_then_empty(items(1), items(2), items(3))
+    release = threading.Event()
+
+    def handler(batch):
+        release.wait(2)
+
+    consumer = Consumer(fetch, handler, lambda ids: None,
+                        prefetch=1, idle_delay=0.01).start()
+    # First batch is blocked in the handler, the second sits prefetched and
+    # the third is fetched and waiting for room in the queue
+    wait_for(lambda: len(fetch.calls) == 3)
+    assert consumer.stats['batches'] == 0
+    release.set()
+    wait_for(lambda: consumer.stats['batches'] == 3)
+    consumer.stop()
+
+
+def test_consumer_leaves_failed_batch_unacknowledged():
+    fetch = batches_then_empty(items(1), items(2))
+    acked = []
+
+    def handler(batch):
+        if batch[0].id == 1:
+            raise ValueError('boom')
+
+    consumer = Consumer(fetch, handler, acked.append,
+                        idle_delay=0.01).start()
+    wait_for(lambda: acked == [[2]])
+    consumer.stop()
+
+    assert consumer.stats['handler_errors'] == 1
+
+
+def test_consumer_backs_off_on_empty_polls():
+    fetch = batches_then_empty()
+    waits = []
+
+    consumer = Consumer(fetch, lambda batch: None, lambda ids: None,
+                        idle_delay=1, max_idle_delay=4)
+    with patch.object(consumer._stopping, 'wait',
+                      side_effect=lambda delay: waits.append(delay)
+                      or len(waits) >= 5):
+        with patch.object(consumer._stopping, 'is_set',
+                          side_effect=lambda: len(waits) >= 5):
+            consumer._fetch_loop()
+
+    assert waits == [1, 2, 4, 4, 4]
+    assert consumer.stats['empty_polls'] == 5
+
+
+def test_consumer_backs_off_on_fetch_errors():
+    def fetch(limit):
+        raise dynata_rex.RexServiceException('down')
+
+    consumer = Consumer(fetch, lambda batch: None, lambda ids: None,
+                        idle_delay=0.01).start()
+    wait_for(lambda: consumer.stats['fetch_errors'] >= 2)
+    consumer.stop()
+
+    assert consumer.stats['batches'] == 0
+
+
+@patch.object(dynata_rex.OpportunityRegistry, 'ack_notifications')
+@patch.object(dynata_rex.OpportunityRegistry, 'receive_notifications')
+def test_registry_consume(receive, ack):
+    registry = dynata_rex.OpportunityRegistry(ACCESS_KEY, SECRET_KEY,
+                                              BASE_URL)
+    receive.side_effect = batches_then_empty(items(7, 8))
+    handled = []
+
+    consumer = registry.consume(handled.append, limit=2, idle_delay=0.01)
+    wait_for(lambda: consumer.stats['acked'] == 2)
+    consumer.stop()
+
+    kwargs = receive.call_args_list[0].kwargs
+    assert kwargs['limit'] == 2
+    assert kwargs['lazy'] is False
+    assert isinstance(kwargs['acks'], dynata_rex.AckBuffer)
+    # Acks are buffered and flushed as one request when the consumer stops
+    assert ack.call_args_list == [(([7, 8],),)]
+    assert len(handled) == 1
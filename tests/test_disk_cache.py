@@ -0,0 +1,222 @@
+"""
+Package: src.tests
+Filename: test_disk_cache.py
+Author(s): Grant W
+
+Description: Tests for the on-disk collection cache
+"""
+# Python Imports
+from unittest.mock import patch
+import fcntl
+import io
+import os
+import threading
+import time
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+import dynata_rex.disk_cache
+from dynata_rex import OpportunityRegistry
+from dynata_rex.disk_cache import (CollectionDiskCache, MappedCollection,
+                                   write_collection)
+from dynata_rex.targeting import CompiledTargeting
+from dynata_rex.models import Opportunity
+
+# Local Imports
+from .shared import TEST_DATA
+
+RAW = TEST_DATA['test_receive_notifications'][1]
+POSTAL_CODES = [f"{code:05d}" for code in range(0, 2000, 2)]
+
+
+def test_write_and_map_collection(tmp_path):
+    path = str(tmp_path / 'codes.rexc')
+    with open(path, 'wb') as f:
+        digest = write_collection(POSTAL_CODES + ['00000', 'é', '12345'], f)
+
+    with MappedCollection(path, '1') as collection:
+        assert len(collection) == len(POSTAL_CODES) + 2
+        assert '00000' in collection
+        assert '01998' in collection
+        assert 'é' in collection
+        assert '00001' not in collection
+        assert '' not in collection
+        assert 'zzz' not in collection
+        assert 12345 in collection
+        assert list(collection)[:2] == ['00000', '00002']
+
+    # Digest depends on the values only
+    again = io.BytesIO()
+    assert write_collection(reversed(POSTAL_CODES + ['12345', 'é']),
+                            again) == digest
+    assert write_collection(['ab', 'c'], io.BytesIO()) != \
+        write_collection(['a', 'bc'], io.BytesIO())
+
+
+def test_empty_and_corrupt_files(tmp_path):
+    path = str(tmp_path / 'empty.rexc')
+    with open(path, 'wb') as f:
+        write_collection([], f)
+    with MappedCollection(path) as collection:
+        assert len(collection) == 0
+        assert 'a' not in collection
+
+    bad = tmp_path / 'bad.rexc'
+    bad.write_bytes(b'nope' + b'\0' * 20)
+    with pytest.raises(ValueError):
+        MappedCollection(str(bad))
+
+
+def test_get_or_load_survives_restarts(tmp_path):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return iter(POSTAL_CODES)
+
+    cache = CollectionDiskCache(str(tmp_path))
+    assert cache.get('collection-1') is None
+    assert '00010' in cache.get_or_load('collection-1', loader)
+
+    # A new process only maps the file
+    restarted = CollectionDiskCache(str(tmp_path))
+    assert '00010' in restarted.get_or_load('collection-1', loader)
+    assert len(calls) == 1
+
+    restarted.invalidate('collection-1')
+    assert restarted.get('collection-1') is None
+
+
+def test_identical_collections_share_a_blob(tmp_path):
+    cache = CollectionDiskCache(str(tmp_path))
+    first = cache.put('collection-1', POSTAL_CODES)
+    second = cache.put('invite-7', reversed(POSTAL_CODES))
+
+    assert first.path == second.path
+    assert len(os.listdir(tmp_path / 'blobs')) == 1
+
+
+def test_concurrent_misses_load_once(tmp_path):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return POSTAL_CODES
+
+    caches = [CollectionDiskCache(str(tmp_path)) for _ in range(4)]
+    threads = [threading.Thread(target=cache.get_or_load,
+                                args=('collection-1', loader))
+               for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = CollectionDiskCache(str(tmp_path), max_bytes=1 << 20)
+    blob_size = os.path.getsize(cache.put('a', ['a' * 100]).path)
+    cache.put('b', ['b' * 100])
+    # Make 'a' the most recently used
+    past = time.time() - 60
+    os.utime(cache.get('b').path, (past, past))
+    assert cache.get('a') is not None
+
+    cache.max_bytes = blob_size * 2
+    kept = cache.put('c', ['c' * 100])
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert 'c' * 100 in kept
+    assert cache.size() <= cache.max_bytes
+
+    # The blob just stored is kept even when it alone is too large
+    cache.max_bytes = 1
+    assert 'd' in cache.put('d', ['d'])
+    assert cache.get('d') is not None
+    assert cache.get('a') is None
+
+
+def test_mapped_collection_outlives_eviction(tmp_path):
+    cache = CollectionDiskCache(str(tmp_path), max_bytes=1)
+    mapped = cache.put('a', POSTAL_CODES)
+    cache.put('b', ['other'])
+
+    assert cache.get('a') is None
+    assert '00002' in mapped
+
+
+def test_put_maps_the_blob_under_the_cache_lock(tmp_path):
+    cache = CollectionDiskCache(str(tmp_path))
+    lock_path = os.path.join(str(tmp_path), 'locks', 'cache.lock')
+    held = []
+
+    def mapped(path, key=None):
+        # Eviction from another process could not run meanwhile
+        with open(lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                held.append(True)
+            else:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                held.append(False)
+        return MappedCollection(path, key)
+
+    with patch.object(dynata_rex.disk_cache, 'MappedCollection', mapped):
+        cache.put('collection-1', POSTAL_CODES)
+        # Same values, the stored blob is reused
+        cache.put('collection-2', POSTAL_CODES)
+
+    assert held == [True, True]
+    assert sorted(os.listdir(tmp_path / 'refs')) == \
+        ['collection-1.json', 'collection-2.json']
+
+
+def test_get_keeps_a_blob_evicted_once_mapped(tmp_path):
+    cache = CollectionDiskCache(str(tmp_path))
+    cache.put('collection-1', POSTAL_CODES).close()
+
+    with patch('os.utime', side_effect=FileNotFoundError):
+        collection = cache.get('collection-1')
+
+    assert '00002' in collection
+    collection.close()
+
+
+def test_max_age_downloads_again(tmp_path):
+    cache = CollectionDiskCache(str(tmp_path), max_age=60)
+    cache.put('a', ['1'])
+    assert cache.get('a') is not None
+
+    cache.max_age = 0
+    time.sleep(0.01)
+    assert cache.get('a') is None
+
+
+def test_registry_maps_cached_collections(tmp_path):
+    registry = OpportunityRegistry('key', 'secret')
+    calls = []
+
+    def iter_collection(collection_id):
+        calls.append(collection_id)
+        return iter(['90210', '10001'])
+
+    registry.iter_collection = iter_collection
+    registry.iter_invite_collection = lambda invite_id: iter(['abc'])
+    disk_cache = CollectionDiskCache(str(tmp_path))
+
+    collections = registry.collection_cache(disk_cache=disk_cache)
+    targeting = CompiledTargeting(Opportunity(**RAW), collections)
+
+    assert isinstance(collections['2169971'], MappedCollection)
+    assert targeting.qualifies({80: 30, 1: '1', 8: '90210'})
+    assert not targeting.qualifies({80: 30, 1: '1', 8: '60601'})
+    assert registry.cached_collection('2169971', disk_cache) is not None
+    assert calls == ['2169971']
+    assert 'abc' in registry.cached_invite_collection('5', disk_cache)
@@ -84,3 +84,82 @@ def test_request_timeout_in_kwargs(parent_send_adapter):
 
     assert parent_send_adapter.call_args[1]['timeout'] == \
         desired_timeout_for_request
+
+
+def test_make_session_pool_configuration():
+    session = dynata_rex.helpers.make_session(pool_connections=4,
+                                              pool_maxsize=64,
+                                              pool_block=True,
+                                              keepalive_timeout=30)
+    adapter = session.adapters['https://']
+    assert adapter._pool_connections == 4
+    assert adapter._pool_maxsize == 64
+    assert adapter._pool_block is True
+    assert adapter.keepalive_timeout == 30
+    assert adapter.poolmanager.connection_pool_kw['maxsize'] == 64
+    assert adapter.poolmanager.connection_pool_kw['block'] is True
+
+
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_request_timeout_default_from_adapter(parent_send_adapter):
+    adapter = dynata_rex.helpers.TimeoutHTTPAdapter(request_timeout=5)
+    adapter.send(requests.Request('GET', 'http://example.com'))
+    assert parent_send_adapter.call_args[1]['timeout'] == 5
+
+
+@patch.object(time, 'monotonic')
+def test_keepalive_timeout_drops_idle_pool(monotonic):
+    adapter = dynata_rex.helpers.TimeoutHTTPAdapter(keepalive_timeout=10)
+    pool = adapter.poolmanager.connection_from_url('https://example.com')
+    other = adapter.poolmanager.connection_from_url('https://example.org')
+
+    monotonic.return_value = 100
+    adapter._expire_idle_connections('https://example.com/a')
+    monotonic.return_value = 105
+    adapter._expire_idle_connections('https://example.com/b')
+    assert adapter.poolmanager.connection_from_url(
+        'https://example.com') is pool
+
+    monotonic.return_value = 200
+    adapter._expire_idle_connections('https://example.com/c')
+    assert adapter.poolmanager.connection_from_url(
+        'https://example.com') is not pool
+    assert adapter.poolmanager.connection_from_url(
+        'https://example.org') is other
+
+
+def test_shared_session_is_reused_across_clients():
+    session = dynata_rex.helpers.get_shared_session()
+    assert dynata_rex.helpers.get_shared_session() is session
+
+    registry = dynata_rex.OpportunityRegistry('key', 'secret',
+                                              session=session)
+    gateway = dynata_rex.RespondentGateway('key', 'secret',
+                                           session=session)
+    assert registry.make_request.session is session
+    assert gateway.make_request.session is session
+
+
+@patch.object(dynata_rex.helpers.os, 'getpid')
+def test_shared_session_recreated_after_fork(getpid):
+    getpid.return_value = 1
+    session = dynata_rex.helpers.get_shared_session()
+    getpid.return_value = 2
+    assert dynata_rex.helpers.get_shared_session() is not session
+
+
+def test_iter_lines_matches_split():
+    content = 'a\nbb\n\nccc\n'
+    for size in range(1, len(content) + 1):
+        chunks = [content[i:i + size].encode()
+                  for i in range(0, len(content), size)]
+        assert list(dynata_rex.helpers.iter_lines(chunks)) == \
+            content.split('\n')
+    assert list(dynata_rex.helpers.iter_lines([])) == ['']
+
+
+def test_split_shards_is_contiguous_and_balanced():
+    split_shards = dynata_rex.helpers.split_shards
+    assert split_shards([1, 2, 3, 4, 5], 2) == [[1, 2, 3], [4, 5]]
+    assert split_shards([1, 2, 3], 3) == [[1], [2], [3]]
+    assert split_shards([1], 3) == [[1], [], []]
@@ -0,0 +1,192 @@
+"""
+Package: src.tests
+Filename: test_journal.py
+Author(s): Grant W
+
+Description: Tests for the write-ahead journal
+"""
+# Python Imports
+import os
+import threading
+from unittest.mock import patch
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex.consumer import Consumer
+from dynata_rex.journal import Journal
+from dynata_rex.models import Opportunity
+
+# Local Imports
+from .shared import (ACCESS_KEY,
+                     SECRET_KEY,
+                     BASE_URL,
+                     TEST_DATA,
+                     batches_then_empty,
+                     wait_for)
+
+
+def test_pending_batches_survive_reopen(tmp_path):
+    path = str(tmp_path / 'journal')
+    with Journal(path) as journal:
+        first = journal.append([{'id': 1}, {'id': 2}])
+        second = journal.append([{'id': 3}])
+        journal.done(first)
+
+    with Journal(path) as journal:
+        assert journal.pending() == [(second, [{'id': 3}])]
+        # Numbering carries on after the replayed batches
+        assert journal.append([{'id': 4}]) > second
+        assert len(journal) == 2
+
+
+def test_sync_is_shared(tmp_path):
+    with Journal(str(tmp_path / 'journal')) as journal:
+        journal.sync()
+        assert journal.stats['syncs'] == 0
+
+        journal.append([1])
+        journal.append([2])
+        threads = [threading.Thread(target=journal.sync) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert journal.stats['syncs'] == 1
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / 'journal')
+    with Journal(path) as journal:
+        seq = journal.append(['kept'])
+        journal.append(['torn'])
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 3)
+
+    with Journal(path) as journal:
+        assert journal.pending() == [(seq, ['kept'])]
+        journal.append(['next'])
+    with Journal(path) as journal:
+        assert [batch for _, batch in journal.pending()] == \
+            [['kept'], ['next']]
+
+
+def test_corrupt_record_is_dropped(tmp_path):
+    path = str(tmp_path / 'journal')
+    with Journal(path) as journal:
+        seq = journal.append(['kept'])
+        journal.append(['corrupt'])
+    with open(path, 'r+b') as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b'xx')
+
+    with Journal(path) as journal:
+        assert journal.pending() == [(seq, ['kept'])]
+
+
+def test_compacts_past_max_bytes(tmp_path):
+    path = str(tmp_path / 'journal')
+    with Journal(path, max_bytes=200) as journal:
+        kept = journal.append(['kept'])
+        for i in range(20):
+            journal.done(journal.append(['x' * 20]))
+
+        assert journal.stats['compactions'] > 0
+        assert os.path.getsize(path) < 400
+        last = journal.append(['last'])
+
+    with Journal(path) as journal:
+        assert journal.pending() == [(kept, ['kept']), (last, ['last'])]
+
+
+def test_journal_is_locked(tmp_path):
+    path = str(tmp_path / 'journal')
+    with Journal(path):
+        with pytest.raises(dynata_rex.RexClientException):
+            Journal(path)
+
+
+def test_consumer_acks_before_handling(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    fetch = batches_then_empty([{'id': 1}, {'id': 2}])
+    acked = []
+    handled = []
+    release = threading.Event()
+
+    def handler(batch):
+        release.wait(2)
+        handled.append(batch)
+
+    consumer = Consumer(fetch, handler, acked.append, idle_delay=0.01,
+                        key=lambda item: item['id'],
+                        journal=journal).start()
+    # Acknowledged while the handler is still busy
+    wait_for(lambda: acked == [[1, 2]])
+    assert handled == []
+    assert journal.stats['syncs'] == 1
+    release.set()
+    wait_for(lambda: len(handled) == 1)
+    consumer.stop()
+
+    assert len(journal) == 0
+
+
+def test_consumer_replays_unhandled_batches(tmp_path):
+    path = str(tmp_path / 'journal')
+    fetch = batches_then_empty([{'id': 1}], [{'id': 2}])
+    acked = []
+
+    def failing(batch):
+        if batch[0]['id'] == 1:
+            raise ValueError('boom')
+
+    consumer = Consumer(fetch, failing, acked.append, idle_delay=0.01,
+                        key=lambda item: item['id'],
+                        journal=Journal(path)).start()
+    wait_for(lambda: consumer.stats['batches'] == 1)
+    consumer.stop()
+    # Both acknowledged, only the failed batch is left to replay
+    assert acked == [[1], [2]]
+
+    handled = []
+    restarted = Consumer(batches_then_empty(), handled.append, acked.append,
+                         idle_delay=0.01, key=lambda item: item['id'],
+                         journal=Journal(path)).start()
+    wait_for(lambda: handled == [[{'id': 1}]])
+    restarted.stop()
+
+    assert restarted.stats['replayed'] == 1
+    # Replayed batches were acknowledged before the restart
+    assert acked == [[1], [2]]
+    assert len(Journal(path)) == 0
+
+
+@patch.object(dynata_rex.OpportunityRegistry, 'ack_notifications')
+@patch.object(dynata_rex.OpportunityRegistry, 'receive_notifications')
+def test_registry_consume_with_journal(receive, ack, tmp_path):
+    registry = dynata_rex.OpportunityRegistry(ACCESS_KEY, SECRET_KEY,
+                                              BASE_URL)
+    opportunity = Opportunity(**TEST_DATA['test_receive_notifications'][1])
+    receive.side_effect = batches_then_empty([opportunity])
+    path = str(tmp_path / 'journal')
+
+    def failing(batch):
+        raise ValueError('boom')
+
+    consumer = registry.consume(failing, idle_delay=0.01, journal=path)
+    wait_for(lambda: consumer.stats['handler_errors'] == 1)
+    consumer.stop()
+    assert ack.call_args_list == [(([opportunity.id],),)]
+
+    # Replayed as validated models
+    receive.side_effect = batches_then_empty()
+    handled = []
+    consumer = registry.consume(handled.append, idle_delay=0.01,
+                                journal=path)
+    wait_for(lambda: handled == [[opportunity]])
+    consumer.stop()
+    assert len(ack.call_args_list) == 1
@@ -0,0 +1,325 @@
+"""
+Package: src.tests
+Filename: test_leases.py
+Author(s): Grant W
+
+Description: Tests for lease based shard assignment
+"""
+# Python Imports
+from unittest.mock import patch
+import threading
+import fcntl
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex.leases import (SqliteLeaseBackend,
+                               FileLeaseBackend,
+                               ShardCoordinator,
+                               LeasedConsumer)
+
+# Local Imports
+from .shared import ACCESS_KEY, SECRET_KEY
+
+
+@pytest.fixture(params=['sqlite', 'file'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SqliteLeaseBackend(str(tmp_path / 'leases.db'))
+    return FileLeaseBackend(str(tmp_path / 'leases'))
+
+
+def coordinator(backend, owner, events=None, shard_count=4):
+    events = events if events is not None else []
+    return ShardCoordinator(backend,
+                            shard_count,
+                            on_acquire=lambda s: events.append(('+', s)),
+                            on_release=lambda s: events.append(('-', s)),
+                            owner=owner,
+                            lease_ttl=10,
+                            heartbeat_interval=1)
+
+
+def test_backend_leases(backend):
+    assert backend.acquire(1, 'a', ttl=10)
+    assert not backend.acquire(1, 'b', ttl=10)
+    # Renewing your own lease works
+    assert backend.acquire(1, 'a', ttl=10)
+    assert backend.leases() == {1: 'a'}
+
+    backend.release(1, 'b')
+    assert backend.leases() == {1: 'a'}
+    backend.release(1, 'a')
+    assert backend.acquire(1, 'b', ttl=10)
+
+
+def test_backend_expired_lease_can_be_taken(backend):
+    with patch('time.time', return_value=1000):
+        assert backend.acquire(2, 'a', ttl=10)
+    with patch('time.time', return_value=1011):
+        assert backend.acquire(2, 'b', ttl=10)
+        assert backend.leases() == {2: 'b'}
+
+
+def test_backend_members_and_leave(backend):
+    with patch('time.time', return_value=1000):
+        backend.heartbeat('a', ttl=10)
+        backend.heartbeat('b', ttl=20)
+        backend.acquire(3, 'a', ttl=10)
+    with patch('time.time', return_value=1015):
+        assert backend.members() == ['b']
+    backend.heartbeat('a', ttl=10)
+    backend.heartbeat('b', ttl=10)
+    backend.leave('a')
+    assert backend.members() == ['b']
+    assert backend.leases() == {}
+
+
+def test_single_node_takes_every_shard(backend):
+    events = []
+    node = coordinator(backend, 'a', events)
+
+    assert node.rebalance() == {1, 2, 3, 4}
+    assert events == [('+', 1), ('+', 2), ('+', 3), ('+', 4)]
+    # Renewals do not restart consumption
+    node.rebalance()
+    assert len(events) == 4
+
+
+def test_nodes_rebalance_without_double_ownership(backend):
+    a_events, b_events = [], []
+    a = coordinator(backend, 'a', a_events)
+    b = coordinator(backend, 'b', b_events)
+
+    a.rebalance()
+    # b joins, wants 3 and 4 but a still holds them
+    assert b.rebalance() == set()
+    # a sees b and gives up 3 and 4
+    assert a.rebalance() == {1, 2}
+    assert ('-', 3) in a_events and ('-', 4) in a_events
+    assert b.rebalance() == {3, 4}
+    assert a.owned.isdisjoint(b.owned)
+    assert backend.leases() == {1: 'a', 2: 'a', 3: 'b', 4: 'b'}
+
+    # b leaves, a picks its shards back up
+    b.stop()
+    assert a.rebalance() == {1, 2, 3, 4}
+    assert b_events[-2:] == [('-', 3), ('-', 4)]
+
+
+def test_lost_lease_stops_consumption(backend):
+    events = []
+    a = coordinator(backend, 'a', events, shard_count=1)
+    with patch('time.time', return_value=1000):
+        a.rebalance()
+    with patch('time.time', return_value=1020):
+        backend.heartbeat('b', ttl=100)
+        assert backend.acquire(1, 'b', ttl=100)
+        # 'b' sorts after 'a' so shard 1 is still desired, but taken
+        a.rebalance()
+
+    assert events == [('+', 1), ('-', 1)]
+    assert a.owned == set()
+
+
+def test_failed_renewals_stop_consumption_before_leases_lapse(backend):
+    events = []
+    a = coordinator(backend, 'a', events, shard_count=2)
+    with patch('time.monotonic', return_value=100):
+        a.rebalance()
+
+    with patch.object(backend, 'heartbeat', side_effect=OSError('down')):
+        with patch('time.monotonic', return_value=105):
+            with pytest.raises(OSError):
+                a.rebalance()
+        # Leases still valid for a while, keep consuming
+        assert a.owned == {1, 2}
+        with patch('time.monotonic', return_value=109):
+            with pytest.raises(OSError):
+                a.rebalance()
+
+    # lease_ttl - heartbeat_interval passed without a renewal
+    assert a.owned == set()
+    assert events == [('+', 1), ('+', 2), ('-', 1), ('-', 2)]
+
+
+def test_slow_round_stops_consumption_before_leases_lapse(backend):
+    events = []
+    a = coordinator(backend, 'a', events, shard_count=2)
+    clock = [100]
+    with patch('time.monotonic', lambda: clock[0]):
+        a.rebalance()
+        clock[0] = 105
+        acquire = backend.acquire
+
+        def slow_acquire(*args, **kwargs):
+            # Every backend call blocks for its whole timeout
+            clock[0] += 4
+            return acquire(*args, **kwargs)
+
+        with patch.object(backend, 'acquire', slow_acquire):
+            with pytest.raises(dynata_rex.RexClientException):
+                a.rebalance()
+
+    assert a.owned == set()
+    assert events[-2:] == [('-', 1), ('-', 2)]
+
+
+def test_heartbeat_must_fit_in_ttl(backend):
+    with pytest.raises(ValueError):
+        ShardCoordinator(backend, 2, print, print, lease_ttl=5,
+                         heartbeat_interval=3)
+
+
+def test_backend_timeout_must_fit_in_heartbeat(tmp_path):
+    backend = SqliteLeaseBackend(str(tmp_path / 'leases.db'), timeout=30)
+    with pytest.raises(ValueError):
+        ShardCoordinator(backend, 2, print, print)
+
+
+def test_file_backend_times_out(tmp_path):
+    backend = FileLeaseBackend(str(tmp_path / 'leases'), timeout=0.05)
+    with open(backend.lock_path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with pytest.raises(dynata_rex.RexClientException):
+            backend.leases()
+
+
+class FakeRegistry:
+    def __init__(self, access_key, secret_key, shard_count, current_shard):
+        self.current_shard = current_shard
+
+    def consume(self, handler, **kwargs):
+        return FakeConsumer()
+
+
+class FakeConsumer:
+    stopped = False
+    joined = False
+    running = True
+
+    def stop(self, timeout=None):
+        self.stopped = True
+        self.stop_timeout = timeout
+        self.running = False
+
+    def join(self, timeout=None):
+        self.joined = True
+
+
+def test_leased_consumer_runs_a_consumer_per_shard(backend):
+    node = LeasedConsumer(backend, 2, print, ACCESS_KEY, SECRET_KEY,
+                          registry_class=FakeRegistry, owner='a',
+                          lease_ttl=10, heartbeat_interval=1)
+    node.rebalance()
+    consumers = dict(node.consumers)
+    assert set(consumers) == {1, 2}
+
+    node.stop()
+    for consumer in consumers.values():
+        # Signalled without blocking the heartbeat, then waited for
+        assert consumer.stopped and consumer.stop_timeout == 0
+        assert consumer.joined
+    assert node.consumers == {}
+    assert backend.leases() == {}
+
+
+def test_released_shard_keeps_its_lease_until_released(backend):
+    done = set()
+    a = ShardCoordinator(backend, 2, print, print,
+                         is_released=lambda shard: shard in done,
+                         owner='a', lease_ttl=10, heartbeat_interval=1)
+    b = coordinator(backend, 'b', shard_count=2)
+    a.rebalance()
+    b.rebalance()
+
+    assert a.rebalance() == {1}
+    assert b.rebalance() == set()
+    assert backend.leases() == {1: 'a', 2: 'a'}
+
+    done.add(2)
+    a.rebalance()
+    assert b.rebalance() == {2}
+
+
+class ThreadedConsumer:
+    def __init__(self, handler, shard):
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(handler, shard),
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, handler, shard):
+        while not self._stopping.is_set():
+            handler([shard])
+            self._stopping.wait(0.01)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+
+class ThreadedRegistry(FakeRegistry):
+    def consume(self, handler, **kwargs):
+        return ThreadedConsumer(handler, self.current_shard)
+
+
+def test_shard_is_never_handled_by_two_nodes(backend):
+    lock = threading.Lock()
+    handling, overlaps, handled = {}, [], set()
+    entered, hold = threading.Event(), threading.Event()
+
+    def handler_for(owner):
+        def handler(batch):
+            shard, = batch
+            with lock:
+                if handling.get(shard, owner) != owner:
+                    overlaps.append(shard)
+                handling[shard] = owner
+                handled.add((owner, shard))
+            try:
+                if owner == 'a' and shard == 2:
+                    entered.set()
+                    hold.wait(10)
+            finally:
+                with lock:
+                    del handling[shard]
+        return handler
+
+    def node(owner):
+        return LeasedConsumer(backend, 2, handler_for(owner), ACCESS_KEY,
+                              SECRET_KEY, registry_class=ThreadedRegistry,
+                              owner=owner, lease_ttl=10,
+                              heartbeat_interval=1)
+
+    a, b = node('a'), node('b')
+    a.rebalance()
+    assert entered.wait(5)
+    b.rebalance()
+
+    # a hands shard 2 back mid-batch, b cannot take it meanwhile
+    assert a.rebalance() == {1}
+    assert b.rebalance() == set()
+    assert a.rebalance() == {1}
+    assert b.rebalance() == set()
+    assert backend.leases()[2] == 'a'
+
+    hold.set()
+    a.join(5)
+    a.rebalance()
+    assert b.rebalance() == {2}
+    b.stop()
+    a.stop()
+
+    assert ('b', 2) in handled
+    assert overlaps == []
@@ -7,14 +7,21 @@ Description: Test for the base models we implement
 """
 # Python Imports
 from typing import List
+import os
+import pickle
+import subprocess
+import sys
+from unittest.mock import patch
 
 # Third Party Imports
 import pytest
 
 # Dynata Imports
 import dynata_rex
+import dynata_rex.models
 
 # Local Imports
+from .shared import TEST_DATA
 
 
 def test_base_object():
@@ -71,6 +78,73 @@ def test_hashable_model_with_submodel():
     assert len(models) == 2
 
 
+def test_opportunity_hash_is_structural_and_cached():
+    raw = TEST_DATA['test_receive_notifications'][0]
+    first = dynata_rex.models.Opportunity(**raw)
+    second = dynata_rex.models.Opportunity(**raw)
+
+    assert hash(first) == hash(second)
+    assert first == second
+    assert len({first, second}) == 1
+
+    # Hashed once, then served from the cache without touching the fields
+    with patch.object(dynata_rex.models.base, '_freeze') as freeze:
+        hash(first)
+    assert not freeze.called
+
+    # Nested models were hashed (and cached) along with their parent
+    quota = first.quotas[0][0]
+    assert quota.__dict__[dynata_rex.models.base._HASH_KEY] == hash(quota)
+
+
+def test_opportunity_hash_tracks_copies():
+    raw = TEST_DATA['test_receive_notifications'][0]
+    opportunity = dynata_rex.models.Opportunity(**raw)
+    hash(opportunity)
+
+    copied = opportunity.model_copy(update={'id': opportunity.id + 1})
+
+    assert hash(copied) != hash(opportunity)
+    assert copied != opportunity
+
+
+def test_opportunity_hash_is_not_pickled():
+    raw = TEST_DATA['test_receive_notifications'][0]
+    opportunity = dynata_rex.models.Opportunity(**raw)
+    hash(opportunity)
+    data = pickle.dumps(opportunity)
+
+    loaded = pickle.loads(data)
+    assert dynata_rex.models.base._HASH_KEY not in loaded.__dict__
+    assert hash(loaded) == hash(opportunity)
+
+    # String hashes differ between processes, the unpickled model must
+    # still hash like an equal one built there
+    script = (
+        "import pickle, sys\n"
+        "import dynata_rex.models\n"
+        "loaded = pickle.loads(sys.stdin.buffer.read())\n"
+        "fresh = dynata_rex.models.Opportunity(**loaded.model_dump("
+        "by_alias=True))\n"
+        "assert loaded == fresh and loaded in {fresh}\n"
+    )
+    seed = '2' if os.environ.get('PYTHONHASHSEED') == '1' else '1'
+    subprocess.run([sys.executable, '-c', script], input=data, check=True,
+                   env=dict(os.environ, PYTHONHASHSEED=seed))
+
+
+def test_lazy_opportunity_hash_ignores_accessed_targeting():
+    raw = TEST_DATA['test_receive_notifications'][0]
+    lazy = dynata_rex.models.LazyOpportunity(**raw)
+    other = dynata_rex.models.LazyOpportunity(**raw)
+
+    before = hash(lazy)
+    _ = lazy.cells, lazy.filters, lazy.quotas
+
+    assert hash(lazy) == before == hash(other)
+    assert lazy == other
+
+
 def test_fallback_enum():
 
     class TestEnum(dynata_rex.models.base.FallbackEnum):
@@ -12,6 +12,7 @@ import json
 # Third Party Imports
 import requests
 import pytest
+import pydantic
 
 # Dynata Imports
 import dynata_rex
@@ -104,31 +105,33 @@ def test_receive_notifications(session_post):
         assert isinstance(opportunity, dynata_rex.models.Opportunity)
 
 
-@patch.object(dynata_rex.OpportunityRegistry, "ack_notification")
+@patch.object(dynata_rex.OpportunityRegistry, "ack_notifications")
 @patch.object(requests.Session, "post")
 def test_receive_notifications_assert_ack_for_invalid_opportunity(session_post,
                                                                   ack_method):
-    """receive notifications should 'ack' a notification returned
-    that it cannot convert into an Opportunity object"""
-    data = TEST_DATA['test_receive_notifications']
-
-    # Append an invalid Opportunity
-    data.append(
-        {
-            "id": 999999,
-            "status": "CLOSED",
-            "client_id": None,
-            "length_of_interview": 10,
-            "invalid_field": "invalid_value"
-        }
-    )
+    """receive notifications should 'ack' the notifications returned
+    that it cannot convert into Opportunity objects, in one request"""
+    data = list(TEST_DATA['test_receive_notifications'])
+
+    # Append invalid Opportunities
+    for opportunity_id in (999999, 999998):
+        data.append(
+            {
+                "id": opportunity_id,
+                "status": "CLOSED",
+                "client_id": None,
+                "length_of_interview": 10,
+                "invalid_field": "invalid_value"
+            }
+        )
     session_post.return_value = ResponseMock._response_mock(
         200, content=json.dumps(data), content_type="application/json"
     )
     REGISTRY.receive_notifications()
 
-    # Make sure the ack method was called for the invalid opportunity
+    # Make sure the invalid opportunities were acked together
     assert ack_method.call_count == 1
+    assert ack_method.call_args == (([999999, 999998],),)
 
 
 @patch.object(dynata_rex.OpportunityRegistry, "ack_notifications")
@@ -162,7 +165,8 @@ def test_ack_notifications(session_post):
     REGISTRY.ack_notifications(data)
 
     assert session_post.call_count == 1
-    assert session_post.call_args[1]['data'] == json.dumps(data)
+    assert session_post.call_args[1]['data'] == \
+        REGISTRY.make_request.codec.dumps(data)
 
 
 @patch.object(requests.Session, "post")
@@ -174,9 +178,10 @@ def test_list_project_opportunities(session_post):
     )
     res = REGISTRY.list_project_opportunities(99999)
 
-    assert session_post.call_args[1]['data'] == json.dumps({
-        'project_id': 99999,
-    })
+    assert session_post.call_args[1]['data'] == \
+        REGISTRY.make_request.codec.dumps({
+            'project_id': 99999,
+        })
     assert res == data
 
 
@@ -238,3 +243,195 @@ def test_receive_invites(session_post):
 
     for invite in r:
         assert isinstance(invite, dynata_rex.models.Invite)
+
+
+@patch.object(requests.Session, "post")
+def test_iter_collection_streams_lines(session_post):
+    data = TEST_DATA['test_download_collection']
+
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=data, content_type="text/csv"
+    )
+
+    r = REGISTRY.iter_collection('1234567', chunk_size=7)
+
+    # Nothing is requested until the first line is consumed
+    assert session_post.call_count == 0
+    assert next(r) == data.split('\n')[0]
+    assert session_post.call_args[1]['stream'] is True
+    assert [data.split('\n')[0]] + list(r) == data.split('\n')
+
+
+@patch.object(requests.Session, "post")
+def test_iter_collection_does_not_read_the_body_ahead(session_post):
+    data = TEST_DATA['test_download_collection']
+    response = ResponseMock._streaming_response_mock(
+        200, content=data, content_type="text/csv"
+    )
+    session_post.return_value = response
+
+    r = REGISTRY.iter_collection('1234567', chunk_size=7)
+
+    assert next(r) == data.split('\n')[0]
+    # Only the chunks needed for the first line were read
+    assert response.raw.tell() < len(data.encode())
+    assert [data.split('\n')[0]] + list(r) == data.split('\n')
+
+
+@patch.object(requests.Session, "post")
+def test_iter_collection_raises_for_error_status(session_post):
+    session_post.return_value = ResponseMock._streaming_response_mock(
+        500, content='broken'
+    )
+
+    with pytest.raises(dynata_rex.exceptions.RexServiceException):
+        next(REGISTRY.iter_collection('1234567'))
+
+
+@patch.object(requests.Session, "post")
+def test_download_collection_to_file(session_post, tmp_path):
+    data = TEST_DATA['test_download_collection']
+
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=data, content_type="text/csv"
+    )
+    destination = tmp_path / 'collection.txt'
+
+    written = REGISTRY.download_collection_to_file('1234567',
+                                                   str(destination))
+
+    assert written == len(data.encode())
+    assert destination.read_text() == data
+    assert list(tmp_path.iterdir()) == [destination]
+
+
+@patch.object(requests.Session, "post")
+def test_download_collection_to_file_cleans_up_on_error(session_post,
+                                                        tmp_path):
+    session_post.return_value = ResponseMock._response_mock(500)
+    destination = tmp_path / 'collection.txt'
+
+    with pytest.raises(dynata_rex.exceptions.RexServiceException):
+        REGISTRY.download_collection_to_file('1234567', str(destination))
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@patch.object(requests.Session, "post")
+def test_iter_invite_collection_chunks(session_post):
+    data = TEST_DATA['test_download_invite_collection']
+
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=data, content_type="text/csv"
+    )
+
+    chunks = list(REGISTRY.iter_invite_collection_chunks('1234567',
+                                                         chunk_size=16))
+
+    assert all(len(chunk) <= 16 for chunk in chunks)
+    assert b''.join(chunks) == data.encode()
+
+
+def test_parse_opportunities_json_validates_bytes():
+    data = TEST_DATA['test_receive_notifications']
+    raw = json.dumps(data).encode()
+
+    out, invalid = REGISTRY._parse_opportunities_json(raw)
+
+    assert invalid == []
+    assert [o.id for o in out] == [o['id'] for o in data]
+    assert all(isinstance(o, dynata_rex.models.Opportunity) for o in out)
+
+
+def test_parse_opportunities_json_isolates_invalid_items():
+    data = list(TEST_DATA['test_receive_notifications'])
+    data.insert(1, {"id": 999999, "status": "CLOSED"})
+    data.append({"status": "CLOSED"})
+
+    out, invalid = REGISTRY._parse_opportunities_json(
+        json.dumps(data).encode())
+
+    assert invalid == [999999]
+    assert [o.id for o in out] == \
+        [o['id'] for o in TEST_DATA['test_receive_notifications']]
+
+
+def test_parse_opportunities_json_empty_body():
+    assert REGISTRY._parse_opportunities_json(b'') == ([], [])
+    assert REGISTRY._parse_opportunities_json(b'[]') == ([], [])
+
+
+def test_parse_opportunities_json_rejects_non_list():
+    with pytest.raises(pydantic.ValidationError):
+        REGISTRY._parse_opportunities_json(b'{"id": 1}')
+
+
+@patch.object(dynata_rex.OpportunityRegistry, "ack_invites")
+@patch.object(requests.Session, "post")
+def test_receive_invites_acks_invalid_invite(session_post, ack_method):
+    data = TEST_DATA['test_receive_invites'] + [{"id": 444}, {"id": 445}]
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=json.dumps(data), content_type="application/json"
+    )
+
+    r = REGISTRY.receive_invites()
+
+    assert len(r) == len(TEST_DATA['test_receive_invites'])
+    assert ack_method.call_count == 1
+    assert ack_method.call_args == (([444, 445],),)
+
+
+def test_cells_are_routed_by_kind():
+    data = TEST_DATA['test_receive_notifications']
+    expected = {
+        'RANGE': dynata_rex.models.RangeCell,
+        'VALUE': dynata_rex.models.ValueCell,
+        'LIST': dynata_rex.models.ListCell,
+        'COLLECTION': dynata_rex.models.CollectionCell,
+    }
+    for raw in data:
+        opportunity = dynata_rex.models.Opportunity(**raw)
+        for cell, raw_cell in zip(opportunity.cells, raw['cells']):
+            assert type(cell) is expected[raw_cell['kind']]
+
+
+def test_unknown_cell_kind_is_rejected():
+    raw = dict(TEST_DATA['test_receive_notifications'][0])
+    raw['cells'] = [dict(raw['cells'][0], kind='UNKNOWN')]
+    with pytest.raises(pydantic.ValidationError) as e:
+        dynata_rex.models.Opportunity(**raw)
+    assert e.value.errors()[0]['type'] == 'union_tag_invalid'
+
+
+@patch.object(requests.Session, "post")
+def test_receive_notifications_lazy(session_post):
+    data = TEST_DATA['test_receive_notifications']
+    session_post.return_value = ResponseMock._response_mock(
+        200, content=json.dumps(data), content_type="application/json"
+    )
+
+    r = REGISTRY.receive_notifications(lazy=True)
+
+    assert len(r) == len(data)
+    for opportunity, raw in zip(r, data):
+        assert isinstance(opportunity, dynata_rex.models.LazyOpportunity)
+        assert opportunity.id == raw['id']
+        assert isinstance(opportunity.locale, dynata_rex.models.Locale)
+        # Targeting stays raw until accessed
+        assert 'cells' not in opportunity.__dict__
+        assert opportunity.raw_cells == raw['cells']
+        cells = opportunity.cells
+        assert opportunity.cells is cells
+        assert opportunity.to_opportunity() == \
+            dynata_rex.models.Opportunity(**raw)
+
+
+def test_lazy_opportunity_defers_targeting_errors():
+    raw = dict(TEST_DATA['test_receive_notifications'][0])
+    raw['cells'] = [{"kind": "RANGE"}]
+
+    opportunity = dynata_rex.models.LazyOpportunity(**raw)
+
+    assert opportunity.id == raw['id']
+    with pytest.raises(pydantic.ValidationError):
+        _ = opportunity.cells
@@ -166,3 +166,49 @@ def test_post_returns_content_from_non_json(fun):
 
     r = REQUESTER.post('https://not-a-real-url-abcdefg.com', data='{}')
     assert isinstance(r, str)
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+@patch.object(Signer, "create_expiration_date")
+def test_retries_are_resigned(expiration, adapter_send, wait_method):
+    """Every attempt should carry a fresh expiration and signature"""
+    expiration.side_effect = ["2000-01-01T00:00:0%d.000Z" % i
+                              for i in range(10)]
+    sent = []
+
+    def _send(request, **kwargs):
+        sent.append(dict(request.headers))
+        if len(sent) < 3:
+            raise requests.exceptions.ConnectionError()
+        return ResponseMock._response_mock(200, content='{}')
+
+    adapter_send.side_effect = _send
+    requester = RexRequest(ACCESS_KEY, SECRET_KEY)
+    requester.post('https://not-a-real-url-abcdefg.com', data={"a": 1})
+
+    assert len(sent) == 3
+    assert len({h['dynata-expiration'] for h in sent}) == 3
+    assert len({h['dynata-signature'] for h in sent}) == 3
+    body_hash = Signer(ACCESS_KEY, SECRET_KEY) \
+        ._create_request_body_signing_string(
+            requester.codec.dumps({"a": 1}))
+    for headers in sent:
+        assert headers['dynata-signing-string'] == body_hash
+        assert headers['dynata-access-key'] == ACCESS_KEY
+        assert headers['Content-type'] == 'application/json'
+
+
+def test_ttl_for_deadline():
+    requester = RexRequest(ACCESS_KEY, SECRET_KEY, default_ttl=10)
+    assert requester._ttl_for_deadline(None) == 10
+    assert requester._ttl_for_deadline(60) == 10
+    assert requester._ttl_for_deadline(3.2) == 4
+    assert requester._ttl_for_deadline(-1) == 1
+
+
+@patch.object(Signer, "create_expiration_date")
+def test_create_auth_headers_with_ttl(fun):
+    fun.return_value = TEST_DATE_STR
+    REQUESTER._create_auth_headers(ttl=3)
+    assert fun.call_args[0][0] == 3
@@ -0,0 +1,206 @@
+"""
+Package: src.tests
+Filename: test_retry.py
+Author(s): Grant W
+
+Description: Tests for the retry policies
+"""
+# Python Imports
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import time
+
+# Third Party Imports
+import requests
+import pytest
+
+# Dynata Imports
+import dynata_rex
+from dynata_rex.retry import (RetryBudget,
+                              RetryClass,
+                              RetryPolicy,
+                              parse_retry_after)
+
+# Local Imports
+from .shared import ResponseMock
+
+
+def test_decorrelated_jitter_stays_within_class_bounds():
+    retry_class = RetryClass('test', base_delay=1, max_delay=5)
+    policy = RetryPolicy(max_attempts=50,
+                         budget=RetryBudget(min_tokens=100))
+    state = policy.start()
+    previous = retry_class.base_delay
+    for _ in range(40):
+        delay = state.next_delay(retry_class)
+        assert retry_class.base_delay <= delay <= retry_class.max_delay
+        assert delay <= previous * 3
+        previous = delay
+
+
+def test_next_delay_stops_at_max_attempts():
+    policy = RetryPolicy(max_attempts=3)
+    state = policy.start()
+    retry_class = RetryClass('test', base_delay=0, max_delay=0)
+    assert state.next_delay(retry_class) is not None
+    assert state.next_delay(retry_class) is not None
+    assert state.next_delay(retry_class) is None
+    assert state.attempt == 3
+
+
+def test_next_delay_respects_class_max_attempts():
+    policy = RetryPolicy(max_attempts=10)
+    state = policy.start()
+    retry_class = RetryClass('test', base_delay=0, max_delay=0,
+                             max_attempts=2)
+    assert state.next_delay(retry_class) is not None
+    assert state.next_delay(retry_class) is None
+
+
+def test_next_delay_not_retryable():
+    state = RetryPolicy().start()
+    assert state.next_delay(None) is None
+
+
+def test_next_delay_respects_retry_after():
+    state = RetryPolicy().start()
+    retry_class = RetryClass('test', base_delay=0, max_delay=10)
+    assert state.next_delay(retry_class, retry_after=7) == 7
+
+
+def test_next_delay_gives_up_on_long_retry_after():
+    retry_class = RetryClass('test', base_delay=0, max_delay=60)
+    assert RetryPolicy().start().next_delay(retry_class,
+                                            retry_after=3600) is None
+    state = RetryPolicy(deadline=20).start()
+    assert state.next_delay(retry_class, retry_after=30) is None
+
+
+def test_next_delay_gives_up_past_deadline():
+    policy = RetryPolicy(max_attempts=10, deadline=5)
+    state = policy.start()
+    retry_class = RetryClass('test', base_delay=10, max_delay=10)
+    assert state.next_delay(retry_class) is None
+
+
+@patch.object(time, 'monotonic')
+def test_attempt_timeout_shrinks_to_deadline(monotonic):
+    monotonic.return_value = 100
+    state = RetryPolicy(deadline=30).start()
+    monotonic.return_value = 110
+    assert state.attempt_timeout(60) == 20
+    assert state.attempt_timeout(5) == 5
+    assert RetryPolicy().start().attempt_timeout(60) == 60
+
+
+def test_retry_budget_caps_retry_share():
+    budget = RetryBudget(ratio=0.1, min_tokens=0, max_tokens=100)
+    policy = RetryPolicy(max_attempts=2, budget=budget)
+    retry_class = RetryClass('test', base_delay=0, max_delay=0)
+
+    retries = 0
+    for _ in range(100):
+        state = policy.start()
+        if state.next_delay(retry_class) is not None:
+            retries += 1
+    assert retries <= 10
+
+
+def test_retry_budget_max_tokens():
+    budget = RetryBudget(ratio=1, min_tokens=0, max_tokens=3)
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 3
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('') is None
+    assert parse_retry_after('12') == 12
+    assert parse_retry_after('not-a-date') is None
+    assert parse_retry_after('inf') is None
+    assert parse_retry_after('1e400') is None
+    assert parse_retry_after('nan') is None
+    future = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(future, usegmt=True)) <= 30
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_adapter_retries_retryable_status(adapter_send, wait_method):
+    adapter_send.side_effect = [ResponseMock._response_mock(503),
+                                ResponseMock._response_mock(429),
+                                ResponseMock._response_mock(200)]
+    session = dynata_rex.helpers.make_session()
+    res = session.get('https://example.com')
+    assert res.status_code == 200
+    assert adapter_send.call_count == 3
+    assert wait_method.call_count == 2
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_adapter_returns_last_response_when_exhausted(adapter_send,
+                                                      wait_method):
+    adapter_send.return_value = ResponseMock._response_mock(503)
+    session = dynata_rex.helpers.make_session()
+    res = session.get('https://example.com')
+    assert res.status_code == 503
+    assert adapter_send.call_count == dynata_rex.helpers.DEFAULT_RETRIES
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_adapter_does_not_retry_client_errors(adapter_send, wait_method):
+    adapter_send.return_value = ResponseMock._response_mock(400)
+    session = dynata_rex.helpers.make_session()
+    assert session.get('https://example.com').status_code == 400
+    assert adapter_send.call_count == 1
+    assert wait_method.call_count == 0
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_adapter_retries_timeouts_when_enabled(adapter_send, wait_method):
+    adapter_send.side_effect = [requests.exceptions.ReadTimeout(),
+                                ResponseMock._response_mock(200)]
+    policy = RetryPolicy(timeout_class=dynata_rex.retry.TIMEOUT)
+    session = dynata_rex.helpers.make_session(retry_policy=policy)
+    assert session.get('https://example.com').status_code == 200
+    assert wait_method.call_count == 1
+
+
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_adapter_disabled_policy(adapter_send):
+    adapter_send.side_effect = requests.exceptions.ConnectionError()
+    session = dynata_rex.helpers.make_session(
+        retry_policy=RetryPolicy.disabled())
+    with pytest.raises(dynata_rex.exceptions.RexServiceException):
+        session.get('https://example.com')
+    assert adapter_send.call_count == 1
+
+
+def test_rex_request_retry_policy():
+    policy = RetryPolicy(max_attempts=5)
+    requester = dynata_rex.signer.RexRequest('key', 'secret',
+                                             retry_policy=policy)
+    assert requester.session.adapters['https://'].retry_policy is policy
+    assert requester.session.adapters['https://'].maximum_retries == 5
+
+
+@patch.object(dynata_rex.helpers.TimeoutHTTPAdapter, '_wait')
+@patch.object(requests.adapters.HTTPAdapter, 'send')
+def test_adapter_returns_response_with_long_retry_after(adapter_send,
+                                                        wait_method):
+    for retry_after in ('3600', '1e400'):
+        throttled = ResponseMock._response_mock(429)
+        throttled.headers['Retry-After'] = retry_after
+        adapter_send.side_effect = [throttled,
+                                    ResponseMock._response_mock(200)]
+        session = dynata_rex.helpers.make_session()
+        res = session.get('https://example.com')
+        assert res.status_code == (429 if retry_after == '3600' else 200)
+    # Only the unparseable header was retried, after the usual backoff
+    assert wait_method.call_count == 1
+    assert wait_method.call_args[0][1] <= 60
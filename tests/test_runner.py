@@ -0,0 +1,103 @@
+"""
+Package: src.tests
+Filename: test_runner.py
+Author(s): Grant W
+
+Description: Tests for the multi-process shard runner
+"""
+# Python Imports
+import os
+import threading
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex.runner import ShardRunner
+
+# Local Imports
+from .shared import ACCESS_KEY, SECRET_KEY, wait_for
+
+
+class FakeConsumer:
+    def __init__(self, shard):
+        self.stats = {'items': 0, 'batches': 0, 'limit': 10}
+        self.shard = shard
+        self.running = True
+        self._stopping = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while not self._stopping.wait(0.01):
+            self.stats['items'] += 2
+            self.stats['batches'] += 1
+
+    def stop(self):
+        self._stopping.set()
+
+
+class FakeRegistry:
+    """Registry stand-in; crashes the first worker for shard 1 when a
+    crash marker path is given"""
+
+    def __init__(self, access_key, secret_key, shard_count, current_shard,
+                 crash_marker=None):
+        self.current_shard = current_shard
+        self.crash_marker = crash_marker
+
+    def consume(self, handler, **kwargs):
+        if self.crash_marker and self.current_shard == 1 and \
+                not os.path.exists(self.crash_marker):
+            open(self.crash_marker, 'w').close()
+            os._exit(3)
+        return FakeConsumer(self.current_shard)
+
+
+def handler(batch):
+    pass
+
+
+def test_shards_must_be_in_range():
+    with pytest.raises(ValueError):
+        ShardRunner(handler, ACCESS_KEY, SECRET_KEY, shard_count=2,
+                    shards=[3])
+
+
+def test_defaults_to_every_shard():
+    runner = ShardRunner(handler, ACCESS_KEY, SECRET_KEY, shard_count=4,
+                         processes=2)
+    assert runner.assignments == [[1, 2], [3, 4]]
+
+
+def test_runner_consumes_every_shard_and_aggregates():
+    runner = ShardRunner(handler, ACCESS_KEY, SECRET_KEY, shard_count=3,
+                         processes=2, stats_interval=0.05,
+                         registry_class=FakeRegistry)
+    with runner:
+        wait_for(lambda: len(runner.stats()['shards']) == 3, timeout=10.0)
+        assert runner.stats()['workers'] == 2
+
+    stats = runner.stats()
+    assert set(stats['shards']) == {1, 2, 3}
+    assert stats['total']['items'] == \
+        sum(s['items'] for s in stats['shards'].values())
+    assert 'limit' not in stats['total']
+    assert stats['items_per_second'] > 0
+    assert stats['workers'] == 0
+
+
+def test_runner_restarts_crashed_worker(tmp_path):
+    marker = str(tmp_path / 'crashed')
+    runner = ShardRunner(handler, ACCESS_KEY, SECRET_KEY, shard_count=2,
+                         processes=2, stats_interval=0.05,
+                         restart_delay=0,
+                         registry_kwargs={'crash_marker': marker},
+                         registry_class=FakeRegistry)
+    with runner:
+        def restarted():
+            runner.check()
+            return runner.restarts == 1 and 1 in runner.stats()['shards']
+        wait_for(restarted, timeout=10.0)
+
+    assert os.path.exists(marker)
+    assert runner.stats()['shards'][1]['items'] > 0
@@ -0,0 +1,103 @@
+"""
+Package: src.tests
+Filename: test_snapshot.py
+Author(s): Grant W
+
+Description: Tests for opportunity snapshots
+"""
+# Python Imports
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex.disk_cache import CollectionDiskCache
+from dynata_rex.models import LazyOpportunity, Opportunity
+from dynata_rex.snapshot import load_snapshot, save_snapshot
+from dynata_rex.store import OpportunityStore
+
+# Local Imports
+from .shared import TEST_DATA
+
+NOTIFICATIONS = TEST_DATA['test_receive_notifications']
+
+
+def test_round_trip_restores_the_store(tmp_path):
+    path = str(tmp_path / 'opportunities.snap')
+    store = OpportunityStore(Opportunity(**raw) for raw in NOTIFICATIONS)
+
+    assert save_snapshot(store, path, metadata={'shard': 2}) == 3
+    snapshot = load_snapshot(path)
+
+    assert snapshot.metadata == {'shard': 2}
+    assert snapshot.collections == {'2169971': None}
+    assert snapshot.created > 0
+    assert sorted(snapshot.opportunities, key=lambda o: o.id) == \
+        sorted(store, key=lambda o: o.id)
+    assert {hash(o) for o in snapshot.opportunities} == \
+        {hash(o) for o in store}
+
+    restored = snapshot.to_store()
+    assert len(restored) == 3
+    assert restored.ids(project_id=1589419) == {13174, 12872, 13231}
+
+
+def test_restored_store_resumes_notifications(tmp_path):
+    path = str(tmp_path / 'opportunities.snap')
+    save_snapshot([Opportunity(**raw) for raw in NOTIFICATIONS], path)
+    store = load_snapshot(path).to_store()
+
+    closed = dict(NOTIFICATIONS[1], status='CLOSED')
+    store.apply_all([Opportunity(**closed)])
+
+    assert NOTIFICATIONS[1]['id'] not in store
+    assert len(store) == 2
+
+
+def test_lazy_snapshot(tmp_path):
+    path = str(tmp_path / 'opportunities.snap')
+    save_snapshot([LazyOpportunity(**raw) for raw in NOTIFICATIONS], path)
+
+    snapshot = load_snapshot(path, lazy=True)
+
+    assert all(isinstance(o, LazyOpportunity)
+               for o in snapshot.opportunities)
+    assert [o.to_opportunity() for o in snapshot.opportunities] == \
+        [Opportunity(**raw) for raw in NOTIFICATIONS]
+
+
+def test_records_cached_collection_digests(tmp_path):
+    disk_cache = CollectionDiskCache(str(tmp_path / 'cache'))
+    collection = disk_cache.put('collection-2169971', ['90210'])
+    path = str(tmp_path / 'opportunities.snap')
+
+    save_snapshot([Opportunity(**NOTIFICATIONS[1])], path,
+                  disk_cache=disk_cache)
+
+    digest = load_snapshot(path).collections['2169971']
+    assert digest == disk_cache.digest('collection-2169971')
+    assert collection.path.endswith(digest + '.rexc')
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / 'opportunities.snap')
+    assert save_snapshot([], path) == 0
+    assert load_snapshot(path).opportunities == []
+
+
+@pytest.mark.parametrize('content', [b'', b'nope', b'REXS' + b'\0' * 20])
+def test_rejects_invalid_files(tmp_path, content):
+    path = tmp_path / 'opportunities.snap'
+    path.write_bytes(content)
+
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
+
+
+def test_save_replaces_atomically(tmp_path):
+    path = str(tmp_path / 'opportunities.snap')
+    save_snapshot([Opportunity(**NOTIFICATIONS[1])], path)
+    save_snapshot([], path)
+
+    assert load_snapshot(path).opportunities == []
+    assert [p.name for p in tmp_path.iterdir()] == ['opportunities.snap']
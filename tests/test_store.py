@@ -0,0 +1,142 @@
+"""
+Package: src.tests
+Filename: test_store.py
+Author(s): Grant W
+
+Description: Tests for the indexed opportunity store
+"""
+# Python Imports
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex.models import Opportunity, DevicesEnum
+from dynata_rex.store import OpportunityStore, Range
+
+# Local Imports
+from .shared import TEST_DATA, opportunity
+
+
+def test_apply_skips_closed_and_indexes_open():
+    store = OpportunityStore(
+        Opportunity(**raw) for raw in TEST_DATA['test_receive_notifications'])
+
+    assert len(store) == 3
+    assert 12871 not in store
+    assert store.ids(group_id=112411272) == {13174}
+    assert store.ids(project_id=1589419) == {13174, 12872, 13231}
+    assert store.ids(status='OPEN', country='US', language='en') == \
+        {13174, 12872, 13231}
+
+
+def test_upsert_moves_index_entries():
+    store = OpportunityStore([opportunity()])
+
+    store.apply(opportunity(status='PAUSED', group_id=1,
+                            locale={'country': 'GB', 'language': 'en'}))
+
+    assert len(store) == 1
+    assert store.ids(group_id=112411272) == set()
+    assert store.ids(group_id=1) == {13174}
+    assert store.ids(status='OPEN') == set()
+    assert store.ids(country='GB') == {13174}
+    # Emptied buckets are dropped
+    assert 112411272 not in store._indexes['group_id']
+
+
+def test_closed_notification_evicts():
+    store = OpportunityStore([opportunity()])
+
+    assert store.apply(opportunity(status='CLOSED')) is False
+
+    assert len(store) == 0
+    assert all(not index for index in store._indexes.values())
+
+
+def test_find_with_alternatives_and_enums():
+    store = OpportunityStore([
+        opportunity(id=1, devices=['mobile']),
+        opportunity(id=2, devices=['desktop']),
+        opportunity(id=3, devices=['tablet'], category_ids=[550]),
+    ])
+
+    assert store.ids(devices=['mobile', 'tablet']) == {1, 3}
+    assert store.ids(devices=DevicesEnum.DESKTOP) == {2}
+    assert store.ids(category_ids=550, devices='tablet') == {3}
+    assert [o.id for o in store.find(devices='mobile')] == [1]
+    assert store.ids() == {1, 2, 3}
+
+
+def test_unknown_index():
+    with pytest.raises(ValueError):
+        OpportunityStore().ids(cost_per_interview=1)
+
+
+def economics_store():
+    return OpportunityStore([
+        opportunity(id=1, cost_per_interview=1.0, length_of_interview=10,
+                    incidence_rate=50),
+        opportunity(id=2, cost_per_interview=2.0, length_of_interview=20,
+                    incidence_rate=90),
+        opportunity(id=3, cost_per_interview=3.0, length_of_interview=5,
+                    incidence_rate=20),
+        opportunity(id=4, cost_per_interview=2.5, length_of_interview=12,
+                    incidence_rate=80,
+                    locale={'country': 'GB', 'language': 'en'}),
+    ])
+
+
+def test_range_criteria():
+    store = economics_store()
+
+    assert store.ids(cost_per_interview=Range(min=2)) == {2, 3, 4}
+    assert store.ids(cost_per_interview=Range(min=2, max=2.5)) == {2, 4}
+    assert store.ids(length_of_interview=Range(max=12),
+                     incidence_rate=Range(min=50)) == {1, 4}
+    assert store.ids(country='US',
+                     cost_per_interview=Range(min=2)) == {2, 3}
+    assert store.ids(cost_per_interview=Range(min=10)) == set()
+
+
+def test_query_orders_by_expected_earnings():
+    store = economics_store()
+
+    top = store.query(order_by='expected_earnings', limit=2)
+    assert [o.id for o in top] == [4, 2]
+
+    us = store.query(order_by='expected_earnings', country='US')
+    assert [o.id for o in us] == [2, 3, 1]
+
+    cheapest = store.query(order_by='cost_per_interview', descending=False,
+                           limit=1, length_of_interview=Range(max=12))
+    assert [o.id for o in cheapest] == [1]
+
+
+def test_query_walks_index_for_broad_criteria():
+    store = OpportunityStore(
+        opportunity(id=i, cost_per_interview=i / 100) for i in range(1, 201))
+
+    top = store.query(order_by='cost_per_interview', limit=3, status='OPEN',
+                      cost_per_interview=Range(max=1.5))
+
+    assert [o.id for o in top] == [150, 149, 148]
+
+
+def test_sorted_indexes_follow_updates():
+    store = economics_store()
+
+    store.apply(opportunity(id=2, cost_per_interview=0.5))
+    store.apply(opportunity(id=3, status='CLOSED'))
+
+    assert store.ids(cost_per_interview=Range(min=2)) == {4}
+    assert [o.id for o in store.query(order_by='cost_per_interview')] == \
+        [4, 1, 2]
+    assert all(len(index) == 3 for index in store._sorted.values())
+
+
+def test_unknown_range_index():
+    with pytest.raises(ValueError):
+        OpportunityStore().ids(group_id=Range(min=1))
+    with pytest.raises(ValueError):
+        OpportunityStore().query(order_by='group_id')
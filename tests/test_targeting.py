@@ -0,0 +1,132 @@
+"""
+Package: src.tests
+Filename: test_targeting.py
+Author(s): Grant W
+
+Description: Tests for the targeting evaluator
+"""
+# Python Imports
+
+# Third Party Imports
+import pytest
+
+# Dynata Imports
+from dynata_rex.models import Opportunity, LazyOpportunity
+from dynata_rex.targeting import CompiledTargeting, compile_cell
+
+# Local Imports
+from .shared import TEST_DATA, cell, opportunity
+
+RAW = TEST_DATA['test_receive_notifications'][1]
+AGE, GENDER, POSTAL_CODE = 80, 1, 8
+COLLECTIONS = {'2169971': {'90210', '10001'}}
+
+
+def test_sample_opportunity():
+    targeting = CompiledTargeting(Opportunity(**RAW), COLLECTIONS)
+
+    assert targeting.qualifies({AGE: 30, GENDER: '1', POSTAL_CODE: '90210'})
+    assert not targeting.qualifies({AGE: 17, GENDER: '1',
+                                    POSTAL_CODE: '90210'})
+    assert not targeting.qualifies({AGE: 30, GENDER: '2',
+                                    POSTAL_CODE: '90210'})
+    assert not targeting.qualifies({AGE: 30, GENDER: 1,
+                                    POSTAL_CODE: '60601'})
+    # Missing answer
+    assert not targeting.qualifies({AGE: 30, GENDER: 1})
+
+    result = targeting.evaluate({AGE: 99, GENDER: 1, POSTAL_CODE: 10001})
+    assert result.qualified
+    assert [[q.id for q in group] for group in result.quotas] == \
+        [[RAW['quotas'][0][0]['id']]]
+
+
+def test_lazy_opportunity_compiles_the_same():
+    lazy = CompiledTargeting(LazyOpportunity(**RAW), COLLECTIONS)
+    assert lazy.qualifies({AGE: 30, GENDER: '1', POSTAL_CODE: '90210'})
+
+
+def test_filter_groups_and_and_filters_or():
+    targeted = opportunity(
+        cells=[cell('male', GENDER, 'VALUE', value='1'),
+               cell('female', GENDER, 'VALUE', value='2'),
+               cell('adult', AGE, 'RANGE', range={'from': 18, 'to': None}),
+               cell('regions', 3, 'LIST', list=['1', '2'])],
+        filters=[[['male', 'adult'], ['female']], [['regions']]])
+    targeting = CompiledTargeting(targeted)
+
+    assert targeting.qualifies({GENDER: '1', AGE: 40, 3: '2'})
+    assert not targeting.qualifies({GENDER: '1', AGE: 12, 3: '2'})
+    assert targeting.qualifies({GENDER: '2', AGE: 12, 3: '1'})
+    assert not targeting.qualifies({GENDER: '2', AGE: 40, 3: '3'})
+    # Multi-select answers match on any value
+    assert targeting.qualifies({GENDER: '2', 3: ['7', '1']})
+
+
+def test_negated_cells():
+    targeted = opportunity(
+        cells=[cell('not-texas', 3, 'LIST', negate=True, list=['44'])],
+        filters=[[['not-texas']]])
+    targeting = CompiledTargeting(targeted)
+
+    assert targeting.qualifies({3: '12'})
+    assert not targeting.qualifies({3: '44'})
+    assert not targeting.qualifies({})
+
+
+def test_quotas():
+    targeted = opportunity(
+        cells=[cell('male', GENDER, 'VALUE', value='1'),
+               cell('female', GENDER, 'VALUE', value='2'),
+               cell('young', AGE, 'RANGE', range={'from': 18, 'to': 34}),
+               cell('old', AGE, 'RANGE', range={'from': 35, 'to': 99})],
+        filters=[],
+        quotas=[[{'id': 'm', 'cells': ['male'], 'count': 5,
+                  'status': 'OPEN'},
+                 {'id': 'f', 'cells': ['female'], 'count': 0,
+                  'status': 'CLOSED'}],
+                [{'id': 'y', 'cells': ['young'], 'count': 5,
+                  'status': 'OPEN'},
+                 {'id': 'o', 'cells': ['old'], 'count': 5,
+                  'status': 'OPEN'}]])
+    targeting = CompiledTargeting(targeted)
+
+    result = targeting.evaluate({GENDER: '1', AGE: 20})
+    assert result.qualified
+    assert [[q.id for q in group] for group in result.quotas] == \
+        [['m'], ['y']]
+
+    # Only fits a closed quota
+    result = targeting.evaluate({GENDER: '2', AGE: 40})
+    assert not result.qualified
+    assert [[q.id for q in group] for group in result.quotas] == \
+        [['f'], ['o']]
+    assert not targeting.qualifies({GENDER: '2', AGE: 40})
+
+    # Fits no quota of the second group
+    assert not targeting.qualifies({GENDER: '1', AGE: 12})
+
+
+def test_cells_are_evaluated_once_per_profile():
+    targeted = opportunity(
+        cells=[cell('male', GENDER, 'VALUE', value='1')],
+        filters=[[['male']], [['male']]],
+        quotas=[[{'id': 'm', 'cells': ['male'], 'count': 1,
+                  'status': 'OPEN'}]])
+    targeting = CompiledTargeting(targeted)
+    calls = []
+    predicate = targeting.cells['male']
+    targeting.cells['male'] = lambda p: calls.append(p) or predicate(p)
+
+    assert targeting.evaluate({GENDER: '1'}).qualified
+    assert len(calls) == 1
+
+
+def test_compile_errors():
+    collection = Opportunity(**RAW).cells[2]
+    with pytest.raises(ValueError):
+        compile_cell(collection)
+
+    targeted = opportunity(cells=[], filters=[[['missing']]])
+    with pytest.raises(ValueError):
+        CompiledTargeting(targeted)